@@ -0,0 +1,91 @@
+"""
+bench_async.py
+
+Summarises ANALYSES files at once with mp4analyser.aio, as a service would, while a ticker on the event loop measures
+how late it is woken, i.e. how long the loop is blocked. The files are a mix of MP4 and Matroska files written by
+synthetic.py. Checks the summaries against those of the synchronous API, and times cancelling a second round of
+analyses. The parses hold the GIL while they run, so the more of them at once, the later the loop is woken, which is
+what max_concurrency bounds.
+
+Run from the repository root:
+python benchmarks/bench_async.py
+
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import mp4analyser
+from mp4analyser import aio
+import synthetic
+
+ANALYSES = 200
+FILES = 20
+TICK_SECONDS = 0.01
+
+
+def write_files(tmp_dir):
+    filenames = []
+    for i in range(FILES):
+        if i % 4 == 3:
+            filename = os.path.join(tmp_dir, f'{i}.mkv')
+            synthetic.write_mkv(filename, clusters=5, blocks_per_cluster=200 * i, seed=i)
+        elif i % 2:
+            filename = os.path.join(tmp_dir, f'{i}.mp4')
+            synthetic.write_fragmented_mp4(filename, fragments=20 * i, seed=i)
+        else:
+            filename = os.path.join(tmp_dir, f'{i}.mp4')
+            synthetic.write_progressive_mp4(filename, samples=2000 * (i + 1), samples_per_chunk=10, seed=i)
+        filenames.append(filename)
+    return filenames
+
+
+async def ticker(lags):
+    """ appends to lags how much later than TICK_SECONDS it is woken each time, until cancelled """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(time.perf_counter() - start - TICK_SECONDS)
+
+
+async def analyse(filenames, max_concurrency):
+    lags = []
+    ticking = asyncio.ensure_future(ticker(lags))
+    async with aio.AsyncAnalyser(max_concurrency) as analyser:
+        start = time.perf_counter()
+        summaries = await asyncio.gather(*(analyser.get_summary(filenames[i % len(filenames)])
+                                           for i in range(ANALYSES)))
+        seconds = time.perf_counter() - start
+        # cancel a second round of analyses soon after it starts
+        tasks = [asyncio.ensure_future(analyser.get_summary(filenames[i % len(filenames)])) for i in range(ANALYSES)]
+        await asyncio.sleep(TICK_SECONDS)
+        start = time.perf_counter()
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        cancel_seconds = time.perf_counter() - start
+    ticking.cancel()
+    cancelled = sum(isinstance(result, asyncio.CancelledError) for result in results)
+    return summaries, seconds, cancelled, cancel_seconds, max(lags)
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = write_files(tmp_dir)
+        expected = [mp4analyser.open_file(filename).get_summary() for filename in filenames]
+        print(f'{ANALYSES} concurrent summaries of {FILES} files')
+        for max_concurrency in (1, aio.DEFAULT_MAX_CONCURRENCY, 32):
+            summaries, seconds, cancelled, cancel_seconds, max_lag = asyncio.run(analyse(filenames, max_concurrency))
+            assert summaries == [expected[i % len(filenames)] for i in range(ANALYSES)]
+            print(f'  max_concurrency {max_concurrency:3d}: {seconds:7.3f} s, longest event loop lag '
+                  f'{max_lag * 1000:6.1f} ms, {cancelled} of {ANALYSES} cancelled in {cancel_seconds * 1000:.1f} ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
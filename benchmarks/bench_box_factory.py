@@ -0,0 +1,50 @@
+"""
+bench_box_factory.py
+
+Times finding the class of a box from its type, as box_factory() does for every box parsed, with the registry of
+box classes against the globals() lookup it replaced: normalising the type into a class name and looking that up in
+iso.py and then non_iso.py. The box types are those of a fragmented file, in the proportions of one, along with
+some that have no class.
+
+Run from the repository root:
+python benchmarks/bench_box_factory.py
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import mp4analyser.iso
+import mp4analyser.non_iso
+from mp4analyser.registry import get_box_class
+
+# per fragment: moof, mfhd, two trafs each with tfhd, tfdt, trun, saiz, saio, senc and an unknown box, and mdat
+BOX_TYPES = ['moof', 'mfhd'] + ['traf', 'tfhd', 'tfdt', 'trun', 'saiz', 'saio', 'senc', 'xtra'] * 2 + ['mdat']
+LOOKUPS = 200000
+REQUIRED_SPEEDUP = 2
+
+
+def globals_lookup(box_type):
+    """ the lookup box_factory() and box_factory_non_iso() used to do """
+    class_name = box_type.replace(" ", "_").replace("-", "_").lower().capitalize() + 'Box'
+    box_class = vars(mp4analyser.iso).get(class_name)
+    if box_class is None:
+        box_class = vars(mp4analyser.non_iso).get(class_name, mp4analyser.non_iso.UndefinedBox)
+    return box_class
+
+
+def main():
+    box_types = (BOX_TYPES * (LOOKUPS // len(BOX_TYPES) + 1))[:LOOKUPS]
+    assert all(globals_lookup(box_type) is get_box_class(box_type) for box_type in BOX_TYPES)
+    before = min(timeit.repeat(lambda: [globals_lookup(box_type) for box_type in box_types], number=1, repeat=5))
+    after = min(timeit.repeat(lambda: [get_box_class(box_type) for box_type in box_types], number=1, repeat=5))
+    speedup = before / after
+    print(f'finding the class of {LOOKUPS} boxes of a fragmented file')
+    print(f'  globals() lookup: {before * 1e9 / LOOKUPS:7.1f} ns per box')
+    print(f'  registry:         {after * 1e9 / LOOKUPS:7.1f} ns per box  ({speedup:.1f}x)')
+    return 0 if speedup >= REQUIRED_SPEEDUP else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+bench_memory.py
+
+Measures with tracemalloc the memory held by a parsed file, per box of a large DASH style fragmented MP4 file and
+per element of a large Matroska file, most of whose elements are SimpleBlocks. Each file is parsed in a fresh
+interpreter, from the src directory of this repository, and also from that of another checkout if one is given,
+so that the memory taken before and after a change can be compared e.g.
+
+git worktree add /tmp/before HEAD~1
+python benchmarks/bench_memory.py --before /tmp/before/src
+
+Run from the repository root:
+python benchmarks/bench_memory.py
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import synthetic
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+FRAGMENTS = 5000
+SIMPLE_BLOCKS = 200000
+BLOCKS_PER_CLUSTER = 1000
+
+# run in a fresh interpreter, prints the bytes held by the parsed file and how many boxes or elements it has
+WORKER = '''
+import sys, tracemalloc
+filename = sys.argv[1]
+if filename.endswith('.mkv'):
+    import mkvanalyser.mkv
+    parse = mkvanalyser.mkv.MkvFile
+else:
+    import mp4analyser.iso
+    parse = mp4analyser.iso.Mp4File
+
+
+def count(node):
+    return 1 + sum(count(child) for child in node.children)
+
+
+tracemalloc.start()
+parsed = parse(filename)
+held = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+print(held, sum(count(child) for child in parsed.children))
+'''
+
+
+def measure(src_dir, filename):
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    held, nodes = subprocess.run([sys.executable, '-c', WORKER, filename], env=env, capture_output=True, text=True,
+                                 check=True).stdout.split()
+    return int(held), int(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory held per box or element of a parsed file.')
+    parser.add_argument('--before', metavar='SRC_DIR', help='src directory of a checkout to compare with')
+    args = parser.parse_args()
+    trees = [('before', args.before), ('after', SRC_DIR)] if args.before else [('', SRC_DIR)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dash = os.path.join(tmp_dir, 'dash.mp4')
+        synthetic.write_fragmented_mp4(dash, FRAGMENTS)
+        mkv = os.path.join(tmp_dir, 'blocks.mkv')
+        synthetic.write_mkv(mkv, SIMPLE_BLOCKS // BLOCKS_PER_CLUSTER, BLOCKS_PER_CLUSTER)
+        for description, filename, node, plural in (
+                (f'DASH file of {FRAGMENTS} fragments', dash, 'box', 'boxes'),
+                (f'Matroska file of {SIMPLE_BLOCKS} SimpleBlocks', mkv, 'element', 'elements')):
+            print(description)
+            for name, src_dir in trees:
+                held, nodes = measure(src_dir, filename)
+                print(f'  {name:6s} {held / 1e6:8.1f} MB held by {nodes} {plural}, {held / nodes:6.0f} bytes per {node}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+bench_seek.py
+
+Checks and times Mp4File.find_sample_at_time() on tracks whose ctts presents samples out of decode order, as
+B-frames are. The sample and sync sample found at each time are checked against those found by expanding the
+composition time of every sample, and the lookups are timed. Fails if any lookup finds the wrong sample.
+
+Run from the repository root:
+python benchmarks/bench_seek.py
+
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from mp4analyser.iso import Mp4File
+import synthetic
+
+SAMPLES = 100000
+LOOKUPS = 10000
+# decode order I P B B, presented as I B B P
+GOP_OFFSETS = [(1, 1000), (1, 3000), (2, 0)]
+TRACKS = {'first sample presented late': [(1, 2000), (1, 0), (SAMPLES - 2, 1000)],
+          'I P B B': GOP_OFFSETS * (SAMPLES // 4),
+          'in order': None}
+
+
+def expected_samples(samples, media_time):
+    """ the numbers of the sample presented at media_time, and of its sync sample, by a scan of all the samples """
+    presented = [sample for sample in samples if sample['composition_time'] <= media_time]
+    if not presented:
+        return None, None
+    sample = max(presented, key=lambda sample: (sample['composition_time'], sample['sample_number']))
+    sync_samples = [s for s in presented if s['is_sync'] and s['sample_number'] <= sample['sample_number']]
+    return sample['sample_number'], sync_samples[-1]['sample_number'] if sync_samples else None
+
+
+def main():
+    failures = 0
+    print(f'find_sample_at_time() on tracks of {SAMPLES} samples')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, composition_offsets in TRACKS.items():
+            filename = os.path.join(tmp_dir, 'seek.mp4')
+            synthetic.write_progressive_mp4(filename, samples=SAMPLES, samples_per_chunk=10,
+                                            composition_offsets=composition_offsets)
+            mp4file = Mp4File(filename)
+            samples = [mp4file.get_sample(1, sample_number) for sample_number in range(1, SAMPLES + 1)]
+            duration = SAMPLES * synthetic.SAMPLE_DURATION / synthetic.TIMESCALE
+            checked_seconds = [0, 0.01, 0.29, 0.5, 1.0, 1.5, 2.0, duration / 2, duration - 0.01, duration + 1]
+            for seconds in checked_seconds:
+                found = mp4file.find_sample_at_time(1, seconds)
+                found = tuple(found[key]['sample_number'] if found[key] else None for key in ('sample', 'sync_sample'))
+                expected = expected_samples(samples, round(seconds * synthetic.TIMESCALE, 6) // 1)
+                if found != expected:
+                    failures += 1
+                    print(f'  {name}: at {seconds} s found samples {found}, expected {expected}')
+            start = time.perf_counter()
+            for i in range(LOOKUPS):
+                mp4file.find_sample_at_time(1, duration * i / LOOKUPS)
+            seconds = time.perf_counter() - start
+            print(f'  {name:28s} {seconds / LOOKUPS * 1e6:8.1f} us a lookup')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
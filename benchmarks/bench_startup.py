@@ -0,0 +1,73 @@
+"""
+bench_startup.py
+
+Times what a short-lived worker process pays before it has a result: a cold import of mp4analyser plus opening
+and summarising one small MP4 file, measured in a fresh interpreter each time. Fails if that takes longer than
+BUDGET_MS, or if modules that a small MP4 file doesn't need (tkinter, NumPy, the Matroska tables, the parse cache,
+multiprocessing) were imported along the way. The time to run the command-line tool on the file is shown too.
+
+Run from the repository root:
+python benchmarks/bench_startup.py
+
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+BUDGET_MS = 50
+REPEAT = 7
+UNNEEDED_MODULES = ('tkinter', 'numpy', 'mkvanalyser.idlookups', 'mp4analyser.cache', 'multiprocessing')
+
+# run in a fresh interpreter, prints the milliseconds taken and the unneeded modules that were imported
+WORKER = f'''
+import time
+start = time.perf_counter()
+import mp4analyser
+mp4analyser.open_file({{filename!r}}).get_summary()
+elapsed = time.perf_counter() - start
+import sys
+print(elapsed * 1000, *[name for name in {UNNEEDED_MODULES!r} if name in sys.modules])
+'''
+
+
+def run(args):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    # as installed, the modules are compiled to bytecode once and not on every start
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return subprocess.run([sys.executable] + args, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'small.mp4')
+        synthetic.write_small_mp4(filename)
+        worker = WORKER.format(filename=filename)
+        # the first run writes the bytecode of the modules, later runs are cold starts
+        run(['-c', worker])
+        results = [run(['-c', worker]).split() for i in range(REPEAT)]
+        import_and_parse = min(float(result[0]) for result in results)
+        unneeded = sorted(set(name for result in results for name in result[1:]))
+        timings = {}
+        for name, args in (('bare interpreter', ['-c', 'pass']),
+                           ('python -m mp4analyser', ['-m', 'mp4analyser', '--jobs', '1', filename])):
+            times = []
+            for i in range(REPEAT):
+                start = time.perf_counter()
+                run(args)
+                times.append(time.perf_counter() - start)
+            timings[name] = min(times)
+    print(f'import mp4analyser, open and summarise a small MP4: {import_and_parse:7.2f} ms  (budget {BUDGET_MS} ms)')
+    for name, seconds in timings.items():
+        print(f'  {name + " process":40s} {seconds * 1000:7.2f} ms')
+    if unneeded:
+        print(f'  unneeded modules imported: {", ".join(unneeded)}')
+    return 0 if import_and_parse <= BUDGET_MS and not unneeded else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
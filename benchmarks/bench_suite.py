@@ -0,0 +1,170 @@
+"""
+bench_suite.py
+
+Times the parsing of large synthetic files, written by synthetic.py:
+  progressive  an MP4 of 1,000,000 samples, so stsz and stco of 1,000,000 entries
+  fragmented   a DASH style fragmented MP4 of 50,000 moofs
+  largesize    a sparse MP4 of about 6 GB, whose mdat has a largesize and whose chunk offsets are in a co64
+  mkv          a Matroska file of 10 clusters of 20,000 SimpleBlocks each, with Cues
+Each file is parsed in a fresh interpreter, which times opening it with Mp4File or MkvFile and get_summary() and,
+for an MP4 file, opening it with summary_only=True and summarising it, and the sample map i.e. generating the samples
+of a lazily parsed file and indexing them, and reports the peak resident memory of the process. The fastest of
+--repeat runs is kept.
+
+The results are saved as JSON, along with the commit they were taken at, so that runs at two commits can be compared
+e.g.
+python benchmarks/bench_suite.py --data-dir /tmp/bench-data -o before.json
+git checkout <another commit>
+python benchmarks/bench_suite.py --data-dir /tmp/bench-data -o after.json --compare before.json
+
+Run from the repository root:
+python benchmarks/bench_suite.py
+
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import synthetic
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC_DIR = os.path.join(REPO_DIR, 'src')
+
+# name: (file name, generator, parameters at a scale of 1)
+CASES = {
+    'progressive': ('progressive.mp4', synthetic.write_progressive_mp4, {'samples': 1000000}),
+    'fragmented': ('fragmented.mp4', synthetic.write_fragmented_mp4, {'fragments': 50000}),
+    'largesize': ('largesize.mp4', synthetic.write_sparse_largesize_mp4, {'samples': 100000}),
+    'mkv': ('blocks.mkv', synthetic.write_mkv, {'clusters': 10, 'blocks_per_cluster': 20000, 'cue_interval': 10}),
+}
+# parameters that are not scaled
+FIXED_PARAMETERS = ('clusters', 'cue_interval')
+
+# run in a fresh interpreter, prints the seconds taken by each stage and the peak resident memory as JSON
+WORKER = '''
+import json, resource, sys, time
+filename = sys.argv[1]
+seconds = {}
+start = time.perf_counter()
+if filename.endswith('.mkv'):
+    from mkvanalyser.mkv import MkvFile
+    parsed = MkvFile(filename)
+else:
+    from mp4analyser.iso import Mp4File
+    parsed = Mp4File(filename)
+seconds['open'] = time.perf_counter() - start
+start = time.perf_counter()
+parsed.get_summary()
+seconds['summary'] = time.perf_counter() - start
+if not filename.endswith('.mkv'):
+    del parsed
+    start = time.perf_counter()
+    Mp4File(filename, summary_only=True).get_summary()
+    seconds['summary_only'] = time.perf_counter() - start
+    parsed = Mp4File(filename, lazy=True)
+    start = time.perf_counter()
+    parsed.get_sample_index()
+    parsed.get_fragment_index()
+    seconds['sample_map'] = time.perf_counter() - start
+peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# in KiB on Linux, bytes on macOS
+peak_rss_mb = peak_rss / (1e6 if sys.platform == 'darwin' else 1e3)
+print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak_rss_mb}))
+'''
+
+
+def scaled_parameters(parameters, scale):
+    return {name: value if name in FIXED_PARAMETERS else max(1, round(value * scale))
+            for name, value in parameters.items()}
+
+
+def prepare(data_dir, name, scale):
+    """ writes the file of a case, unless a file written with the same parameters is in data_dir already """
+    file_name, generator, parameters = CASES[name]
+    parameters = scaled_parameters(parameters, scale)
+    root, extension = os.path.splitext(file_name)
+    filename = os.path.join(data_dir, f'{root}-{"-".join(str(value) for value in parameters.values())}{extension}')
+    if not os.path.exists(filename):
+        generator(filename + '.part', **parameters)
+        os.replace(filename + '.part', filename)
+    return filename, parameters
+
+
+def measure(filename, repeat):
+    """ the fastest time of each stage, and the highest peak memory, over repeat runs of the worker """
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    runs = [json.loads(subprocess.run([sys.executable, '-c', WORKER, filename], env=env, capture_output=True,
+                                      text=True, check=True).stdout) for i in range(repeat)]
+    return {'seconds': {stage: min(run['seconds'][stage] for run in runs) for stage in runs[0]['seconds']},
+            'peak_rss_mb': max(run['peak_rss_mb'] for run in runs)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    for name, case in results['cases'].items():
+        print(f'{name}: {case["file_bytes"] / 1e6:.1f} MB, {case["disk_bytes"] / 1e6:.1f} MB on disk')
+        old_case = baseline['cases'].get(name) if baseline else None
+        rows = [(f'{stage} (s)', seconds, old_case and old_case['seconds'].get(stage))
+                for stage, seconds in case['seconds'].items()]
+        rows.append(('peak memory (MB)', case['peak_rss_mb'], old_case and old_case['peak_rss_mb']))
+        for label, value, old_value in rows:
+            line = f'  {label:18s} {value:10.3f}'
+            if old_value:
+                line += f'  was {old_value:10.3f}  ({value / old_value:.2f}x)'
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times parsing large synthetic MP4 and Matroska files.')
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help=f'cases to run, from {", ".join(CASES)} (default all)')
+    parser.add_argument('-o', '--output', help='file to save the results to as JSON')
+    parser.add_argument('--compare', metavar='JSON', help='results of an earlier run to compare with')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each case (default 3)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='scales the number of samples, fragments and blocks per cluster of the files e.g. 0.1 '
+                             'for a quick run (default 1)')
+    parser.add_argument('--data-dir', help='directory to keep the files in, to be reused by later runs '
+                                           '(default a temporary directory)')
+    args = parser.parse_args()
+    unknown_cases = [name for name in args.cases if name not in CASES]
+    if unknown_cases:
+        parser.error(f'unknown case {unknown_cases[0]}, choose from {", ".join(CASES)}')
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    results = {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'platform': platform.platform(), 'scale': args.scale,
+               'repeat': args.repeat, 'cases': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for name in args.cases or CASES:
+            filename, parameters = prepare(data_dir, name, args.scale)
+            stat = os.stat(filename)
+            results['cases'][name] = dict(parameters=parameters, file_bytes=stat.st_size,
+                                          disk_bytes=getattr(stat, 'st_blocks', 0) * 512,
+                                          **measure(filename, args.repeat))
+    print(f'commit {results["commit"]}' + (f', compared with {baseline["commit"]}' if baseline else ''))
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
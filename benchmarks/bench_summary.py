@@ -0,0 +1,60 @@
+"""
+bench_summary.py
+
+Measures how many files a minute can be summarised, as an ingestion probe does, opening each with summary_only=True
+against opening it as Mp4File does by default. The files are a mix of progressive files of up to 200,000 samples
+and fragmented files of up to 2,000 fragments, written by synthetic.py. Fails if fewer than REQUIRED_FILES_PER_MINUTE
+files a minute are summarised with summary_only=True.
+
+Run from the repository root:
+python benchmarks/bench_summary.py
+
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from mp4analyser.iso import Mp4File
+import synthetic
+
+FILES = 40
+REQUIRED_FILES_PER_MINUTE = 1000
+
+
+def write_files(tmp_dir):
+    filenames = []
+    for i in range(FILES):
+        filename = os.path.join(tmp_dir, f'{i}.mp4')
+        if i % 2:
+            synthetic.write_fragmented_mp4(filename, fragments=50 * i, seed=i)
+        else:
+            synthetic.write_progressive_mp4(filename, samples=5000 * (i + 1), samples_per_chunk=10, seed=i)
+        filenames.append(filename)
+    return filenames
+
+
+def files_per_minute(filenames, **kwargs):
+    start = time.perf_counter()
+    summaries = [Mp4File(filename, **kwargs).get_summary() for filename in filenames]
+    return len(filenames) * 60 / (time.perf_counter() - start), summaries
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = write_files(tmp_dir)
+        full_rate, full_summaries = files_per_minute(filenames)
+        summary_only_rate, summaries = files_per_minute(filenames, summary_only=True)
+    assert summaries == full_summaries
+    print(f'summarising {FILES} files of up to 200,000 samples or 2,000 fragments')
+    print(f'  Mp4File(filename):                    {full_rate:8.0f} files per minute')
+    print(f'  Mp4File(filename, summary_only=True): {summary_only_rate:8.0f} files per minute  '
+          f'({summary_only_rate / full_rate:.1f}x)')
+    return 0 if summary_only_rate >= REQUIRED_FILES_PER_MINUTE else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+bench_tracks.py
+
+Times opening a file of many tracks, written by synthetic.py, with Mp4File(filename) against
+Mp4File(filename, workers=...), which parses the sample tables of the tracks and indexes their samples in parallel,
+in worker processes, and in worker threads. The files opened all ways are checked to have the same sample index.
+Mp4File(filename, workers=N) starts no more processes than there are cores, so on a single core it parses the tables
+itself, and a ProcessPoolExecutor of its own is timed as well, to show what the processes cost there.
+
+Run from the repository root:
+python benchmarks/bench_tracks.py [TRACKS [SAMPLES]]
+
+"""
+import concurrent.futures
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from mp4analyser.iso import Mp4File
+import synthetic
+
+TRACKS = 32
+SAMPLES = 50000
+REPEAT = 5
+
+
+def open_file(filename, **kwargs):
+    """ returns the least seconds taken to open filename in REPEAT tries, and the sample index of the file as lists """
+    times = []
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        mp4file = Mp4File(filename, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times), {track_ID: (list(track.offset), list(track.size))
+                     for track_ID, track in mp4file.get_sample_index().items()}
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else TRACKS
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else SAMPLES
+    workers = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'tracks.mp4')
+        synthetic.write_multitrack_mp4(filename, tracks, samples)
+        seconds, index = open_file(filename)
+        process_seconds, process_index = open_file(filename, workers=workers)
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            pool_seconds, pool_index = open_file(filename, workers=executor)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            thread_seconds, thread_index = open_file(filename, workers=executor)
+    assert index == process_index == pool_index == thread_index
+    print(f'opening a file of {tracks} tracks of {samples} samples, on {workers} cores')
+    for label, label_seconds in (('Mp4File(filename)', seconds),
+                                 (f'Mp4File(filename, workers={workers})', process_seconds),
+                                 ('Mp4File(filename, workers=ProcessPoolExecutor())', pool_seconds),
+                                 ('Mp4File(filename, workers=ThreadPoolExecutor())', thread_seconds)):
+        print(f'  {label:49s} {label_seconds:8.3f} s  ({seconds / label_seconds:.1f}x)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+synthetic.py
+
+Writes the synthetic MP4 and Matroska files that the benchmarks parse. The files are reproducible, as the sizes of
+samples and blocks come from a random.Random seeded with the seed given, so the same arguments write the same file.
+Media data is never written, the generators seek past it, so it reads back as zeros and, on file systems with sparse
+files, takes no space on disk. That is what lets a file of many gigabytes be written in moments.
+
+Used by the other benchmarks, or on its own to write a file to look at e.g.
+python benchmarks/synthetic.py progressive /tmp/progressive.mp4
+
+"""
+import array
+import random
+import struct
+import sys
+
+MATRIX = struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+# the timescale of the video tracks written, and the duration of a sample in it i.e. 30 frames per second
+TIMESCALE = 30000
+SAMPLE_DURATION = 1000
+
+
+def box(box_type, payload=b''):
+    return struct.pack('>I', 8 + len(payload)) + box_type.encode('ascii') + payload
+
+
+def full_box(box_type, payload=b'', version=0, flags=0):
+    return box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def box_header(box_type, payload_size, largesize=False):
+    """ the header of a box of payload_size bytes, with a largesize if asked for or if the size needs one """
+    if largesize or payload_size + 8 > 0xFFFFFFFF:
+        return struct.pack('>I', 1) + box_type.encode('ascii') + struct.pack('>Q', payload_size + 16)
+    return struct.pack('>I', payload_size + 8) + box_type.encode('ascii')
+
+
+def big_endian(typecode, values):
+    """ the values as a table of big-endian integers of array typecode, "I" for 32 bit or "Q" for 64 bit """
+    table = array.array(typecode, values)
+    if sys.byteorder == 'little':
+        table.byteswap()
+    return table.tobytes()
+
+
+def skip(f, num_bytes):
+    """ moves past num_bytes of media data without writing them """
+    f.seek(num_bytes, 1)
+
+
+def end_file(f):
+    """ sets the size of the file to the current position, in case the file ends with media data not written """
+    f.truncate(f.tell())
+
+
+def random_sizes(count, mean_size, seed):
+    """ count sizes from mean_size / 2 to 3 * mean_size / 2 """
+    rnd = random.Random(seed)
+    return [rnd.randint(mean_size // 2, mean_size * 3 // 2) for i in range(count)]
+
+
+def ftyp(major_brand='isom', compatible_brands='isomiso2avc1mp41'):
+    return box('ftyp', major_brand.encode('ascii') + struct.pack('>I', 512) + compatible_brands.encode('ascii'))
+
+
+def video_trak(sample_tables, samples, width=320, height=240, track_ID=1):
+    """ the trak of an H.264 video track, with the sample tables (stts, stsc etc.) given """
+    avcc = box('avcC', bytes([1, 100, 0, 31, 0xff, 0xe1, 0, 4, 0x67, 0x64, 0, 0x1f, 1, 0, 2, 0x68, 0xee]))
+    avc1 = box('avc1', bytes(6) + struct.pack('>H', 1) + bytes(16) + struct.pack('>HHII', width, height, 0x480000,
+               0x480000) + bytes(4) + struct.pack('>HB', 1, 0) + bytes(31) + struct.pack('>Hh', 0x18, -1) + avcc)
+    duration = samples * SAMPLE_DURATION
+    stbl = box('stbl', full_box('stsd', struct.pack('>I', 1) + avc1) + sample_tables)
+    minf = box('minf', full_box('vmhd', bytes(8), flags=1) +
+               box('dinf', full_box('dref', struct.pack('>I', 1) + full_box('url ', flags=1))) + stbl)
+    mdia = box('mdia', full_box('mdhd', struct.pack('>IIIIHH', 0, 0, TIMESCALE, duration, 0x55c4, 0)) +
+               full_box('hdlr', bytes(4) + b'vide' + bytes(12) + b'video\0') + minf)
+    tkhd = full_box('tkhd', struct.pack('>IIIII', 0, 0, track_ID, 0, duration * 1000 // TIMESCALE) + bytes(16) +
+                    MATRIX + struct.pack('>II', width << 16, height << 16), flags=3)
+    return box('trak', tkhd + mdia)
+
+
+def moov(trak, samples, mvex=b'', next_track_ID=2):
+    mvhd = full_box('mvhd', struct.pack('>IIIIIH', 0, 0, 1000, samples * SAMPLE_DURATION * 1000 // TIMESCALE,
+                                        0x10000, 0x100) + bytes(10) + MATRIX + bytes(24) +
+                    struct.pack('>I', next_track_ID))
+    return box('moov', mvhd + trak + mvex)
+
+
+def write_progressive_mp4(filename, samples, sample_size=1000, samples_per_chunk=1, largesize=False, seed=0,
+                          composition_offsets=None):
+    """
+    writes a one track video file of samples samples, of random sizes averaging sample_size bytes, in chunks of
+    samples_per_chunk samples, all in one mdat that follows the moov. Every 30th sample is a sync sample.
+    If largesize is True, or the mdat needs it, the mdat has a largesize and the chunk offsets are in a co64.
+    composition_offsets, if given, is the (sample_count, sample_offset) entries of a ctts.
+    """
+    sizes = random_sizes(samples, sample_size, seed)
+    chunk_sizes = [sum(sizes[i:i + samples_per_chunk]) for i in range(0, samples, samples_per_chunk)]
+    payload_size = sum(sizes)
+    largesize = largesize or payload_size + 8 > 0xFFFFFFFF
+    stsc = [(1, samples_per_chunk, 1)]
+    if samples % samples_per_chunk:
+        stsc.append((len(chunk_sizes), samples % samples_per_chunk, 1))
+    sync_samples = range(1, samples + 1, 30)
+
+    def build_moov(first_chunk_offset):
+        chunk_offsets = []
+        chunk_offset = first_chunk_offset
+        for chunk_size in chunk_sizes:
+            chunk_offsets.append(chunk_offset)
+            chunk_offset += chunk_size
+        if largesize:
+            chunk_offset_box = full_box('co64', struct.pack('>I', len(chunk_offsets)) + big_endian('Q', chunk_offsets))
+        else:
+            chunk_offset_box = full_box('stco', struct.pack('>I', len(chunk_offsets)) + big_endian('I', chunk_offsets))
+        sample_tables = (full_box('stts', struct.pack('>III', 1, samples, SAMPLE_DURATION)) +
+                         full_box('stss', struct.pack('>I', len(sync_samples)) + big_endian('I', sync_samples)) +
+                         (full_box('ctts', struct.pack('>I', len(composition_offsets)) +
+                                   b''.join(struct.pack('>II', *entry) for entry in composition_offsets))
+                          if composition_offsets else b'') +
+                         full_box('stsc', struct.pack('>I', len(stsc)) + b''.join(struct.pack('>III', *entry)
+                                                                                  for entry in stsc)) +
+                         full_box('stsz', struct.pack('>II', 0, samples) + big_endian('I', sizes)) +
+                         chunk_offset_box)
+        return moov(video_trak(sample_tables, samples), samples)
+
+    start = ftyp()
+    mdat_header = box_header('mdat', payload_size, largesize)
+    # the moov is the same size whatever the offsets in it
+    first_chunk_offset = len(start) + len(build_moov(0)) + len(mdat_header)
+    with open(filename, 'wb') as f:
+        f.write(start + build_moov(first_chunk_offset) + mdat_header)
+        skip(f, payload_size)
+        end_file(f)
+
+
+def write_multitrack_mp4(filename, tracks, samples, sample_size=1000, samples_per_chunk=10, seed=0):
+    """
+    writes a file of tracks video tracks of samples samples each, of random sizes averaging sample_size bytes, with
+    chunks of samples_per_chunk samples of each track in turn, all in one mdat that follows the moov. Every sample is
+    described in an sdtp as well as the stsz, and every 30th is a sync sample.
+    """
+    track_sizes = [random_sizes(samples, sample_size, seed + track) for track in range(tracks)]
+    chunks = range(0, samples, samples_per_chunk)
+    stsc = [(1, samples_per_chunk, 1)]
+    if samples % samples_per_chunk:
+        stsc.append((len(chunks), samples % samples_per_chunk, 1))
+    sync_samples = range(1, samples + 1, 30)
+    payload_size = sum(sum(sizes) for sizes in track_sizes)
+    largesize = payload_size + 8 > 0xFFFFFFFF
+
+    def build_moov(first_chunk_offset):
+        track_offsets = [[] for track in range(tracks)]
+        chunk_offset = first_chunk_offset
+        for first in chunks:
+            for sizes, chunk_offsets in zip(track_sizes, track_offsets):
+                chunk_offsets.append(chunk_offset)
+                chunk_offset += sum(sizes[first:first + samples_per_chunk])
+        traks = b''
+        for track, (sizes, chunk_offsets) in enumerate(zip(track_sizes, track_offsets)):
+            if largesize:
+                chunk_offset_box = full_box('co64', struct.pack('>I', len(chunk_offsets)) +
+                                            big_endian('Q', chunk_offsets))
+            else:
+                chunk_offset_box = full_box('stco', struct.pack('>I', len(chunk_offsets)) +
+                                            big_endian('I', chunk_offsets))
+            sample_tables = (full_box('stts', struct.pack('>III', 1, samples, SAMPLE_DURATION)) +
+                             full_box('stss', struct.pack('>I', len(sync_samples)) + big_endian('I', sync_samples)) +
+                             full_box('stsc', struct.pack('>I', len(stsc)) + b''.join(struct.pack('>III', *entry)
+                                                                                      for entry in stsc)) +
+                             full_box('stsz', struct.pack('>II', 0, samples) + big_endian('I', sizes)) +
+                             chunk_offset_box +
+                             full_box('sdtp', bytes([0x20 if i % 30 else 0x10 for i in range(samples)])))
+            traks += video_trak(sample_tables, samples, track_ID=track + 1)
+        return moov(traks, samples, next_track_ID=tracks + 1)
+
+    start = ftyp()
+    mdat_header = box_header('mdat', payload_size, largesize)
+    first_chunk_offset = len(start) + len(build_moov(0)) + len(mdat_header)
+    with open(filename, 'wb') as f:
+        f.write(start + build_moov(first_chunk_offset) + mdat_header)
+        skip(f, payload_size)
+        end_file(f)
+
+
+def write_fragmented_mp4(filename, fragments, samples_per_fragment=10, sample_size=100, seed=0):
+    """
+    writes a one track, DASH style fragmented video file of fragments media segments, each a moof and an mdat of
+    samples_per_fragment samples of random sizes averaging sample_size bytes
+    """
+    sizes = random_sizes(fragments * samples_per_fragment, sample_size, seed)
+    empty_tables = (full_box('stts', bytes(4)) + full_box('stsc', bytes(4)) + full_box('stsz', bytes(8)) +
+                    full_box('stco', bytes(4)))
+    mvex = box('mvex', full_box('trex', struct.pack('>IIIII', 1, 1, SAMPLE_DURATION, 0, 0)))
+    with open(filename, 'wb') as f:
+        f.write(ftyp('iso6', 'iso6dash') + moov(video_trak(empty_tables, 0), 0, mvex))
+        for fragment in range(fragments):
+            fragment_sizes = sizes[fragment * samples_per_fragment:(fragment + 1) * samples_per_fragment]
+            decode_time = fragment * samples_per_fragment * SAMPLE_DURATION
+
+            def moof(data_offset):
+                # data_offset, default_base_is_moof and sample sizes
+                trun = full_box('trun', struct.pack('>Ii', samples_per_fragment, data_offset) +
+                                big_endian('I', fragment_sizes), flags=0x000201)
+                return box('moof', full_box('mfhd', struct.pack('>I', fragment + 1)) +
+                           box('traf', full_box('tfhd', struct.pack('>I', 1), flags=0x020000) +
+                               full_box('tfdt', struct.pack('>I', decode_time)) + trun))
+
+            payload_size = sum(fragment_sizes)
+            mdat_header = box_header('mdat', payload_size)
+            f.write(moof(len(moof(0)) + len(mdat_header)) + mdat_header)
+            skip(f, payload_size)
+        end_file(f)
+
+
+def write_small_mp4(filename, samples=30):
+    """ writes a one second, one track video file of samples samples in one chunk """
+    write_progressive_mp4(filename, samples, samples_per_chunk=samples)
+
+
+def write_sparse_largesize_mp4(filename, samples=100000, sample_size=60000):
+    """ writes a progressive file whose mdat, of about samples * sample_size bytes, has a largesize """
+    write_progressive_mp4(filename, samples, sample_size, samples_per_chunk=10, largesize=True)
+
+
+def vint(value, length=None):
+    """ value as an EBML variable size integer, of the fewest bytes that hold it if length isn't given """
+    if length is None:
+        # all 1s is reserved, it means an unknown size
+        length = next(length for length in range(1, 9) if value < (1 << (7 * length)) - 1)
+    return ((1 << (7 * length)) | value).to_bytes(length, 'big')
+
+
+def element(element_id, payload):
+    """ an EBML element, with its id given as its bytes in the file """
+    return element_id + vint(len(payload)) + payload
+
+
+def uint_element(element_id, value):
+    return element(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big'))
+
+
+def write_mkv(filename, clusters, blocks_per_cluster, block_size=1000, cue_interval=None, seed=0):
+    """
+    writes a one track Matroska file of clusters clusters of blocks_per_cluster SimpleBlocks, of random sizes averaging
+    block_size bytes, one a millisecond. If cue_interval is given, Cues after the clusters have a CuePoint for every
+    cue_interval-th block.
+    """
+    assert blocks_per_cluster <= 0x8000, 'the timestamps of blocks are 16 bit offsets from that of their cluster'
+    frame_sizes = random_sizes(clusters * blocks_per_cluster, block_size, seed)
+    header = element(b'\x1a\x45\xdf\xa3', element(b'\x42\x82', b'matroska'))
+    info = element(b'\x15\x49\xa9\x66', uint_element(b'\x2a\xd7\xb1', 1000000))
+    tracks = element(b'\x16\x54\xae\x6b', element(b'\xae', uint_element(b'\xd7', 1) + uint_element(b'\x83', 1) +
+                                                  element(b'\x86', b'V_MPEG4/ISO/AVC')))
+    # work out the size and position of everything first, as the size of the Segment comes before them
+    cluster_layouts = []
+    # positions are from the start of the Segment's data
+    clusters_end = len(info) + len(tracks)
+    for cluster in range(clusters):
+        timestamp = uint_element(b'\xe7', cluster * blocks_per_cluster)
+        block_positions = []
+        block_headers = []
+        position = len(timestamp)
+        for block in range(blocks_per_cluster):
+            frame_size = frame_sizes[cluster * blocks_per_cluster + block]
+            # track number 1, timestamp, flags: keyframe if the first of its cluster, no lacing
+            block_header = b'\xa3' + vint(4 + frame_size) + b'\x81' + struct.pack('>hB', block,
+                                                                                  0x80 if block == 0 else 0)
+            block_positions.append(position)
+            block_headers.append(block_header)
+            position += len(block_header) + frame_size
+        cluster_layouts.append((clusters_end, timestamp, block_positions, block_headers, position))
+        clusters_end += 4 + len(vint(position)) + position
+    cues = b''
+    if cue_interval:
+        cue_points = []
+        for cluster, (cluster_position, timestamp, block_positions, block_headers, size) in enumerate(cluster_layouts):
+            for block in range(0, blocks_per_cluster, cue_interval):
+                positions = element(b'\xb7', uint_element(b'\xf7', 1) + uint_element(b'\xf1', cluster_position) +
+                                    uint_element(b'\xf0', block_positions[block]))
+                cue_points.append(element(b'\xbb', uint_element(b'\xb3', cluster * blocks_per_cluster + block) +
+                                          positions))
+        cues = element(b'\x1c\x53\xbb\x6b', b''.join(cue_points))
+    with open(filename, 'wb') as f:
+        f.write(header + b'\x18\x53\x80\x67' + vint(clusters_end + len(cues)) + info + tracks)
+        for cluster, (position, timestamp, block_positions, block_headers, size) in enumerate(cluster_layouts):
+            f.write(b'\x1f\x43\xb6\x75' + vint(size) + timestamp)
+            for block, block_header in enumerate(block_headers):
+                f.write(block_header)
+                skip(f, frame_sizes[cluster * blocks_per_cluster + block])
+        f.write(cues)
+        end_file(f)
+
+
+GENERATORS = {
+    'small': write_small_mp4,
+    'progressive': lambda filename: write_progressive_mp4(filename, 1000000),
+    'multitrack': lambda filename: write_multitrack_mp4(filename, 32, 100000),
+    'fragmented': lambda filename: write_fragmented_mp4(filename, 50000),
+    'largesize': write_sparse_largesize_mp4,
+    'mkv': lambda filename: write_mkv(filename, 10, 20000, cue_interval=10),
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in GENERATORS:
+        sys.exit(f'usage: python {sys.argv[0]} {"|".join(GENERATORS)} FILENAME')
+    GENERATORS[sys.argv[1]](sys.argv[2])
@@ -9,7 +9,20 @@ import struct
 import logging
 import binascii
 
-from mkvanalyser.idlookups import id_table
+from mp4analyser.profiling import ParseProfile, ProfiledFile
+from mp4analyser.source import CancellableFile, ProgressFile
+
+# the table of Matroska elements in idlookups is large, so it is only imported when a file is first parsed
+id_table = None
+
+
+def load_id_table():
+    """ imports idlookups.id_table, if it hasn't been already, and returns it """
+    global id_table
+    if id_table is None:
+        from mkvanalyser.idlookups import id_table as table
+        id_table = table
+    return id_table
 
 
 class DataLengthError(Exception):
@@ -28,23 +41,27 @@ def element_factory(fp, elementid_tuple, parent):
     else:
         element_type = id_table[elementid]['type']
     if element_type == 'binary':
-        return BinaryElement(fp, elementid_tuple, parent)
-    if element_type == 'master':
-        return MasterElement(fp, elementid_tuple, parent)
-    if element_type == 'utf-8':
-        return Utf_8Element(fp, elementid_tuple, parent)
-    if element_type == 'string':
-        return StringElement(fp, elementid_tuple, parent)
-    if element_type == 'uinteger':
-        return UintegerElement(fp, elementid_tuple, parent)
-    if element_type == 'integer':
-        return IntegerElement(fp, elementid_tuple, parent)
-    if element_type == 'date':
-        return DateElement(fp, elementid_tuple, parent)
-    if element_type == 'float':
-        return FloatElement(fp, elementid_tuple, parent)
+        element_class = BinaryElement
+    elif element_type == 'master':
+        element_class = MasterElement
+    elif element_type == 'utf-8':
+        element_class = Utf_8Element
+    elif element_type == 'string':
+        element_class = StringElement
+    elif element_type == 'uinteger':
+        element_class = UintegerElement
+    elif element_type == 'integer':
+        element_class = IntegerElement
+    elif element_type == 'date':
+        element_class = DateElement
+    elif element_type == 'float':
+        element_class = FloatElement
     else:
-        return UnhandledElement(fp, elementid_tuple, parent)
+        element_class = UnhandledElement
+    if fp.__class__ is ProfiledFile:
+        element_name = id_table[elementid]['name'] if elementid in id_table else f'{elementid:#x}'
+        return fp.profile.measure(element_name, element_class, element_class, fp, elementid_tuple, parent)
+    return element_class(fp, elementid_tuple, parent)
 
 
 def read_id(fp):
@@ -98,13 +115,41 @@ def read_vint(fp):
 
 class MkvFile:
     """ MkvFile Class, effectively the top-level container """
-
-    def __init__(self, filename):
+    # what is taken from a parse loaded from a ParseCache, the rest of the state belongs to each opening of the file
+    _parse_results = ('children', 'summary', 'datasize')
+
+
+    def __init__(self, filename, cache_dir=None, profile=False, cancel_event=None, progress=None):
+        """
+        If cache_dir, a directory or a ParseCache, is given, the parsed file is loaded from the cache if it was
+        stored there when the file was last parsed and the file hasn't changed since, and stored there if not.
+        If profile is True, the parse is measured by element name in profile, a ParseProfile, see
+        mp4analyser/profiling.py, and the file is parsed even if it is in the parse cache.
+        If cancel_event, a threading.Event, is given, setting it from another thread stops the parse at its next read
+        of the file, and ParseCancelled, see mp4analyser/source.py, is raised.
+        If progress, a callable, is given, it is called from the thread parsing the file with the number of bytes of
+        the file parsed so far and the top-level element just parsed, or None as the parse moves on through a large
+        element such as the Segment, see ProgressFile in mp4analyser/source.py.
+        """
         self.filename = filename
         self.type = 'file'
         self.elementid = 0
         self.children = []
         self.summary = {}
+        self.profile = ParseProfile() if profile else None
+        parse_cache = None
+        if cache_dir is not None:
+            from mp4analyser.cache import get_parse_cache
+            parse_cache = get_parse_cache(cache_dir)
+            cache_key = parse_cache.key(filename)
+            cached = parse_cache.load(cache_key) if self.profile is None else None
+            if cached is not None:
+                for name in self._parse_results:
+                    setattr(self, name, getattr(cached, name))
+                for element in self.children:
+                    element.parent = self
+                return
+        load_id_table()
         with open(filename, 'rb') as f:
             end_of_file = False
             # find size of file
@@ -112,16 +157,27 @@ class MkvFile:
             f.seek(0, os.SEEK_END)
             self.datasize = f.tell()
             f.seek(old_file_position, os.SEEK_SET)
+            if cancel_event is not None:
+                f = CancellableFile(f, cancel_event)
+            if progress is not None:
+                f = ProgressFile(f, progress)
+            if self.profile is not None:
+                f = ProfiledFile(f, self.profile)
+            # a parse that fails part way through is not stored in the parse cache
+            parsed = False
             try:
                 while not end_of_file:
                     elementid_tuple = read_id(f)
                     if elementid_tuple[0] in id_table:
                         current_element = element_factory(f, elementid_tuple, self)
                         self.children.append(current_element)
+                        if progress is not None:
+                            progress(current_element.element_position + current_element.size, current_element)
                     if len(f.read(4)) != 4:
                         end_of_file = True
                     else:
                         f.seek(-4, 1)
+                parsed = True
             except DataLengthError:
                 logging.error(f'data length error in {self.filename} after child {len(self.children)}')
             except struct.error as err:
@@ -129,6 +185,15 @@ class MkvFile:
             except Exception as e:
                 logging.exception(f'error in {filename} after child {len(self.children)}')
         f.close()
+        if parse_cache is not None and parsed:
+            parse_cache.store(cache_key, self)
+
+    def __getstate__(self):
+        # what is pickled for a ParseCache, the name and profile belong to each opening of the file
+        state = self.__dict__.copy()
+        del state['filename']
+        state['profile'] = None
+        return state
 
     def read_bytes(self, offset, num_bytes):
         with open(self.filename, 'rb') as f:
@@ -143,8 +208,21 @@ class MkvFile:
 
 # Element classes
 
+# the children of every element that isn't a master element, shared rather than an empty list per element
+NO_CHILDREN = ()
+# the flags of Blocks and SimpleBlocks as they are shown, shared by all blocks with the same flags
+BLOCK_HEADER_FLAGS = tuple(f'{flags:08b}' for flags in range(256))
+
+
 class MkvElement():
-    """ Base class for all elements """
+    """
+    Base class for all elements
+
+    Elements have __slots__ to keep large trees small. Subclasses declare __slots__ too, listing any attributes of
+    their own, as without it their instances get a __dict__ as well.
+    """
+    __slots__ = ('elementid', 'elementidbytes', 'type', 'parent', 'element_position', 'datasize', 'datasizebytes',
+                 'unknown_datasize', 'children', 'datavalue')
 
     def __init__(self, fp, elementid_tuple, parent):
         (self.elementid, self.elementidbytes) = elementid_tuple
@@ -153,25 +231,31 @@ class MkvElement():
         self.element_position = fp.tell() - self.elementidbytes
         (self.datasize, self.datasizebytes) = read_vint(fp)
         self.unknown_datasize = False
-        self.children = []
+        self.children = NO_CHILDREN
         self.datavalue = None
 
+    @property
+    def size(self):
+        """ the size in bytes of the whole element, id and data size included """
+        return self.elementidbytes + self.datasizebytes + self.datasize
+
     def get_file(self):
         if isinstance(self.parent, MkvFile):
             return self.parent
         else:
             return self.parent.get_file()
 
-    def get_bytes(self):
+    def get_bytes(self, max_bytes=100000):
         myfile = self.get_file()
-        num_bytes = self.elementidbytes + self.datasizebytes + self.datasize
-        # Truncate if over 100000
-        if num_bytes > 100000:
-            num_bytes = 100000
+        num_bytes = self.size
+        # Truncate if over max_bytes
+        if num_bytes > max_bytes:
+            num_bytes = max_bytes
         return myfile.read_bytes(self.element_position, num_bytes)
 
 
 class UnhandledElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         """ This should never get called """
@@ -185,6 +269,7 @@ class UnhandledElement(MkvElement):
 
 
 class BinaryElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
@@ -195,7 +280,7 @@ class BinaryElement(MkvElement):
                 (trackentry, ignore) = read_vint(fp)
                 self.datavalue = {'trackentry': trackentry, 'timestamp':struct.unpack('>h', fp.read(2))[0]}
                 blockheaderflags = struct.unpack('>B', fp.read(1))[0]
-                self.datavalue['blockheaderflags'] = f'{blockheaderflags:08b}'
+                self.datavalue['blockheaderflags'] = BLOCK_HEADER_FLAGS[blockheaderflags]
                 if self.elementid == 0xA3:
                     self.datavalue['keyframe'] = True if (blockheaderflags & 0x80) else False
                     self.datavalue['discardable'] = True if (blockheaderflags & 0x01) else False
@@ -249,9 +334,11 @@ class BinaryElement(MkvElement):
 
 
 class MasterElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
+        self.children = []
         try:
             # after calling superclass, fp will have advanced to the data i.e. the actual payload/data of the element
             start_of_element_data = last_known_end_of_child = fp.tell()
@@ -303,6 +390,7 @@ class MasterElement(MkvElement):
 
 
 class Utf_8Element(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
@@ -320,6 +408,7 @@ StringElement = Utf_8Element
 
 
 class UintegerElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
@@ -338,6 +427,7 @@ class UintegerElement(MkvElement):
 
 
 class IntegerElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
@@ -358,6 +448,7 @@ class IntegerElement(MkvElement):
 
 
 class DateElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
@@ -381,6 +472,7 @@ class DateElement(MkvElement):
 
 
 class FloatElement(MkvElement):
+    __slots__ = ()
 
     def __init__(self, fp, elementid, parent):
         super().__init__(fp, elementid, parent)
@@ -11,20 +11,37 @@ This file generates the user interface, and contains the callback functions that
 import os
 import logging
 import json
-import binascii
+import queue
+import threading
+import time
 from tkinter import *
 from tkinter import filedialog
+from tkinter import font
 from tkinter import messagebox
 from tkinter import ttk
 
 import sys
 sys.path.append(os.path.dirname(__file__))
 # mp4analyser is the package that actually parses the mp4 file
+import mp4analyser
 import mp4analyser.iso
+import mp4analyser.samples
+import mp4analyser.source
 # mkvanalyser is the package that parse tje matroska file
 import mkvanalyser.mkv
 from mkvanalyser.idlookups import id_table
 
+# the hex view only holds the lines that fit in it, of HEX_BYTES_PER_LINE bytes, read from the file as it scrolls
+HEX_BYTES_PER_LINE = 32
+# how each byte is shown in the text column of the hex view, as itself if it is printable ASCII, otherwise as '.'
+HEX_TEXT_TABLE = bytes(byte if 32 <= byte < 127 else ord('.') for byte in range(256))
+# number of chunks, or samples of a chunk, added to the tree view at a time, the rest wait behind a 'more' item
+TREE_PAGE_SIZE = 1000
+# milliseconds between looks at the progress of a file being loaded
+LOAD_POLL_INTERVAL = 100
+# seconds that each look may spend adding the boxes parsed since the last, so the window stays responsive
+LOAD_POLL_BUDGET = 0.05
+
 try:
     from idlelib.redirector import WidgetRedirector
 except ImportError:
@@ -66,6 +83,12 @@ class MyApp(Tk):
 
         self.containerfile = None
         self.dialog_dir = os.path.expanduser("~")
+        # a file is loaded in a thread of its own, which puts its progress on load_queue
+        self.load_thread = None
+        self.load_queue = None
+        self.load_cancel_event = None
+        self.load_filename = None
+        self.load_size = 0
 
         # I don't know if there's a better a way, but this works
         self.popup_focus = None
@@ -86,7 +109,7 @@ class MyApp(Tk):
 
         # create tabbed notebook
         self.nb = ttk.Notebook(self)
-        self.nb.grid(column=0, row=0, sticky=N+W+E+S)
+        self.nb.grid(column=0, row=0, columnspan=2, sticky=N+W+E+S)
 
         # create left-right paned window and add to tabbed notebook
         self.p = ttk.Panedwindow(self.nb, orient=HORIZONTAL)
@@ -130,6 +153,7 @@ class MyApp(Tk):
         self.scroll1.grid(column=1, row=0, sticky=N+S)
         self.tree['yscrollcommand'] = self.scroll1.set
         self.tree.bind('<ButtonRelease-1>', self.select_box)
+        self.tree.bind('<<TreeviewOpen>>', self.open_tree_item)
 
         # text widget display details of selected box
         self.t = ReadOnlyText(self.f2, state='normal', width=120, height=24, wrap='none')
@@ -152,17 +176,35 @@ class MyApp(Tk):
         self.thex.grid(column=0, row=0, sticky=N+W+E+S)
         self.thex.bind('<ButtonRelease-1>', self.check_if_selection)
         self.thex.bind("<Button-3>", self.popup_sel)
-
-        # Sub-classed auto hiding scroll bar
-        self.scroll4 = AutoScrollbar(self.f3, orient=VERTICAL, command=self.thex.yview)
+        self.thex_line_height = font.Font(font=self.thex['font']).metrics('linespace')
+        # re-rendered when resized, and scrolled by hand, as it only holds the lines that are visible
+        self.thex.bind('<Configure>', lambda e: self.render_hex_page())
+        self.thex.bind('<MouseWheel>', self.scroll_hex_with_wheel)
+        self.thex.bind('<Button-4>', self.scroll_hex_with_wheel)
+        self.thex.bind('<Button-5>', self.scroll_hex_with_wheel)
+        # the bytes shown in the hex view, a range of the file, and the line of them at the top of the view
+        self.hex_offset = 0
+        self.hex_size = 0
+        self.hex_first_line = 0
+
+        # Sub-classed auto hiding scroll bar, set by render_hex_page() to the position in all the lines of the range
+        self.scroll4 = AutoScrollbar(self.f3, orient=VERTICAL, command=self.scroll_hex)
         self.scroll4.grid(column=1, row=0, sticky=N+S)
-        self.thex['yscrollcommand'] = self.scroll4.set
 
         # Sub-classed auto hiding scroll bar
         self.scroll5 = AutoScrollbar(self.f3, orient=HORIZONTAL, command=self.thex.xview)
         self.scroll5.grid(column=0, row=1, sticky=W+E)
         self.thex['xscrollcommand'] = self.scroll5.set
 
+        # jump to an offset in the file, within the bytes shown in the hex view
+        self.f5 = ttk.Frame(self.f3)
+        self.f5.grid(column=0, row=2, sticky=W)
+        ttk.Label(self.f5, text="Go to offset:").grid(column=0, row=0)
+        self.hex_jump_text = StringVar()
+        self.hex_jump = ttk.Entry(self.f5, textvariable=self.hex_jump_text, width=20)
+        self.hex_jump.grid(column=1, row=0)
+        self.hex_jump.bind('<Return>', self.jump_to_hex_offset)
+
         # create a frame and as second tab to notebook
         self.f4 = ttk.Frame(self.nb)
         self.nb.add(self.f4, text="File Summary")
@@ -195,7 +237,12 @@ class MyApp(Tk):
         self.statustext = StringVar()
         self.statustext.set("")
         self.status = Label(self, textvariable=self.statustext, bd=1, anchor=W)
-        self.status.grid(column=0, row=1, columnspan=2, sticky=W+E+S)
+        self.status.grid(column=0, row=1, sticky=W+E+S)
+
+        # cancels loading a file, only shown while a file is loading
+        self.cancel_button = ttk.Button(self, text="Cancel", command=self.cancel_load)
+        self.cancel_button.grid(column=1, row=1, sticky=E+S)
+        self.cancel_button.grid_remove()
 
         # set ratios of panes
         self.update_idletasks()
@@ -209,24 +256,111 @@ class MyApp(Tk):
         if not(len(filename)):
             return
         logging.debug("Loading file " + filename)
-        self.statustext.set("Loading...")
-        self.update_idletasks()
-        matroska = False
-        with open(filename, 'rb') as f:
-            if f.read(4) in (b'\x1a\x45\xdf\xa3', b'\x1f\x43\xb6\x75'):
-                matroska = True
-        if matroska:
-            self.populate_ui(mkvanalyser.mkv.MkvFile(filename))
-        else:
-            self.populate_ui(mp4analyser.iso.Mp4File(filename))
-        logging.debug("Finished loading file " + filename)
-
+        self.cancel_load()
+        if type(self.containerfile) == mp4analyser.iso.Mp4File:
+            self.containerfile.close()
+        self.containerfile = None
+        self.clear_ui()
+        self.load_filename = filename
+        self.load_size = os.path.getsize(filename)
+        self.load_queue = queue.Queue()
+        self.load_cancel_event = threading.Event()
+        self.load_thread = threading.Thread(target=self.load_file, daemon=True,
+                                            args=(filename, self.load_queue, self.load_cancel_event))
+        self.load_thread.start()
+        self.statustext.set(f"Loading {os.path.basename(filename)}...")
+        self.cancel_button.grid()
+        self.after(LOAD_POLL_INTERVAL, self.poll_load_queue, self.load_queue)
+
+    @staticmethod
+    def load_file(filename, load_queue, cancel_event):
+        """ parses the file, in a thread of its own, putting its progress and then the parsed file on load_queue """
+        def progress(position, top_level_box):
+            load_queue.put(('progress', position, top_level_box))
+        try:
+            if mp4analyser.detect_format(filename) == 'mkv':
+                new_file = mkvanalyser.mkv.MkvFile(filename, cancel_event=cancel_event, progress=progress)
+            else:
+                new_file = mp4analyser.iso.Mp4File(filename, use_mmap=True, lazy=True, cancel_event=cancel_event,
+                                                   progress=progress)
+                # the samples are identified here, as the lazy parse leaves it to the first mdat selected, which
+                # would hold up the user interface while the sample tables of a large file are read
+                load_queue.put(('indexing', None, None))
+                new_file.generate_samples()
+            # the summary is kept, so populate_ui() doesn't have to wait for it
+            new_file.get_summary()
+            load_queue.put(('loaded', new_file, None))
+        except mp4analyser.source.ParseCancelled:
+            load_queue.put(('cancelled', None, None))
+        except Exception as e:
+            logging.exception("error loading " + filename)
+            load_queue.put(('failed', e, None))
+
+    def poll_load_queue(self, load_queue):
+        """ Callback every LOAD_POLL_INTERVAL ms while a file loads, shows its progress and the boxes parsed so far """
+        if load_queue is not self.load_queue:
+            # the load was cancelled, or another file opened since
+            return
+        position = None
+        indexing = False
+        deadline = time.perf_counter() + LOAD_POLL_BUDGET
+        while time.perf_counter() < deadline:
+            try:
+                message, value, top_level_box = load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message == 'progress':
+                position = value
+                if top_level_box is not None:
+                    self.insert_top_level_box(top_level_box)
+            elif message == 'indexing':
+                indexing = True
+            else:
+                filename = self.load_filename
+                self.finish_load()
+                if message == 'loaded':
+                    logging.debug("Finished loading file " + filename)
+                    self.populate_ui(value)
+                elif message == 'failed':
+                    self.clear_ui()
+                    messagebox.showerror(message=f"{filename} could not be loaded: {value}")
+                else:
+                    self.clear_ui()
+                    self.statustext.set("Loading cancelled")
+                return
+        if indexing:
+            self.statustext.set(f"Indexing samples of {os.path.basename(self.load_filename)}...")
+        elif position is not None and self.load_size:
+            self.statustext.set(f"Loading {os.path.basename(self.load_filename)}... "
+                                f"{100 * position // self.load_size}%")
+        self.after(LOAD_POLL_INTERVAL, self.poll_load_queue, load_queue)
+
+    def cancel_load(self):
+        """ Callback on the Cancel button, stops the file being loaded at the next read of it """
+        if self.load_thread is not None:
+            self.load_cancel_event.set()
+            self.finish_load()
+            self.clear_ui()
+            self.statustext.set("Loading cancelled")
+
+    def finish_load(self):
+        self.load_thread = None
+        self.load_queue = None
+        self.load_cancel_event = None
         self.statustext.set("")
-        self.update_idletasks()
+        self.cancel_button.grid_remove()
+
+    def clear_ui(self):
+        """ Clear tree and text widgets if not empty """
+        self.title("MP4 Analyser")
+        self.tree.delete(*self.tree.get_children())
+        self.t.delete(1.0, END)
+        self.populate_hex_text_widget(0, 0)
+        self.tsum.delete(1.0, END)
 
     def item_string(self, container):
         '''  item_string returns appropriate container type depending on whether file is mp4 or matroska '''
-        if type(self.containerfile) == mp4analyser.iso.Mp4File:
+        if not isinstance(container, mkvanalyser.mkv.MkvElement):
             return container.type
         else:
             if container.elementid in id_table:
@@ -239,25 +373,27 @@ class MyApp(Tk):
         if (len(new_file.children) == 0) or (
                 len(new_file.children) == 1 and isinstance(new_file.children[0], mp4analyser.non_iso.UndefinedBox)):
             logging.error(new_file.filename + " does not appear to be a valid Container file.")
+            if type(new_file) == mp4analyser.iso.Mp4File:
+                new_file.close()
+            self.clear_ui()
             messagebox.showerror(message=new_file.filename + " does not appear to be a valid Container file.")
             return
         self.containerfile = new_file
         self.dialog_dir, filename_base = os.path.split(self.containerfile.filename)
         self.title(f"MP4 Analyser - {filename_base:s}")
-        # Clear tree and text widgets if not empty
-        self.tree.delete(*self.tree.get_children())
-        self.t.delete(1.0, END)
-        self.thex.delete(1.0, END)
-        self.tsum.delete(1.0, END)
         self.tsum.insert(END, json.dumps(self.containerfile.get_summary(), indent=2))
 
-        # Now fill tree with new contents
-        for l0, this_box in enumerate(self.containerfile.children):
-            self.tree.insert('', 'end', str(l0), text=str(l0) + " " + self.item_string(this_box), open=TRUE)
-            self.walk_the_boxes(this_box, [l0])
+        # Now fill tree with the boxes that weren't shown as they were parsed, all of them if the file was cached
+        for this_box in self.containerfile.children[len(self.tree.get_children()):]:
+            self.insert_top_level_box(this_box)
         logging.debug("Summary " + json.dumps(self.containerfile.get_summary(), indent=2))
         logging.debug("Finished populating " + self.containerfile.filename)
 
+    def insert_top_level_box(self, this_box):
+        l0 = len(self.tree.get_children())
+        self.tree.insert('', 'end', str(l0), text=str(l0) + " " + self.item_string(this_box), open=TRUE)
+        self.walk_the_boxes(this_box, [l0])
+
     def walk_the_boxes(self, parent_box, parent_tree_index):
         ''' populate the tree view widget using recursion '''
         parent_item = '.'.join([str(indice) for indice in parent_tree_index])
@@ -270,12 +406,19 @@ class MyApp(Tk):
     def select_box(self, a):
         """ Callback on selecting an Mp4 box in treeview """
         logging.debug("Box selected " + self.tree.focus())
+        if self.containerfile is None:
+            # still loading, the boxes shown so far are in the hands of the thread parsing the file
+            return
         self.statustext.set("Loading...")
         self.update_idletasks()
         if self.tree.focus()[0:5] == 'chunk':
             self.select_chunk_details(self.tree.focus())
         elif self.tree.focus()[0:6] == 'sample':
             self.select_sample_details(self.tree.focus())
+        elif self.tree.focus()[0:4] == 'more':
+            self.populate_tree_with_next_page(self.tree.focus())
+        elif self.tree.focus()[0:11] == 'placeholder':
+            pass
         else:
             self.select_box_details(self.tree.focus())
         self.statustext.set("")
@@ -285,16 +428,10 @@ class MyApp(Tk):
         """ if tree item selected is a media chunk (or equivalent 'run' for fragmented mp4) """
         idx_chunk = int((item_id.split('_')[1]).split('_')[0])
         idx_mdat = int(self.tree.parent(item_id))
-        chunk_dict = self.containerfile.children[idx_mdat].sample_list[idx_chunk]
-        self.populate_text_widget(json.dumps(chunk_dict, indent=2))
-        if 'chunk_offset' in chunk_dict:
-            byte_offset = chunk_dict['chunk_offset']
-            last_sample = chunk_dict['chunk_samples'][-1]
-        else:
-            byte_offset = chunk_dict['run_offset']
-            last_sample = chunk_dict['run_samples'][-1]
-        num_bytes = (last_sample['offset'] + last_sample['size']) - byte_offset
-        self.populate_hex_text_widget(self.containerfile.read_bytes(byte_offset, num_bytes))
+        sample_list = self.containerfile.children[idx_mdat].sample_list
+        self.populate_text_widget(json.dumps(sample_list[idx_chunk], indent=2))
+        byte_offset, num_bytes = sample_list.get_byte_range(idx_chunk)
+        self.populate_hex_text_widget(byte_offset, num_bytes)
 
     def select_sample_details(self, item_id):
         """ if tree item selected is a media sample """
@@ -302,14 +439,9 @@ class MyApp(Tk):
         parent_id = self.tree.parent(item_id)
         idx_chunk = int((parent_id.split('_')[1]).split('_')[0])
         idx_mdat = int(self.tree.parent(parent_id))
-        if 'chunk_samples' in self.containerfile.children[idx_mdat].sample_list[idx_chunk]:
-            sample_dict = self.containerfile.children[idx_mdat].sample_list[idx_chunk]['chunk_samples'][idx_sample]
-        else:
-            sample_dict = self.containerfile.children[idx_mdat].sample_list[idx_chunk]['run_samples'][idx_sample]
+        sample_dict = self.containerfile.children[idx_mdat].sample_list.get_sample(idx_chunk, idx_sample)
         self.populate_text_widget(json.dumps(sample_dict, indent=2))
-        byte_offset = sample_dict['offset']
-        num_bytes = sample_dict['size']
-        self.populate_hex_text_widget(self.containerfile.read_bytes(byte_offset, num_bytes))
+        self.populate_hex_text_widget(sample_dict['offset'], sample_dict['size'])
 
     def get_descendant(self, parent_box, tree_index):
         """ walk down the tree to get selected box """
@@ -336,45 +468,92 @@ class MyApp(Tk):
         logging.debug("Populating text widgets")
         self.prepare_string_for_text_widget(box_selected)
         logging.debug("Upper text widget populated")
-        self.populate_hex_text_widget(box_selected.get_bytes())
+        if type(self.containerfile) == mp4analyser.iso.Mp4File:
+            self.populate_hex_text_widget(box_selected.start_of_box, box_selected.size)
+        else:
+            self.populate_hex_text_widget(box_selected.element_position, box_selected.size)
         logging.debug("Hex text widget populated")
 
     def populate_tree_with_samples_in_mdat(self, mdat_id):
-        # for large files may take a few seconds to load
-        self.populate_text_widget("Loading Samples...")
-        self.update_idletasks()
-        mdat = self.containerfile.children[int(mdat_id)]
-        for chunk_idx, chunk in enumerate(mdat.sample_list):
-            if 'chunk_ID' in chunk:
-                item_text = "track {}, chunk {}".format(chunk['track_ID'], chunk['chunk_ID'])
-                self.tree.insert(mdat_id, 'end', f"chunk_{chunk_idx}_mdat_{mdat_id}", text=item_text)
-                for sample_idx, sample in enumerate(chunk['chunk_samples']):
-                    item_text = "sample {}".format(sample['sample_ID'])
-                    self.tree.insert(f"chunk_{chunk_idx}_mdat_{mdat_id}", 'end',
-                                     f"sample_{chunk_idx}.{sample_idx}_mdat_{mdat_id}", text=item_text)
-            else:  # fragmented mp4 uses term "run" instead of "chunk" but is otherwise same
-                item_text = "track {}, seq {}, run {}".format(chunk['track_ID'], chunk['sequence_number'],
-                                                                 chunk['run_ID'])
-                self.tree.insert(mdat_id,
-                                 'end',
-                                 "chunk-{}_{}".format(chunk['sequence_number'], chunk_idx),
-                                 text=item_text)
-                for sample_idx, sample in enumerate(chunk['run_samples']):
-                    item_text = "sample {}".format(sample['sample_ID'])
-                    self.tree.insert("chunk-{}_{}".format(chunk['sequence_number'], chunk_idx),
-                                     'end',
-                                     "sample-{}_{}.{}".format(chunk['sequence_number'], chunk_idx, sample_idx),
-                                     text=item_text)
+        """ adds the first page of chunks of the mdat to the tree, the samples of a chunk are added when it is opened """
+        self.populate_tree_with_chunks(mdat_id)
+
+    def populate_tree_with_chunks(self, mdat_id):
+        """ adds the next page of chunks of the mdat, followed by a 'more' item if there are chunks left """
+        sample_list = self.containerfile.children[int(mdat_id)].sample_list
+        first = len(self.tree.get_children(mdat_id))
+        last = min(first + TREE_PAGE_SIZE, len(sample_list))
+        # read chunks from the sample index rather than building a dict for each
+        for chunk_idx in range(first, last):
+            if isinstance(sample_list, mp4analyser.samples.RunList):
+                # fragmented mp4 uses term "run" instead of "chunk" but is otherwise same
+                track, run_index = sample_list.get_track_chunk(chunk_idx)
+                sequence_number = track.sequence_number[run_index]
+                item_text = "track {}, seq {}, run {}".format(track.track_ID, sequence_number,
+                                                               track.run_ID[run_index])
+                chunk_id = f"chunk-{sequence_number}_{chunk_idx}"
+            else:
+                track, chunk_index = sample_list.get_track_chunk(chunk_idx)
+                item_text = "track {}, chunk {}".format(track.track_ID, chunk_index + 1)
+                chunk_id = f"chunk_{chunk_idx}_mdat_{mdat_id}"
+            self.tree.insert(mdat_id, 'end', chunk_id, text=item_text)
+            # so the chunk can be opened, its samples replace the placeholder when it is
+            self.tree.insert(chunk_id, 'end', f"placeholder_{chunk_id}", text="Loading...")
+        if last < len(sample_list):
+            self.tree.insert(mdat_id, 'end', f"more_{mdat_id}",
+                             text=f"{len(sample_list) - last} more, select to show the next {TREE_PAGE_SIZE}")
+
+    def populate_tree_with_samples(self, chunk_id):
+        """ adds the next page of samples of the chunk, followed by a 'more' item if there are samples left """
+        idx_chunk = int((chunk_id.split('_')[1]).split('_')[0])
+        mdat_id = self.tree.parent(chunk_id)
+        sample_list = self.containerfile.children[int(mdat_id)].sample_list
+        track, chunk_index = sample_list.get_track_chunk(idx_chunk)
+        if isinstance(sample_list, mp4analyser.samples.RunList):
+            samples = track.run_samples(chunk_index)
+            sample_numbers = range(1, len(samples) + 1)
+        else:
+            samples = track.chunk_samples(chunk_index)
+            sample_numbers = range(samples.start + 1, samples.stop + 1)
+        first = len(self.tree.get_children(chunk_id))
+        last = min(first + TREE_PAGE_SIZE, len(samples))
+        for sample_idx in range(first, last):
+            if isinstance(sample_list, mp4analyser.samples.RunList):
+                sample_id = f"sample{chunk_id[5:]}.{sample_idx}"
+            else:
+                sample_id = f"sample_{idx_chunk}.{sample_idx}_mdat_{mdat_id}"
+            self.tree.insert(chunk_id, 'end', sample_id, text="sample {}".format(sample_numbers[sample_idx]))
+        if last < len(samples):
+            self.tree.insert(chunk_id, 'end', f"more_{chunk_id}",
+                             text=f"{len(samples) - last} more, select to show the next {TREE_PAGE_SIZE}")
+
+    def populate_tree_with_next_page(self, more_id):
+        """ replaces a 'more' item with the next page of the chunks or samples it stands for """
+        parent_id = self.tree.parent(more_id)
+        self.tree.delete(more_id)
+        if parent_id[0:5] == 'chunk':
+            self.populate_tree_with_samples(parent_id)
+        else:
+            self.populate_tree_with_chunks(parent_id)
+
+    def open_tree_item(self, a):
+        """ Callback on opening an item in treeview, adds the samples of a chunk when it is first opened """
+        item_id = self.tree.focus()
+        if item_id[0:5] == 'chunk' and self.tree.exists(f"placeholder_{item_id}"):
+            self.tree.delete(f"placeholder_{item_id}")
+            self.populate_tree_with_samples(item_id)
 
     def prepare_string_for_text_widget(self, box_selected):
         if type(self.containerfile) == mp4analyser.iso.Mp4File:
+            # files are parsed lazily, so decode box_info before checking for attributes it may set
+            box_info = box_selected.get_box_info()
             my_string = "Box is {0:d} ({0:#x}) bytes from beginning of file.\n\n".format(box_selected.start_of_box)
             my_string += f"Has header:\n{json.dumps(box_selected.header.get_header()):s}\n\n"
             my_string += f"Has version: {box_selected.version:d}\n" if hasattr(box_selected, 'version') else ""
             my_string += f"Has flags: {box_selected.flags:#08x}\n\n" if hasattr(box_selected, 'flags') else ""
-            if len(box_selected.box_info) > 0:
+            if len(box_info) > 0:
                 # insertion order is preserved in modern Python
-                my_string += f"Has values:\n{json.dumps(box_selected.box_info, indent=2):s}\n\n"
+                my_string += f"Has values:\n{json.dumps(box_info, indent=2):s}\n\n"
             if len(box_selected.children) > 0:
                 my_string += "Has child boxes:\n" + json.dumps([box.type for box in box_selected.children])
         else:
@@ -402,31 +581,63 @@ class MyApp(Tk):
         self.t.delete(1.0, END)
         self.t.insert(END, the_string)
 
-    def populate_hex_text_widget(self, my_byte_list):
-        bytes_per_line = 32  # Num bytes per line
-        # trunc_size = arbitrary max. number of bytes to display in hex view to prevent tk text widget barfing.
-        # change to suit
-        trunc_size = 100000
+    def populate_hex_text_widget(self, byte_offset, num_bytes):
+        """ shows the num_bytes bytes of the file from byte_offset in the hex view, from the first of them """
+        self.hex_offset = byte_offset
+        self.hex_size = num_bytes
+        self.hex_first_line = 0
+        self.f3['text'] = f'Hex View, {num_bytes:d} bytes from {byte_offset:d} ({byte_offset:#x})' if num_bytes \
+            else 'Hex View'
+        self.render_hex_page()
+
+    def render_hex_page(self):
+        """ fills the hex view with the lines that fit in it from hex_first_line, read from the file """
+        visible_lines = max(1, self.thex.winfo_height() // self.thex_line_height)
+        total_lines = -(-self.hex_size // HEX_BYTES_PER_LINE)
+        self.hex_first_line = max(0, min(self.hex_first_line, total_lines - visible_lines))
+        first = self.hex_first_line * HEX_BYTES_PER_LINE
+        num_bytes = min(visible_lines * HEX_BYTES_PER_LINE, self.hex_size - first)
+        page = self.containerfile.read_bytes(self.hex_offset + first, num_bytes) if num_bytes > 0 else b''
         self.thex.delete(1.0, END)
-        trunc = False
-        if len(my_byte_list) > trunc_size:
-            my_byte_list = my_byte_list[:trunc_size]
-            trunc = True
-        hex_string = ''
-        for i in range(0, len(my_byte_list), bytes_per_line):
-            byte_line = my_byte_list[i:i + bytes_per_line]
-            # which is better 256 or 65536? Maybe 65536 for east asian subs
-            char_line = "".join([k if k.isprintable() and ord(k) < 65536 else '.'
-                                 for k in byte_line.decode('utf-8', "replace")])
-            hex_line = binascii.b2a_hex(byte_line).decode('utf-8')
-            pretty_hex_line = " ".join([hex_line[j:j + 2] for j in range(0, len(hex_line), 2)])
-            pretty_hex_line = pretty_hex_line.ljust(3 * bytes_per_line)
-            hex_string += pretty_hex_line + '\t' + char_line + '\n'
-        logging.debug("Hex text processed")
-        if trunc:
-            self.thex.insert(END, f'Hex view, showing first {trunc_size:d} bytes: \n{hex_string:s}')
+        self.thex.insert(END, format_hex_lines(page, self.hex_offset + first))
+        if total_lines:
+            self.scroll4.set(self.hex_first_line / total_lines,
+                             min(1, (self.hex_first_line + visible_lines) / total_lines))
         else:
-            self.thex.insert(END, f'Hex view: \n{hex_string:s}')
+            self.scroll4.set(0, 1)
+
+    def scroll_hex(self, action, amount, unit=None):
+        """ Callback on the hex view's vertical scroll bar """
+        visible_lines = max(1, self.thex.winfo_height() // self.thex_line_height)
+        if action == 'moveto':
+            self.hex_first_line = int(float(amount) * -(-self.hex_size // HEX_BYTES_PER_LINE))
+        elif unit == 'pages':
+            self.hex_first_line += int(amount) * visible_lines
+        else:
+            self.hex_first_line += int(amount)
+        self.render_hex_page()
+
+    def scroll_hex_with_wheel(self, e):
+        """ Callback on turning the mouse wheel over the hex view """
+        if e.num == 4 or e.delta > 0:
+            self.scroll_hex('scroll', -3, 'units')
+        else:
+            self.scroll_hex('scroll', 3, 'units')
+        return 'break'
+
+    def jump_to_hex_offset(self, e):
+        """ Callback on entering an offset in the file to go to, decimal or hex with a leading 0x """
+        try:
+            byte_offset = int(self.hex_jump_text.get().strip(), 0)
+        except ValueError:
+            self.statustext.set("Offset should be a number e.g. 1024 or 0x400")
+            return
+        if not self.hex_offset <= byte_offset < self.hex_offset + self.hex_size:
+            self.statustext.set(f"Offset {byte_offset:d} is not in the bytes shown")
+            return
+        self.statustext.set("")
+        self.hex_first_line = (byte_offset - self.hex_offset) // HEX_BYTES_PER_LINE
+        self.render_hex_page()
 
     def popup_sel(self, e):
         self.popup_focus = e.widget
@@ -454,6 +665,17 @@ class MyApp(Tk):
         self.rclickmenu.entryconfig("Copy Selection", state="normal")
 
 
+def format_hex_lines(byte_list, byte_offset):
+    """ returns the lines of the hex view of byte_list, which are byte_offset bytes from the beginning of the file """
+    # may be a memoryview slice of a memory-mapped file
+    byte_list = bytes(byte_list)
+    hex_string = byte_list.hex(' ')
+    char_string = byte_list.translate(HEX_TEXT_TABLE).decode('ascii')
+    hex_width = 3 * HEX_BYTES_PER_LINE
+    return '\n'.join(f'{byte_offset + i:010x}  {hex_string[3 * i:3 * i + hex_width - 1]:{hex_width}s}'
+                     f'{char_string[i:i + HEX_BYTES_PER_LINE]}' for i in range(0, len(byte_list), HEX_BYTES_PER_LINE))
+
+
 if __name__ == '__main__':
     myapp = MyApp()
     myapp.mainloop()
@@ -0,0 +1,28 @@
+"""
+mp4analyser parses files that conform to ISO/IEC 14496-12 into a tree of boxes, see iso.py.
+
+open_file() also opens Matroska and WebM files with the sibling package mkvanalyser. Only the modules that the
+format of the file needs are imported, and only when a file is opened, so importing this package is quick.
+"""
+
+MATROSKA_MAGIC = (b'\x1a\x45\xdf\xa3', b'\x1f\x43\xb6\x75')
+
+
+def detect_format(filename):
+    """ returns 'mkv' if filename starts like a Matroska or WebM file, otherwise 'mp4' """
+    with open(filename, 'rb') as f:
+        return 'mkv' if f.read(4) in MATROSKA_MAGIC else 'mp4'
+
+
+def open_file(filename, file_format=None, **kwargs):
+    """
+    returns an MkvFile or an Mp4File of filename, file_format being 'mkv', 'mp4' or None to detect it.
+    kwargs are passed on, MkvFile only takes cache_dir, profile, cancel_event and progress.
+    """
+    if file_format is None:
+        file_format = detect_format(filename)
+    if file_format == 'mkv':
+        import mkvanalyser.mkv
+        return mkvanalyser.mkv.MkvFile(filename, **kwargs)
+    import mp4analyser.iso
+    return mp4analyser.iso.Mp4File(filename, **kwargs)
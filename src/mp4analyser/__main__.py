@@ -0,0 +1,10 @@
+"""
+__main__.py
+
+Runs the command-line tool, see cli.py. Usage: python -m mp4analyser [options] PATH [PATH ...]
+"""
+import sys
+
+from mp4analyser.cli import main
+
+sys.exit(main())
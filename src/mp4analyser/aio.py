@@ -0,0 +1,124 @@
+"""
+aio.py
+
+An asyncio API, for services that analyse files while they go on serving other requests. Opening a file is blocking
+I/O and CPU work, so each parse runs in a thread of an executor and the event loop only awaits it. An AsyncAnalyser
+runs at most max_concurrency parses at once, however many analyses are in flight, the others waiting their turn
+without holding a thread, so hundreds of analyses can be awaited at once. The functions open_file() and get_summary()
+of this module share one AsyncAnalyser, and so its limit, between all their callers.
+
+Cancelling the task that awaits an analysis stops it: before its parse starts if it is still waiting, otherwise at the
+parse's next read of the file. The cancelled task finishes once the parse has stopped, so that its thread is free
+again. A file that was opened is fully parsed, so using it doesn't block the event loop.
+The parses hold the GIL while they run, so the more of them at once, the longer the event loop can wait to be run,
+which is what max_concurrency bounds, see benchmarks/bench_async.py.
+
+"""
+import asyncio
+import concurrent.futures
+import functools
+import threading
+
+import mp4analyser
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class AsyncAnalyser:
+    """
+    Opens and summarises files in the threads of executor, or of a ThreadPoolExecutor of max_concurrency threads of
+    its own if executor isn't given, with at most max_concurrency parses at once.
+    Use it from one event loop at a time, and close() it, or use it as an async context manager, when done with it.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, executor=None):
+        self.max_concurrency = max_concurrency
+        self._own_executor = executor is None
+        self._executor = executor if executor is not None else concurrent.futures.ThreadPoolExecutor(
+            max_concurrency, thread_name_prefix='mp4analyser')
+        # made in the event loop, as before Python 3.10 a semaphore belongs to the loop it is made in
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ shuts down the executor, if it is the analyser's own, without waiting for parses still running """
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def _run(self, parse, *args, **kwargs):
+        """ returns parse(*args, cancel_event=..., **kwargs), run in the executor once there is a free slot """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            cancel_event = threading.Event()
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(parse, *args, cancel_event=cancel_event, **kwargs))
+            try:
+                # shielded, so cancelling the task doesn't let go of the parse
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the thread can't be interrupted, this stops the parse at its next read
+                cancel_event.set()
+                # and its slot is only freed once it has stopped, so no more than max_concurrency parses run at once
+                await _wait_until_done(future)
+                raise
+
+    async def open_file(self, filename, file_format=None, **kwargs):
+        """
+        returns an Mp4File or MkvFile of filename, as mp4analyser.open_file() does, kwargs are passed on to it.
+        Raises asyncio.CancelledError if cancelled.
+        """
+        return await self._run(mp4analyser.open_file, filename, file_format, **kwargs)
+
+    async def get_summary(self, filename, file_format=None, **kwargs):
+        """
+        returns the summary of filename, an MP4 file being opened with summary_only=True unless kwargs say otherwise,
+        kwargs are passed on to mp4analyser.open_file(). Raises asyncio.CancelledError if cancelled.
+        """
+        return await self._run(_summarise, filename, file_format, **kwargs)
+
+
+async def _wait_until_done(future):
+    """ waits for future to finish, however many times the waiting task is cancelled meanwhile """
+    while not future.done():
+        try:
+            await asyncio.wait([future])
+        except asyncio.CancelledError:
+            pass
+    if not future.cancelled():
+        # retrieved, so that an exception, usually ParseCancelled, isn't logged as never retrieved
+        future.exception()
+
+
+def _summarise(filename, file_format=None, **kwargs):
+    if file_format is None:
+        file_format = mp4analyser.detect_format(filename)
+    if file_format == 'mp4':
+        kwargs.setdefault('summary_only', True)
+    return mp4analyser.open_file(filename, file_format, **kwargs).get_summary()
+
+
+_shared_analyser = None
+
+
+def get_shared_analyser():
+    """ returns the AsyncAnalyser that open_file() and get_summary() share """
+    global _shared_analyser
+    if _shared_analyser is None:
+        _shared_analyser = AsyncAnalyser()
+    return _shared_analyser
+
+
+async def open_file(filename, file_format=None, **kwargs):
+    """ AsyncAnalyser.open_file() of the shared analyser """
+    return await get_shared_analyser().open_file(filename, file_format, **kwargs)
+
+
+async def get_summary(filename, file_format=None, **kwargs):
+    """ AsyncAnalyser.get_summary() of the shared analyser """
+    return await get_shared_analyser().get_summary(filename, file_format, **kwargs)
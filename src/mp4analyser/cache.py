@@ -0,0 +1,138 @@
+"""
+cache.py
+
+A persistent cache of parsed files, so that opening a large file again loads its box tree, box_info and sample
+index rather than parsing it all over again. Each entry is a pickle of the parsed file object, stored under a name
+derived from the path of the file, along with a key that identifies the contents of the file when it was parsed:
+its size, modification time and a hash of its first and last few KB. An entry whose key no longer matches the file
+is stale, and is replaced the next time the file is parsed. The directory is kept within a byte budget by removing
+the least recently used entries.
+
+N.B. loading a pickle can run arbitrary code, so only point a cache at a directory that nobody else can write to.
+
+"""
+import gc
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+# bump when the box or element classes change in a way that makes existing entries unusable
+CACHE_VERSION = 3
+
+
+class ParseCache:
+    """ A directory of parsed files, holding at most max_bytes of entries """
+    suffix = '.parse-cache'
+    # bytes hashed at each end of the file
+    fingerprint_size = 4096
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filename, variant=''):
+        """
+        returns the key of filename as it is now. variant distinguishes parses of the same file that give different
+        results e.g. a lazy parse.
+        """
+        path = os.path.realpath(filename)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            digest.update(f.read(self.fingerprint_size))
+            if stat.st_size > self.fingerprint_size:
+                f.seek(max(self.fingerprint_size, stat.st_size - self.fingerprint_size))
+                digest.update(f.read(self.fingerprint_size))
+        return {'version': CACHE_VERSION, 'path': path, 'variant': variant, 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns, 'digest': digest.hexdigest()}
+
+    def load(self, key):
+        """ returns the object stored with key, or None if there isn't one or the file has changed since """
+        entry_path = self._entry_path(key)
+        # unpickling creates many objects and no garbage, so the collector would only slow it down
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(entry_path, 'rb') as f:
+                if pickle.load(f) != key:
+                    f.close()
+                    os.remove(entry_path)
+                    return None
+                parsed = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # an entry written by an older version of the classes, or one cut short
+            logging.warning(f'discarding unreadable cache entry for {key["path"]}: {e!r}')
+            self._remove(entry_path)
+            return None
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        # entries are evicted in order of modification time, so loading an entry counts as using it
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return parsed
+
+    def store(self, key, parsed):
+        """ stores the parsed file object with key, the key returned before the file was parsed """
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # so that another process never loads a partly written entry
+            os.replace(temp_path, self._entry_path(key))
+        except Exception as e:
+            logging.exception(f'error caching {key["path"]}')
+            self._remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """ removes the least recently used entries until those left take up no more than max_bytes """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            self._remove(entry_path)
+            total_bytes -= size
+
+    def clear(self):
+        """ removes every entry """
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    self._remove(entry.path)
+
+    def _entry_path(self, key):
+        name = hashlib.sha256(f'{key["path"]}\0{key["variant"]}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + self.suffix)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_parse_cache(cache_dir):
+    """ cache_dir may be None, a directory or a ParseCache, returns None or a ParseCache """
+    if cache_dir is None or isinstance(cache_dir, ParseCache):
+        return cache_dir
+    return ParseCache(cache_dir)
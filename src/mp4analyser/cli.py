@@ -0,0 +1,294 @@
+"""
+cli.py
+
+A command-line tool that parses many files without the user interface, run as python -m mp4analyser.
+Files, glob patterns and directories (searched recursively for media files) are parsed in a pool of worker
+processes, and for each file one line of JSON is written, holding the summary or the whole tree of the file.
+Each file can be given a time limit and, if asked for, each worker a limit on its resident memory, where the platform
+supports them, so that a damaged or pathological file fails on its own line rather than stopping the run.
+With --profile, the parse of each file is measured by box or element type, see profiling.py, and a table of the
+totals over all the files is written to standard error at the end.
+
+"""
+import argparse
+import gc
+import glob
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+import mp4analyser
+
+MEDIA_EXTENSIONS = ('.mp4', '.m4s', '.m4a', '.m4v', '.mov', '.3gp', '.cmfv', '.cmfa', '.heic', '.mkv', '.webm')
+
+
+# the memory of a worker is looked at each time the parse of a file has moved this many bytes further through it
+MEMORY_CHECK_BYTES = 1024 * 1024
+# where Linux shows the memory of a process, its resident size is the second field, in pages
+STATM_PATH = '/proc/self/statm'
+
+
+class FileTimeout(BaseException):
+    """
+    Raised in a worker when a file takes longer than its time limit. Not an Exception, so the catch-alls of the
+    parsers don't swallow it.
+    """
+    pass
+
+
+class MemoryLimitExceeded(BaseException):
+    """
+    Raised in a worker when parsing a file takes its resident memory over the limit. Not an Exception, so the
+    catch-alls of the parsers don't swallow it.
+    """
+    pass
+
+
+class _LogCollector(logging.Handler):
+    """ keeps the messages the parsers log for the file being parsed, which they log rather than raise """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if record.exc_info and record.exc_info[1] is not None:
+            message += f': {record.exc_info[1]!r}'
+        self.messages.append(message)
+
+
+_options = {}
+_log_collector = None
+
+
+def _raise_timeout(signum, frame):
+    raise FileTimeout()
+
+
+def _init_worker(options):
+    """ sets up a worker process, options is a dict of the parsed command-line options the workers need """
+    global _log_collector
+    _options.update(options)
+    _log_collector = _LogCollector()
+    root_logger = logging.getLogger()
+    root_logger.handlers = [_log_collector]
+    root_logger.setLevel(logging.WARNING)
+    if options['timeout'] and hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, _raise_timeout)
+
+
+def _resident_bytes():
+    """ returns the resident memory of this process in bytes """
+    with open(STATM_PATH, 'rb') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _memory_check(limit):
+    """
+    returns a progress callback for the parse of a file, see Mp4File, that raises MemoryLimitExceeded once the
+    resident memory of the worker is over limit bytes, looking at it every MEMORY_CHECK_BYTES of the file
+    """
+    next_position = 0
+
+    def check(position, top_level_box):
+        nonlocal next_position
+        if position >= next_position:
+            next_position = position + MEMORY_CHECK_BYTES
+            if _resident_bytes() > limit:
+                raise MemoryLimitExceeded()
+    return check
+
+
+def _json_default(o):
+    # box_info and Matroska data values can hold bytes
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return bytes(o).hex()
+    return str(o)
+
+
+def box_tree(box):
+    """ returns a box and its descendants as a dict """
+    tree = {'type': box.type, 'start_of_box': box.start_of_box, 'size': box.size, 'header': box.header.get_header()}
+    if hasattr(box, 'version'):
+        tree['version'] = box.version
+    if hasattr(box, 'flags'):
+        tree['flags'] = box.flags
+    tree['box_info'] = box.get_box_info()
+    tree['children'] = [box_tree(child) for child in box.children]
+    return tree
+
+
+def element_tree(element):
+    """ returns a Matroska element and its descendants as a dict """
+    return {'id': element.elementid, 'type': element.type, 'element_position': element.element_position,
+            'datasize': element.datasize, 'datavalue': element.datavalue,
+            'children': [element_tree(child) for child in element.children]}
+
+
+def _process_file(filename):
+    """
+    parses filename in a worker, returns the line of JSON to write, whether the file was parsed and, if profiling,
+    the stats of the parse by box or element type
+    """
+    record = {'filename': filename}
+    profile_stats = None
+    _log_collector.messages = []
+    memory_limit = _options['max_memory'] * 1024 * 1024
+    if memory_limit:
+        # the boxes of the last file parsed and their parents refer to each other, so only the garbage collector frees
+        # them, and they would count against this file
+        gc.collect()
+    start = time.perf_counter()
+    timer = _options['timeout'] and hasattr(signal, 'setitimer')
+    try:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, _options['timeout'])
+        record['format'] = mp4analyser.detect_format(filename)
+        kwargs = {'cache_dir': _options['cache_dir']}
+        if memory_limit:
+            kwargs['progress'] = _memory_check(memory_limit)
+        if _options['profile']:
+            # the whole parse, box_info included, is what is profiled
+            kwargs['profile'] = True
+        elif record['format'] == 'mp4' and not _options['tree']:
+            # only the boxes a summary reads are parsed
+            kwargs['summary_only'] = True
+        container = mp4analyser.open_file(filename, record['format'], **kwargs)
+        if _options['profile']:
+            profile_stats = record['profile'] = container.profile.get_stats()
+        if _options['tree']:
+            to_tree = element_tree if record['format'] == 'mkv' else box_tree
+            record['children'] = [to_tree(child) for child in container.children]
+        else:
+            record['summary'] = container.get_summary()
+        line = json.dumps(record, default=_json_default)
+        if memory_limit and _resident_bytes() > memory_limit:
+            # the line of a whole tree can take as much memory as the tree
+            raise MemoryLimitExceeded()
+        ok = True
+    except FileTimeout:
+        record['error'] = f'timed out after {_options["timeout"]} s'
+    except MemoryLimitExceeded:
+        record['error'] = f'exceeded memory limit of {_options["max_memory"]} MB'
+    except Exception as e:
+        record['error'] = repr(e)
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    if 'error' in record:
+        # drop whatever was parsed before the failure
+        record = {'filename': filename, 'error': record['error']}
+        profile_stats = None
+        ok = False
+    if _log_collector.messages:
+        record['log'] = _log_collector.messages
+        ok = False
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    if ok:
+        # the log messages and time are added to the line already made, rather than dumping the tree again
+        line = line[:-1] + ', "seconds": ' + json.dumps(record['seconds']) + '}'
+    else:
+        line = json.dumps(record, default=_json_default)
+    return line, ok, profile_stats
+
+
+def find_files(paths, extensions=MEDIA_EXTENSIONS):
+    """ yields the files named by paths, which can be files, glob patterns or directories """
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(extensions):
+                        yield os.path.join(dirpath, name)
+        elif any(c in path for c in '*?['):
+            for match in sorted(glob.iglob(path, recursive=True)):
+                if os.path.isdir(match):
+                    yield from find_files([match], extensions)
+                else:
+                    yield match
+        else:
+            yield path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mp4analyser',
+                                     description='Parse MP4 and Matroska files, writing one line of JSON per file.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='file, glob pattern (quote it, ** matches any depth) or directory to search')
+    parser.add_argument('--tree', action='store_true', help='write the whole tree of each file, not its summary')
+    parser.add_argument('-o', '--output', help='file to write to, rather than standard output')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='seconds allowed for each file, 0 for no limit (default: %(default)s)')
+    parser.add_argument('--max-memory', type=int, default=0, metavar='MB',
+                        help='resident memory allowed for each worker, looked at after each MiB of a file is parsed '
+                             'and again once its line is written, so a file can take it over before it is stopped. A '
+                             'file that takes it over fails with "exceeded memory limit". Not a limit on address '
+                             'space. Linux only (default: %(default)s, no limit)')
+    parser.add_argument('--max-tasks-per-worker', type=int, default=100, metavar='N',
+                        help='files parsed by a worker before it is replaced, which returns its memory to the system '
+                             '(default: %(default)s)')
+    parser.add_argument('--cache-dir', help='directory of a parse cache to load files from and store them in')
+    parser.add_argument('--profile', action='store_true',
+                        help='parse each file in full, measuring the parse by box or element type, and write a table '
+                             'of the totals to standard error')
+    parser.add_argument('--ext', action='append', metavar='EXTENSION',
+                        help='extension of the files to parse in directories, can be repeated '
+                             '(default: the usual MP4 and Matroska extensions)')
+    args = parser.parse_args(argv)
+    if args.max_memory and not os.path.exists(STATM_PATH):
+        parser.error('--max-memory is only available on Linux')
+    extensions = tuple(ext.lower() if ext.startswith('.') else '.' + ext.lower() for ext in args.ext) \
+        if args.ext else MEDIA_EXTENSIONS
+    options = {'tree': args.tree, 'timeout': args.timeout, 'max_memory': args.max_memory,
+               'cache_dir': args.cache_dir, 'profile': args.profile}
+    if args.cache_dir:
+        # make the directory before the workers race to
+        os.makedirs(args.cache_dir, exist_ok=True)
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    failures = 0
+    profile_stats = {}
+    if args.profile:
+        from mp4analyser.profiling import format_stats, merge_stats
+    try:
+        files = find_files(args.paths, extensions)
+        if args.jobs <= 1:
+            # in this process, which makes it easier to debug
+            saved_handlers, saved_level = logging.getLogger().handlers, logging.getLogger().level
+            _init_worker(options)
+            try:
+                for filename in files:
+                    line, ok, stats = _process_file(filename)
+                    failures += not ok
+                    output.write(line + '\n')
+                    if stats:
+                        merge_stats(profile_stats, stats)
+            finally:
+                logging.getLogger().handlers = saved_handlers
+                logging.getLogger().setLevel(saved_level)
+        else:
+            # only imported here, as it takes longer to import than parsing a small file takes
+            import multiprocessing
+            with multiprocessing.Pool(args.jobs, _init_worker, (options,),
+                                      maxtasksperchild=args.max_tasks_per_worker or None) as pool:
+                for line, ok, stats in pool.imap_unordered(_process_file, files):
+                    failures += not ok
+                    output.write(line + '\n')
+                    if stats:
+                        merge_stats(profile_stats, stats)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+    if profile_stats:
+        print(format_stats(profile_stats), file=sys.stderr)
+    return 1 if failures else 0
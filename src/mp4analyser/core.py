@@ -5,32 +5,98 @@ that are used as parents for all the real, instantiated boxes. Also contains a h
 import binascii
 import logging
 
+from mp4analyser.source import CancellableFile, ParseCancelled
+from mp4analyser.tables import EntryList
 from mp4analyser.util import *
 
+# the children of every box that has none, shared rather than an empty list per box
+NO_CHILDREN = ()
+
 
 class Mp4Box:
     """
     The superclass for all box classes
 
+    Boxes have __slots__ to keep large trees small. Subclasses declare __slots__ too, listing any attributes of
+    their own, as without it their instances get a __dict__ as well.
     """
+    __slots__ = ('header', 'parent', 'start_of_box', 'children', '_box_info')
+    # In a lazy parse, box_info is only decoded when first accessed. Classes whose __init__ reads child boxes
+    # must set this to False, as the tree has to be complete when the parse finishes.
+    deferrable = True
+
     def __init__(self, fp, header, parent):
         """ the file pointer, fp will at the same position on exit as entry i.e. at the end of the header"""
         self.header = header
         self.parent = parent
         self.start_of_box = fp.tell() - self.header.header_size
-        self.children = []
-        self.box_info = {}
-        self.byte_string = None
-        # only top-level boxes contain an actual byte array for displaying the hex view, lower-level boxes simply
-        # take a slice from the top-level box.
-        if parent.type == 'file':
-            end_of_header = fp.tell()
-            fp.seek(self.start_of_box)
-            if self.type == 'mdat' and self.size > 1000001:
-                self.byte_string = fp.read(1000001)
+        self.children = NO_CHILDREN
+        # the box_info dict is only allocated when the box has something to put in it
+        self._box_info = None
+
+    @classmethod
+    def deferred(cls, fp, header, parent):
+        """
+        Returns a box of this class with only its header, position and, for full boxes, version and flags read.
+        box_info is decoded on first access. The file pointer, fp will be at the end of the box on exit.
+        """
+        box = cls.__new__(cls)
+        (Mp4FullBox if issubclass(cls, Mp4FullBox) else Mp4Box).__init__(box, fp, header, parent)
+        box._box_info = False
+        fp.seek(box.start_of_box + box.size)
+        return box
+
+    @property
+    def box_info(self):
+        # None is an empty box_info, False one that is still to be decoded
+        if self._box_info is None:
+            self._box_info = {}
+        elif self._box_info is False:
+            self._decode_box_info()
+        return self._box_info
+
+    @box_info.setter
+    def box_info(self, new_value):
+        self._box_info = new_value
+
+    def get_box_info(self):
+        """ returns box_info with its entry lists as lists of dicts, e.g. for json.dumps() """
+        return {key: value.to_list() if isinstance(value, EntryList) else value for key, value in self.box_info.items()}
+
+    def _decode_box_info(self):
+        """ runs the full __init__ of a deferred box, reading from the file it was parsed from """
+        mp4file = self.get_file()
+        fp = mp4file._mapping if mp4file._mapping is not None else open(mp4file.filename, 'rb')
+        # the map is shared, and a box can be decoded part way through a parse that reads from it
+        position = fp.tell()
+        # setting the cancel_event of the parse stops decoding too, as it can read a large table
+        reader = fp if mp4file._cancel_event is None else CancellableFile(fp, mp4file._cancel_event)
+        try:
+            reader.seek(self.start_of_box + self.header.header_size)
+            type(self).__init__(self, reader, self.header, self.parent)
+        except ParseCancelled:
+            # left to be decoded when next accessed, rather than with what was read before the cancel
+            self._box_info = False
+            self.children = NO_CHILDREN
+            raise
+        except Exception as e:
+            logging.exception(f'error decoding {self.type} at {self.start_of_box} in {mp4file.filename}')
+        finally:
+            if fp is mp4file._mapping:
+                fp.seek(position)
             else:
-                self.byte_string = fp.read(self.size)
-            fp.seek(end_of_header)
+                fp.close()
+        if self._box_info is None or self._box_info is False:
+            self._box_info = {}
+
+    def add_child(self, box):
+        if self.children is NO_CHILDREN:
+            self.children = []
+        self.children.append(box)
+
+    @property
+    def lazy(self):
+        return self.parent.lazy
 
     @property
     def size(self):
@@ -50,10 +116,21 @@ class Mp4Box:
         else:
             return self.parent.get_top()
 
-    def get_bytes(self):
-        top_box = self.get_top()
-        offset = self.start_of_box - top_box.start_of_box
-        return top_box.byte_string[offset:offset + self.size]
+    def get_file(self):
+        return self.get_top().parent
+
+    def get_bytes(self, max_bytes=None):
+        """
+        returns the bytes of the box, read when asked for via the file's block cache, or at most max_bytes of them.
+        Unless the file is memory-mapped, only the first 1000001 bytes of an mdat are returned.
+        """
+        mp4file = self.get_file()
+        num_bytes = self.size
+        if self.type == 'mdat' and mp4file._mapping is None:
+            num_bytes = min(num_bytes, 1000001)
+        if max_bytes is not None:
+            num_bytes = min(num_bytes, max_bytes)
+        return mp4file.read_bytes(self.start_of_box, num_bytes)
 
     def search_child_boxes_for_type(self, box_type):
         type_matches = []
@@ -71,6 +148,8 @@ class Mp4FullBox(Mp4Box):
     """
     Derived from Mp4Box, but with version and flags.
     """
+    __slots__ = ('version', 'flags')
+
     def __init__(self, fp, header, parent):
         """ The file pointer, fp will move forward 4 bytes """
         super().__init__(fp, header, parent)
@@ -83,9 +162,12 @@ class Header:
     """
     All Mp4Boxes contain a header with size and type information.
      """
-    def __init__(self, fp):
+    __slots__ = ('_size', 'type', '_largesize', 'uuid', 'header_size', 'to_end_of_file', '_size_to_end')
+
+    def __init__(self, fp, top_level=False):
         """
-        The file pointer, fp will be located at the start of the box on entry and at the end of the header on exit
+        The file pointer, fp will be located at the start of the box on entry and at the end of the header on exit.
+        top_level is True for the header of a top-level box, the only box whose size may be 0.
         """
         start_of_box = fp.tell()
         self._size = read_u32(fp)
@@ -99,6 +181,13 @@ class Header:
         if self.type == 'uuid':
             self.uuid = binascii.b2a_hex(fp.read(16)).decode('utf-8', errors="ignore")
         self.header_size = fp.tell() - start_of_box
+        # a size of 0 means the box extends to the end of the file, which is only allowed for the last top-level box
+        self.to_end_of_file = self._size == 0 and top_level
+        if self.to_end_of_file:
+            end_of_header = fp.tell()
+            fp.seek(0, 2)
+            self._size_to_end = fp.tell() - start_of_box
+            fp.seek(end_of_header)
         # throw error if size < 8 as 8 bytes is smallest box (free, skip etc)
         if self.size < 8:
             raise Exception('box size {} should be at least 8 bytes.'
@@ -108,6 +197,8 @@ class Header:
     def size(self):
         if self._size == 1:
             return self._largesize
+        elif self.to_end_of_file:
+            return self._size_to_end
         else:
             return self._size
 
@@ -6,13 +6,23 @@ Additionally a class to represent the MP4 file that contains the MP4 boxes has b
 A box_factory function has also been defined, primarily to minimise coupling between modules.
 
 """
+import array
+import bisect
 import datetime
 import logging
+import math
+import os
 
 import mp4analyser.non_iso
+import mp4analyser.source
 from mp4analyser.core import *
+from mp4analyser.profiling import ParseProfile, ProfiledFile
+from mp4analyser.registry import add_box_classes, get_box_class, register_box_type
 from mp4analyser.util import *
 from mp4analyser.summary import *
+from mp4analyser.samples import TrackSampleIndex, SampleTable, TrackFragmentIndex, \
+    ChunkList, RunList, interleave
+from mp4analyser.tables import EntryList, FormattedColumn, U32, I32, U64
 
 
 # Supported box
@@ -28,129 +38,426 @@ from mp4analyser.summary import *
 # Not supported
 # 'sthd', 'iinf', 'bxml', 'fiin', 'paen', 'fire', 'fpar', 'fecr', 'segr', 'gitn', 'idat'
 
+# the top-level boxes that a summary_only parse parses, see Summary
+SUMMARY_BOX_TYPES = ('ftyp', 'styp', 'moov')
+# the entries of an stsz that StszBox.get_sample_totals() reads at a time, 1 MiB of them
+STSZ_SUM_ENTRIES = 256 * 1024
+
 def box_factory(fp, header, parent):
     """
     box_factory() takes a box type as a parameter and, if a class has been defined for that type, returns
-    an instance of that class.
+    an instance of that class. The class is looked up in the registry of box classes, see registry.py.
     """
-    the_box = None
-    # Normalise header type so it can be expressed in a Python Class name
-    box_type = header.type.replace(" ", "_").replace("-", "_").lower()
-    _box_class = globals().get(
-        box_type.capitalize() + 'Box')  # globals() Return a dictionary representing the current global symbol table
-    if _box_class:
-        the_box = _box_class(fp, header, parent)
-        return the_box
+    box_class = get_box_class(header.type)
+    create = box_class.deferred if parent.lazy and box_class.deferrable else box_class
+    if fp.__class__ is ProfiledFile:
+        return fp.profile.measure(header.type, box_class, create, fp, header, parent)
+    return create(fp, header, parent)
+
+
+def get_track_stbl(trak):
+    """ returns the stbl of trak that holds the sample tables of the track, raises IndexError if it has none """
+    mdia = [box for box in trak.children if box.type == 'mdia'][0]
+    minf = [box for box in mdia.children if box.type == 'minf'][0]
+    return [box for box in minf.children if box.type == 'stbl'][0]
+
+
+def index_track_samples(trak_id, stbl):
+    """ returns the TrackSampleIndex of track trak_id, built from the sample tables in stbl """
+    chunk_offsets = [box for box in stbl.children
+                     if box.type == 'stco' or box.type == 'co64'][0].box_info['entry_list'].column('chunk_offset')
+    sample_size_box = [box for box in stbl.children if box.type == 'stsz' or box.type == 'stz2'][0]
+    if sample_size_box.box_info['sample_size'] > 0:
+        sample_sizes = array.array(U32, [sample_size_box.box_info['sample_size']]) * \
+                       sample_size_box.box_info['sample_count']
     else:
-        return mp4analyser.non_iso.box_factory_non_iso(fp, header, parent)
+        sample_sizes = sample_size_box.box_info['entry_list'].column('entry_size')
+    sample_to_chunks = [box for box in stbl.children if box.type == 'stsc'][0].box_info['entry_list']
+    return TrackSampleIndex(trak_id, chunk_offsets, sample_sizes, sample_to_chunks)
+
+
+class _StblFile:
+    """ stands in for the Mp4File of an stbl box parsed on its own by parse_stbl() """
+    type = 'file'
+    lazy = False
+    _defer_stbl = False
+    _mapping = None
+    _cancel_event = None
+
+    def __init__(self, filename):
+        self.filename = filename
+
+
+def parse_stbl(filename, start_of_box, trak_id=None):
+    """
+    Parses the stbl box at start_of_box in filename, for Mp4File(filename, workers=...) in a worker process or thread.
+    Returns the children of the stbl and, if trak_id is given, the TrackSampleIndex of track trak_id built from them,
+    otherwise None.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start_of_box)
+        stbl = StblBox(f, Header(f), _StblFile(filename))
+    return stbl.children, index_track_samples(trak_id, stbl) if trak_id is not None else None
 
 
 class Mp4File:
     """ Mp4File Class, effectively the top-level container """
-    def __init__(self, filename):
+    # what is taken from a parse loaded from a ParseCache, the rest of the state belongs to each opening of the file
+    _parse_results = ('children', 'summary', '_samples_generated', 'sample_index', 'fragment_index', '_file_size',
+                      '_chunk_list', '_chunk_offsets', '_next_mdat_child', '_next_moof_child', '_fragment_tracks',
+                      '_fragment_checkpoint')
+
+    def __init__(self, filename, use_mmap=False, lazy=False, cache_size=16 * 1024 * 1024, cache_dir=None,
+                 profile=False, summary_only=False, cancel_event=None, workers=None, progress=None):
+        """
+        If use_mmap is True the file is memory-mapped and parsed from the map, and byte ranges returned by
+        get_bytes() and read_bytes() are zero-copy memoryview slices of it. Call close() to release the map.
+        Otherwise, byte ranges are read from the file when asked for and the 64 KiB blocks they span are kept in a
+        least recently used cache of at most cache_size bytes, so asking again for a box or sample reads nothing.
+        If lazy is True, the parse only builds the box tree, each box's box_info is decoded on first access and
+        the media samples in mdats are identified when a sample_list is first used.
+        The samples of each track of a non-fragmented file are indexed in sample_index, a dict of
+        TrackSampleIndex keyed by track_ID, once get_sample_index() or a sample_list has been used, and those of a
+        fragmented file in fragment_index, a dict of TrackFragmentIndex, once get_fragment_index() has been used.
+        If cache_dir, a directory or a ParseCache, is given, the parsed file is loaded from the cache if it was
+        stored there when the file was last parsed and the file hasn't changed since, and stored there if not.
+        If profile is True, the parse is measured by box type in profile, a ParseProfile, see profiling.py, and the
+        file is parsed even if it is in the parse cache.
+        If summary_only is True, only what get_summary() needs is parsed, which makes it much quicker for a large or
+        fragmented file. The parse is lazy and of the top-level boxes, only the ftyp, styp and moov are parsed, the
+        others are skipped over, each with its header read and its box_info decoded on first access. Samples are not
+        identified, so sample_list, get_sample_index() and get_fragment_index() have nothing to return.
+        If cancel_event, a threading.Event, is given, setting it from another thread stops the parse at its next read
+        of the file, and ParseCancelled, see source.py, is raised.
+        If workers, a number of worker processes or a concurrent.futures.Executor, is given, the parse skips over the
+        stbl box of each track, which holds its sample tables, and the stbl boxes are parsed and the samples of their
+        tracks indexed by the workers, in parallel. That only pays off for tracks of large sample tables on several
+        cores, as the tables are copied back from the processes, see the README. No more processes are started than
+        there are cores. workers is ignored by a lazy or profiled parse.
+        If progress, a callable, is given, it is called from the thread parsing the file with the number of bytes of
+        the file parsed so far and the top-level box just parsed, or None as the parse moves on through a large box,
+        so a user interface can show the boxes of a large file as they are parsed, see ProgressFile in source.py.
+        """
         self.filename = filename
         self.type = 'file'
+        self.lazy = lazy or summary_only
+        self.summary_only = summary_only
+        self.profile = ParseProfile() if profile else None
+        self._cancel_event = cancel_event
+        self._progress = progress
         self.children = []
         self.summary= {}
+        self._mapping = None
+        self._block_cache = mp4analyser.source.BlockCache(filename, cache_size)
+        self._samples_generated = False
+        self.sample_index = {}
+        self.fragment_index = {}
+        self._sample_tables = {}
+        # state that lets refresh() and generate_samples() carry on from where they last stopped
+        self._file_size = 0
+        self._chunk_list = None
+        self._chunk_offsets = None
+        self._next_mdat_child = 0
+        self._next_moof_child = 0
+        self._fragment_tracks = []
+        self._fragment_checkpoint = None
+        # True while the parse skips over stbl boxes, for workers to parse them
+        self._defer_stbl = False
+        # the sample indexes built by the workers, keyed by stbl, until generate_samples() takes them
+        self._stbl_indexes = {}
+        parse_cache = None
+        if cache_dir is not None:
+            # not imported until needed, as it imports more of the standard library than parsing does
+            from mp4analyser.cache import get_parse_cache
+            parse_cache = get_parse_cache(cache_dir)
+        try:
+            if use_mmap:
+                self._mapping = mp4analyser.source.map_file(filename)
+            if parse_cache is not None:
+                cache_key = parse_cache.key(filename, 'summary' if summary_only else 'lazy' if lazy else '')
+                cached = parse_cache.load(cache_key) if self.profile is None else None
+                if cached is not None:
+                    for name in self._parse_results:
+                        setattr(self, name, getattr(cached, name))
+                    for box in self.children:
+                        box.parent = self
+                    return
+            f = self._mapping if self._mapping is not None else open(filename, 'rb')
+            if isinstance(workers, int) and workers > (os.cpu_count() or 1):
+                # more processes than cores only adds the cost of copying the tables back from them, and on a single
+                # core none are started
+                workers = os.cpu_count() or 1
+            if workers == 1:
+                workers = None
+            self._defer_stbl = bool(workers) and not self.lazy and self.profile is None
+            try:
+                self._file_size = len(f) if f is self._mapping else os.fstat(f.fileno()).st_size
+                self._parse_boxes(f)
+            finally:
+                self._defer_stbl = False
+                if f is not self._mapping:
+                    f.close()
+            if not self.lazy:
+                if workers and self.profile is None:
+                    self._parse_stbls_in_workers(workers)
+                self.generate_samples()
+            if parse_cache is not None:
+                parse_cache.store(cache_key, self)
+        except Exception as e:
+            # catch exception in case we can continue
+            logging.exception(f'error in {filename} after child {len(self.children)}')
+
+    def __getstate__(self):
+        # what is pickled for a ParseCache, the name, memory map, block cache and profile belong to each opening of
+        # the file
+        state = self.__dict__.copy()
+        for name in ('filename', '_mapping', '_block_cache'):
+            del state[name]
+        state['profile'] = None
+        state['_cancel_event'] = None
+        state['_progress'] = None
+        return state
+
+    def _parse_boxes(self, f, complete_only=False):
+        """
+        parse top-level boxes from the current position of f to the end of the file, or if complete_only is True,
+        up to the first box that has not been completely written yet
+        """
+        if self._cancel_event is not None:
+            f = mp4analyser.source.CancellableFile(f, self._cancel_event)
+        if self._progress is not None:
+            f = mp4analyser.source.ProgressFile(f, self._progress)
+        if self.profile is not None:
+            f = ProfiledFile(f, self.profile)
+        end_of_file = False
+        while not end_of_file:
+            if complete_only and not self._next_box_is_complete(f):
+                break
+            current_header = Header(f, top_level=True)
+            if self.summary_only and current_header.type not in SUMMARY_BOX_TYPES:
+                # skipped over, whatever its class, without its children being parsed
+                current_box = get_box_class(current_header.type).deferred(f, current_header, self)
+            else:
+                current_box = box_factory(f, current_header, self)
+            self.children.append(current_box)
+            if self._progress is not None:
+                self._progress(current_box.start_of_box + current_box.size, current_box)
+            if current_box.header.to_end_of_file:
+                end_of_file = True
+            if len(f.read(4)) != 4:
+                end_of_file = True
+            else:
+                f.seek(-4, 1)
+
+    def _next_box_is_complete(self, f):
+        """ peeks at the header of the box at the current position of f, returns True if all the box is in the file """
+        start_of_box = f.tell()
+        bytes_left = self._file_size - start_of_box
+        if bytes_left < 8:
+            return False
+        size = read_u32(f)
+        if size == 1 and bytes_left >= 16:
+            f.seek(4, 1)
+            size = read_u64(f)
+        f.seek(start_of_box)
+        # a size of 0 means the box extends to the end of the file, which a growing file doesn't have yet
+        return 8 <= size <= bytes_left
+
+    def _is_complete(self, box):
+        return not box.header.to_end_of_file and box.start_of_box + box.size <= self._file_size
+
+    def refresh(self):
+        """
+        For a file that is still being written, such as the output of a live packager, parses only the top-level
+        boxes that have been completely written since the file was last parsed, typically new moof/mdat pairs,
+        along with a last box that was incomplete then. The sample and fragment indexes are extended with just the
+        samples of the new boxes and the summary is recomputed when next used. Returns the list of new top-level boxes.
+        """
+        if self.children and not self._is_complete(self.children[-1]):
+            self.children.pop()
+            self._next_mdat_child = min(self._next_mdat_child, len(self.children))
+        first_new_child = len(self.children)
+        try:
+            if self._mapping is not None:
+                # views handed out of the old map keep it alive until they are released
+                self._mapping = mp4analyser.source.map_file(self.filename)
+            f = self._mapping if self._mapping is not None else open(self.filename, 'rb')
+            try:
+                self._file_size = len(f) if f is self._mapping else os.fstat(f.fileno()).st_size
+                if self.children:
+                    f.seek(self.children[-1].start_of_box + self.children[-1].size)
+                self._parse_boxes(f, complete_only=True)
+            finally:
+                if f is not self._mapping:
+                    f.close()
+        except Exception as e:
+            logging.exception(f'error refreshing {self.filename} after child {len(self.children)}')
+        self.summary = {}
+        self._samples_generated = False
+        if not self.lazy:
+            self.generate_samples()
+        return self.children[first_new_child:]
+
+    def generate_samples(self):
+        """
+        identify media samples in mdats, only does anything the first time it is called, or the first time after
+        refresh() when only the new boxes are looked at
+        """
+        if self._samples_generated or self.summary_only:
+            return
+        self._samples_generated = True
         try:
-            with open(filename, 'rb') as f:
-                end_of_file = False
-                while not end_of_file:
-                    current_header = Header(f)
-                    current_box = box_factory(f, current_header, self)
-                    self.children.append(current_box)
-                    if current_box.size == 0:
-                        end_of_file = True
-                    if len(f.read(4)) != 4:
-                        end_of_file = True
-                    else:
-                        f.seek(-4, 1)
-            f.close()
             self._generate_samples_from_moov()
             self._generate_samples_from_moofs()
         except Exception as e:
-            # catch exception in case we can continue
-            logging.exception(f'error in {filename} after child {len(self.children)}')
+            logging.exception(f'error generating samples in {self.filename}')
+
+    def get_sample_index(self):
+        """ returns sample_index, a dict of TrackSampleIndex keyed by track_ID """
+        self.generate_samples()
+        return self.sample_index
+
+    def get_fragment_index(self):
+        """ returns fragment_index, a dict of TrackFragmentIndex keyed by track_ID """
+        self.generate_samples()
+        return self.fragment_index
+
+    def get_sample(self, track_ID, sample_number):
+        """
+        Returns a dict describing sample sample_number (1-based) of track track_ID of a non-fragmented file: offset,
+        size, decode_time, composition_time, is_sync and sample_description_index. The sample is looked up in the
+        track's sample tables in O(log n) time, without the samples of the file being indexed.
+        """
+        return self._get_sample_table(track_ID).get_sample(sample_number)
+
+    def _get_sample_table(self, track_ID):
+        if track_ID not in self._sample_tables:
+            moov = [box for box in self.children if box.type == 'moov'][0]
+            for trak in [tbox for tbox in moov.children if tbox.type == 'trak']:
+                if [box for box in trak.children if box.type == 'tkhd'][0].box_info['track_ID'] == track_ID:
+                    stbl = trak.search_child_boxes_for_type('stbl')[0]
+                    timescale = trak.search_child_boxes_for_type('mdhd')[0].box_info['timescale']
+                    self._sample_tables[track_ID] = SampleTable(track_ID, stbl, timescale)
+                    break
+            else:
+                raise KeyError(f'no track with track_ID {track_ID}')
+        return self._sample_tables[track_ID]
 
     def _generate_samples_from_moov(self):
         """ identify media samples in mdat for full mp4 file """
-        mdats = [mbox for mbox in self.children if mbox.type == 'mdat']
         # generate a sample list if there is a moov that contains traks N.B only ever 0,1 moov boxes
-        if [box for box in self.children if box.type == 'moov']:
+        if self._chunk_list is None and [box for box in self.children if box.type == 'moov']:
             moov = [box for box in self.children if box.type == 'moov'][0]
             traks = [tbox for tbox in moov.children if tbox.type == 'trak']
-            sample_list = []
+            tracks = []
             for trak in traks:
                 trak_id = [box for box in trak.children if box.type == 'tkhd'][0].box_info['track_ID']
-                timescale = [box for box in [box for box in trak.children
-                                             if box.type == 'mdia'][0].children
-                             if box.type == 'mdhd'][0].box_info['timescale']
-                samplebox = [box for box in [box for box in [box for box in trak.children
-                                                             if box.type == 'mdia'][0].children
-                                             if box.type == 'minf'][0].children
-                             if box.type == 'stbl'][0]
-                chunk_offsets = [box for box in samplebox.children
-                                 if box.type == 'stco' or box.type == 'co64'][0].box_info['entry_list']
-                sample_size_box = [box for box in samplebox.children if box.type == 'stsz' or box.type == 'stz2'][0]
-                if sample_size_box.box_info['sample_size'] > 0:
-                    sample_sizes = [{'entry_size': sample_size_box.box_info['sample_size']}
-                                    for i in range(sample_size_box.box_info['sample_count'])]
-                else:
-                    sample_sizes = sample_size_box.box_info['entry_list']
-                sample_to_chunks = [box for box in samplebox.children
-                                    if box.type == 'stsc'][0].box_info['entry_list']
-                s2c_index = 0
-                next_run = 0
-                sample_idx = 0
-                for i, chunk in enumerate(chunk_offsets, 1):
-                    if i >= next_run:
-                        samples_per_chunk = sample_to_chunks[s2c_index]['samples_per_chunk']
-                        s2c_index += 1
-                        next_run = sample_to_chunks[s2c_index]['first_chunk'] \
-                            if s2c_index < len(sample_to_chunks) else len(chunk_offsets) + 1
-                    chunk_dict = {'track_ID': trak_id,
-                                  'chunk_ID': i,
-                                  'chunk_offset': chunk['chunk_offset'],
-                                  'samples_per_chunk': samples_per_chunk,
-                                  'chunk_samples': []
-                                  }
-                    sample_offset = chunk['chunk_offset']
-                    for j, sample in enumerate(sample_sizes[sample_idx:sample_idx + samples_per_chunk], sample_idx + 1):
-                        chunk_dict['chunk_samples'].append({
-                            'sample_ID': j,
-                            'size': sample['entry_size'],
-                            'offset': sample_offset
-                        })
-                        sample_offset += sample['entry_size']
-                    sample_list.append(chunk_dict)
-                    sample_idx += samples_per_chunk
-            # sample_list could be empty, say, for mpeg-dash initialization segment
-            if sample_list:
-                # sort by chunk offset to get interleaved list
-                sample_list.sort(key=lambda k: k['chunk_offset'])
-                for mdat in mdats:
-                    mdat_sample_list = [sample for sample in sample_list if
-                                        mdat.start_of_box < sample['chunk_offset'] < (mdat.start_of_box + mdat.size)]
-                    if len(mdat_sample_list):
-                        mdat.box_info['message'] = 'Has samples.'
-                    mdat.sample_list = mdat_sample_list
+                stbl = get_track_stbl(trak)
+                # the index may have been built by a worker already
+                track = self._stbl_indexes.pop(stbl, None)
+                tracks.append(track if track is not None else index_track_samples(trak_id, stbl))
+                self.sample_index[trak_id] = tracks[-1]
+            # sort by chunk offset to get interleaved list, which could be empty, say, for mpeg-dash initialization
+            # segment
+            self._chunk_list, self._chunk_offsets = interleave(tracks)
+            self._next_mdat_child = 0
+        if self._chunk_list is not None:
+            # after a refresh(), only mdats that are new need samples
+            for mdat in [mbox for mbox in self.children[self._next_mdat_child:] if mbox.type == 'mdat']:
+                # the chunks in an mdat are a contiguous slice of the sorted list
+                first = bisect.bisect_right(self._chunk_offsets, mdat.start_of_box)
+                last = bisect.bisect_left(self._chunk_offsets, mdat.start_of_box + mdat.size, first)
+                if last > first:
+                    mdat.box_info['message'] = 'Has samples.'
+                    mdat.sample_list = ChunkList(self._chunk_list.tracks, self._chunk_list.track_positions[first:last],
+                                                 self._chunk_list.chunk_indexes[first:last])
+        self._next_mdat_child = len(self.children)
+
+    def _parse_stbls_in_workers(self, workers):
+        """
+        parses the stbl boxes that the parse skipped over in workers, a number of processes or an Executor, along with
+        the sample index of each track. No more processes are started than there are stbls. A lone stbl, and any that a
+        worker fails to parse, are parsed here instead.
+        """
+        # the stbls to parse, each with the track_ID of the track that it holds the samples of, None if it doesn't
+        stbls = {}
+        for moov in [box for box in self.children if box.type == 'moov']:
+            for trak in [box for box in moov.children if box.type == 'trak']:
+                tkhd = [box for box in trak.children if box.type == 'tkhd']
+                try:
+                    track_stbl = get_track_stbl(trak)
+                except IndexError:
+                    track_stbl = None
+                for stbl in trak.search_child_boxes_for_type('stbl'):
+                    if stbl._box_info is False:
+                        stbls[stbl] = tkhd[0].box_info['track_ID'] if stbl is track_stbl and tkhd else None
+        if len(stbls) > 1:
+            if isinstance(workers, int):
+                # not imported until needed, as it imports more of the standard library than parsing does
+                import concurrent.futures
+                executor = concurrent.futures.ProcessPoolExecutor(min(workers, len(stbls)))
+            else:
+                executor = workers
+            try:
+                futures = {stbl: executor.submit(parse_stbl, self.filename, stbl.start_of_box, trak_id)
+                           for stbl, trak_id in stbls.items()}
+                for stbl, future in futures.items():
+                    try:
+                        children, track = future.result()
+                    except Exception as e:
+                        logging.exception(f'error parsing stbl at {stbl.start_of_box} in {self.filename} in a worker')
+                        continue
+                    stbl.children = children
+                    for box in children:
+                        box.parent = stbl
+                    stbl.box_info = None
+                    if track is not None:
+                        self._stbl_indexes[stbl] = track
+            finally:
+                if executor is not workers:
+                    executor.shutdown()
+        for stbl in stbls:
+            if stbl._box_info is False:
+                stbl._decode_box_info()
 
     def _generate_samples_from_moofs(self):
         """
         generate samples within mdats of media segments for fragmented mp4 files
         media segments are 1 moof (optionally preceded by an styp) followed by 1 or more contiguous mdats
         I've only ever seen 1 mdat in a media segment though
+        The samples of each track are indexed in fragment_index in a single pass over the moofs
         """
-        i = 0
+        trex_defaults = {}
+        for moov in [box for box in self.children if box.type == 'moov']:
+            for mvex in [box for box in moov.children if box.type == 'mvex']:
+                for trex in [box for box in mvex.children if box.type == 'trex']:
+                    trex_defaults[trex.box_info['track_ID']] = trex.box_info
+        if self._fragment_checkpoint is not None:
+            # the last media segment looked at ran to the end of a file that was being written, so look at it again
+            for track in self._fragment_tracks:
+                track.truncate(*self._fragment_checkpoint.get(track.track_ID, (0, 0)))
+            self._fragment_checkpoint = None
+        tracks = self._fragment_tracks
+        track_positions = {track.track_ID: position for position, track in enumerate(tracks)}
+        mdat_runs = {}
+        # after a refresh(), carry on from the first moof not yet looked at
+        i = resume_at = self._next_moof_child
         while i < len(self.children) - 1:
             if self.children[i].type == 'moof':
                 moof = self.children[i]
+                moof_child = i
                 media_segment = {'moof_box': moof, 'mdat_boxes': []}
                 sequence_number = [mfhd for mfhd in moof.children
                                    if mfhd.type == 'mfhd'][0].box_info['sequence_number']
                 while i < len(self.children) - 1 and self.children[i + 1].type == 'mdat':
                     media_segment['mdat_boxes'].append(self.children[i + 1])
                     i += 1
+                if not self._is_complete(self.children[i]):
+                    # refresh() will parse the last mdat again, so note the state of the index before the segment
+                    self._fragment_checkpoint = {track.track_ID: (track.run_count(), track.next_decode_time)
+                                                 for track in tracks}
+                    resume_at = moof_child
+                mdat_starts = [mdat.start_of_box for mdat in media_segment['mdat_boxes']]
                 # I've only ever seen 1 traf in a moof, but the standard says there could be more
                 data_offset = 0
                 for j,traf in enumerate([tbox for tbox in moof.children if tbox.type == 'traf']):
@@ -159,53 +466,135 @@ class Mp4File:
                     trak_id = tfhd.box_info['track_id']
                     if 'base_data_offset' in tfhd.box_info:
                         data_offset = tfhd.box_info['base_data_offset']
-                    elif tfhd.box_info['default_base_is_moof']:
+                    elif tfhd.box_info['default_base_is_moof'] or j == 0:
                         data_offset = media_segment['moof_box'].start_of_box
-                    elif j > 0:
-                        # according to spec. should be set end of data for last fragment
-                        pass
-                    else:
-                        base_data_offset = media_segment['moof_box'].start_of_box
+                    # otherwise, according to spec. the base is the end of data for the last track fragment
+                    base_data_offset = data_offset
+                    # a default not given by tfhd is given by the trex for the track
+                    trex = trex_defaults.get(trak_id, {})
+                    default_duration = tfhd.box_info.get('default_sample_duration',
+                                                         trex.get('default_sample_duration', 0))
+                    default_size = tfhd.box_info.get('default_sample_size', trex.get('default_sample_size', 0))
+                    default_flags = int(tfhd.box_info.get('default_sample_flags',
+                                                          trex.get('default_sample_flags', '0')), 16)
+                    sample_description_index = tfhd.box_info.get('sample_description_index',
+                                                                 trex.get('default_sample_description_index', 0))
+                    tfdt = [dbox for dbox in traf.children if dbox.type == 'tfdt']
+                    decode_time = tfdt[0].box_info['baseMediaDecode'] if tfdt else None
+                    if trak_id not in self.fragment_index:
+                        self.fragment_index[trak_id] = TrackFragmentIndex(trak_id)
+                        track_positions[trak_id] = len(tracks)
+                        tracks.append(self.fragment_index[trak_id])
+                    track = self.fragment_index[trak_id]
                     for k, trun in enumerate([rbox for rbox in traf.children if rbox.type == 'trun'], 1):
                         if 'data_offset' in trun.box_info:
-                            data_offset += trun.box_info['data_offset']
-                        run_dict = {'sequence_number': sequence_number,
-                                    'track_ID': trak_id,
-                                    'run_ID': k,
-                                    'run_offset': data_offset,
-                                    'sample_count': trun.box_info['sample_count'],
-                                    'run_samples': []
-                                    }
-                        has_sample_size = True if trun.flags & 0x0200 == 0x0200 else False
-                        for l, sample in enumerate(trun.box_info['samples'], 1):
-                            if not has_sample_size:
-                                sample_size = tfhd.box_info['default_sample_size']
-                            else:
-                                sample_size = sample['sample_size']
-                            run_dict['run_samples'].append({'sample_ID': l,
-                                                            'size': sample_size,
-                                                            'offset': data_offset
-                                                            })
-                            data_offset += sample_size
-                        for mdat in media_segment['mdat_boxes']:
-                            if mdat.start_of_box < run_dict['run_offset'] and (mdat.start_of_box
-                                                                               + mdat.size) >= data_offset:
+                            data_offset = base_data_offset + trun.box_info['data_offset']
+                        run_offset = data_offset
+                        sample_count = trun.box_info['sample_count']
+                        samples = trun.box_info['samples']
+                        columns = samples.fields if isinstance(samples, EntryList) else {}
+                        durations = columns.get('sample_duration', array.array(U32, [default_duration]) * sample_count)
+                        sizes = columns.get('sample_size', array.array(U32, [default_size]) * sample_count)
+                        if 'sample_flags' in columns:
+                            flags = columns['sample_flags'].values
+                        else:
+                            flags = array.array(U32, [default_flags]) * sample_count
+                            if 'first_sample_flags' in trun.box_info and sample_count:
+                                flags[0] = int(trun.box_info['first_sample_flags'], 16)
+                        composition_offsets = array.array(I32, columns['sample_composition_time_offset'].tobytes()) \
+                            if 'sample_composition_time_offset' in columns else array.array(I32, [0]) * sample_count
+                        track.add_run(sequence_number, k, run_offset, decode_time, sample_description_index,
+                                      durations, sizes, flags, composition_offsets)
+                        decode_time = None
+                        data_offset += sum(sizes)
+                        # the only mdat that can hold the run is the last to start before it
+                        m = bisect.bisect_left(mdat_starts, run_offset) - 1
+                        if m >= 0:
+                            mdat = media_segment['mdat_boxes'][m]
+                            if (mdat.start_of_box + mdat.size) >= data_offset:
                                 mdat.box_info['message'] = 'Has samples.'
-                                mdat.sample_list.append(run_dict)
+                                if mdat.start_of_box not in mdat_runs:
+                                    mdat_runs[mdat.start_of_box] = (mdat, array.array('H'), array.array(U32))
+                                mdat_runs[mdat.start_of_box][1].append(track_positions[trak_id])
+                                mdat_runs[mdat.start_of_box][2].append(track.run_count() - 1)
             i += 1
+            if self._fragment_checkpoint is None:
+                resume_at = i
+        self._next_moof_child = resume_at
+        for mdat, mdat_track_positions, run_indexes in mdat_runs.values():
+            mdat.sample_list = RunList(tracks, mdat_track_positions, run_indexes)
 
     def read_bytes(self, offset, num_bytes):
-        with open(self.filename, 'rb') as f:
-            f.seek(offset)
-            bytes_read = f.read(num_bytes)
-        f.close()
-        return bytes_read
+        if self._mapping is not None:
+            return self._mapping.view(offset, num_bytes)
+        return self._block_cache.read(offset, num_bytes)
+
+    def close(self):
+        """
+        Releases the memory map, if any, and the block cache. If slices handed out by get_bytes() or read_bytes()
+        are still referenced, the map is only unmapped once they are released.
+        """
+        self._block_cache.clear()
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:
+                # memoryview slices are still held, the map is released when the last of them is
+                pass
+            self._mapping = None
+
+    @staticmethod
+    def scan(filename):
+        """
+        Returns an inventory of the top-level boxes of filename, without parsing them: a list of dicts with the type,
+        start_of_box, size and header of each box. It hops from header to header, reading no payloads, so takes
+        much the same time for a file of any size.
+        """
+        inventory = []
+        # a small buffer, as only a header is read after each seek
+        with open(filename, 'rb', buffering=64) as f:
+            file_size = os.fstat(f.fileno()).st_size
+            start_of_box = 0
+            try:
+                while file_size - start_of_box >= 8:
+                    header = Header(f, top_level=True)
+                    inventory.append({'type': header.type,
+                                      'start_of_box': start_of_box,
+                                      'size': header.size,
+                                      'header': header.get_header()
+                                      })
+                    start_of_box += header.size
+                    f.seek(start_of_box)
+            except Exception as e:
+                logging.exception(f'error in {filename} after child {len(inventory)}')
+        return inventory
 
     def get_summary(self):
         if not self.summary:
             self.summary = Summary(self)
         return self.summary.data
 
+    def find_sample_at_time(self, track_ID, seconds):
+        """
+        For trick-play and clipping, returns {'sample': ..., 'sync_sample': ...}, the get_sample() dicts of the sample
+        of track track_ID presented at seconds into the media, and of the sync sample at or before it and presented by
+        then (None if there isn't one, and both None if no sample is presented that early). Times are on the track's
+        media timeline, edit lists are not applied. Both samples are found by binary search of the stts, ctts and stss
+        tables, without per-sample timestamps being expanded.
+        """
+        sample_table = self._get_sample_table(track_ID)
+        media_time = seconds * sample_table.timescale
+        # a time on a sample boundary can fall just short of it in floating point e.g. 0.29 * 100 is 28.999...
+        nearest = round(media_time)
+        media_time = nearest if math.isclose(media_time, nearest, rel_tol=1e-12) else math.floor(media_time)
+        sample_number = sample_table.find_sample_at_time(media_time)
+        if sample_number is None:
+            return {'sample': None, 'sync_sample': None}
+        sync_sample_number = sample_table.find_sync_sample(sample_number, media_time)
+        return {'sample': sample_table.get_sample(sample_number),
+                'sync_sample': sample_table.get_sample(sync_sample_number) if sync_sample_number else None
+                }
+
     def search_boxes_for_type(self, box_type):
         type_matches = []
         for box in self.children:
@@ -218,6 +607,7 @@ class Mp4File:
 
 
 class FreeBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -231,6 +621,7 @@ SkipBox = FreeBox
 
 
 class FtypBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -252,6 +643,7 @@ StypBox = FtypBox
 
 
 class ColrBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -267,6 +659,7 @@ class ColrBox(Mp4Box):
 
 
 class PdinBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -280,6 +673,8 @@ class PdinBox(Mp4FullBox):
 
 
 class ContainerBox(Mp4Box):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -288,7 +683,7 @@ class ContainerBox(Mp4Box):
             while bytes_left > 7:
                 current_header = Header(fp)
                 current_box = box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
@@ -304,6 +699,9 @@ class MetaBox(Mp4Box):
     """
     Seems to be a discrepancy between Apple atom spec and ISO about whether this is a versioned box
     """
+    __slots__ = ('version', 'flags')
+    deferrable = False
+
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
@@ -322,24 +720,54 @@ class MetaBox(Mp4Box):
             while bytes_left > 7:
                 current_header = Header(fp)
                 current_box = box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class MdatBox(Mp4Box):
+    __slots__ = ('_sample_list',)
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         self.sample_list = []
         try:
-            self.box_info['message'] = 'No samples found.'
+            # not through box_info, as samples can't be identified until the parse is done
+            self._box_info = {'message': 'No samples found.'}
         finally:
             fp.seek(self.start_of_box + self.size)
 
+    @classmethod
+    def deferred(cls, fp, header, parent):
+        box = super().deferred(fp, header, parent)
+        box.sample_list = []
+        return box
+
+    @property
+    def box_info(self):
+        # its message says whether the mdat has samples, which a lazily parsed file only knows once they are identified
+        self.get_file().generate_samples()
+        return Mp4Box.box_info.fget(self)
+
+    @box_info.setter
+    def box_info(self, new_value):
+        self._box_info = new_value
+
+    @property
+    def sample_list(self):
+        # a lazily parsed file only identifies samples when they are first needed
+        self.get_file().generate_samples()
+        return self._sample_list
+
+    @sample_list.setter
+    def sample_list(self, new_value):
+        self._sample_list = new_value
+
 
 class MvhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -370,6 +798,7 @@ class MvhdBox(Mp4FullBox):
 
 
 class MfhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -380,6 +809,7 @@ class MfhdBox(Mp4FullBox):
 
 
 class MehdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -393,6 +823,7 @@ class MehdBox(Mp4FullBox):
 
 
 class ElstBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -419,6 +850,7 @@ class ElstBox(Mp4FullBox):
 
 
 class TkhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -453,6 +885,7 @@ class TkhdBox(Mp4FullBox):
 
 
 class TfhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -476,6 +909,7 @@ class TfhdBox(Mp4FullBox):
 
 
 class TrexBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -490,6 +924,7 @@ class TrexBox(Mp4FullBox):
 
 
 class LevaBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -514,6 +949,7 @@ class LevaBox(Mp4FullBox):
 
 
 class TfraBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -524,39 +960,23 @@ class TfraBox(Mp4FullBox):
             self.box_info['length_size_of_trun_num'] = length_fields >> 2 & 3
             self.box_info['length_size_of_sample_num'] = length_fields & 3
             self.box_info['number_of_entry'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['number_of_entry']):
-                entry_dict = {}
-                if self.version == 1:
-                    entry_dict['time'] = read_u64(fp)
-                    entry_dict['moof_offset'] = read_u64(fp)
-                else:
-                    entry_dict['time'] = read_u32(fp)
-                    entry_dict['moof_offset'] = read_u32(fp)
-                if self.box_info['length_size_of_traf_num'] == 0:
-                    entry_dict['traf_number'] = read_u8(fp)
-                elif self.box_info['length_size_of_traf_num'] == 1:
-                    entry_dict['traf_number'] = read_u16(fp)
-                elif self.box_info['length_size_of_traf_num'] == 3:
-                    entry_dict['traf_number'] = read_u32(fp)
-                if self.box_info['length_size_of_trun_num'] == 0:
-                    entry_dict['trun_number'] = read_u8(fp)
-                elif self.box_info['length_size_of_trun_num'] == 1:
-                    entry_dict['trun_number'] = read_u16(fp)
-                elif self.box_info['length_size_of_trun_num'] == 3:
-                    entry_dict['trun_number'] = read_u32(fp)
-                if self.box_info['length_size_of_sample_num'] == 0:
-                    entry_dict['sample_number'] = read_u8(fp)
-                elif self.box_info['length_size_of_sample_num'] == 1:
-                    entry_dict['sample_number'] = read_u16(fp)
-                elif self.box_info['length_size_of_sample_num'] == 3:
-                    entry_dict['sample_number'] = read_u32(fp)
-                self.box_info['entry_list'].append(entry_dict)
+            # build a struct format for one entry, so the whole table can be unpacked from a single read
+            entry_format = '>QQ' if self.version == 1 else '>II'
+            field_names = ['time', 'moof_offset']
+            for field_name, length_size in [('traf_number', self.box_info['length_size_of_traf_num']),
+                                            ('trun_number', self.box_info['length_size_of_trun_num']),
+                                            ('sample_number', self.box_info['length_size_of_sample_num'])]:
+                if length_size in (0, 1, 3):
+                    entry_format += {0: 'B', 1: 'H', 3: 'I'}[length_size]
+                    field_names.append(field_name)
+            self.box_info['entry_list'] = [dict(zip(field_names, entry)) for entry in read_structs(
+                fp, entry_format, self.box_info['number_of_entry'], self.start_of_box + self.size)]
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class MfroBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -567,6 +987,7 @@ class MfroBox(Mp4FullBox):
 
 
 class CprtBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -587,6 +1008,7 @@ class CprtBox(Mp4FullBox):
 
 
 class TselBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -603,6 +1025,7 @@ class TselBox(Mp4FullBox):
 
 
 class StriBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -621,6 +1044,7 @@ class StriBox(Mp4FullBox):
 
 
 class IlocBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -674,6 +1098,8 @@ class IlocBox(Mp4FullBox):
 
 
 class IproBox(Mp4FullBox):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -682,12 +1108,13 @@ class IproBox(Mp4FullBox):
             for i in range(self.box_info['protection_count']):
                 current_header = Header(fp)
                 current_box = box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class FrmaBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -698,6 +1125,7 @@ class FrmaBox(Mp4Box):
 
 
 class SchmBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -711,6 +1139,7 @@ class SchmBox(Mp4FullBox):
 
 
 class Xml_Box(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -721,6 +1150,7 @@ class Xml_Box(Mp4FullBox):
 
 
 class PitmBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -735,6 +1165,8 @@ class PitmBox(Mp4FullBox):
 
 # This is just a versioned container box
 class IrefBox(Mp4FullBox):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -743,13 +1175,14 @@ class IrefBox(Mp4FullBox):
             while bytes_left > 7:
                 current_header = Header(fp)
                 current_box = box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class MereBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -762,6 +1195,7 @@ class MereBox(Mp4FullBox):
 
 
 class TrunBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -771,31 +1205,29 @@ class TrunBox(Mp4FullBox):
                 self.box_info['data_offset'] = read_i32(fp)
             if self.flags & 0x000004 == 0x000004:
                 self.box_info['first_sample_flags'] = f"{read_u32(fp):#08x}"
-            has_sample_duration = True if self.flags & 0x000100 == 0x000100 else False
-            has_sample_size = True if self.flags & 0x000200 == 0x000200 else False
-            has_sample_flags = True if self.flags & 0x000400 == 0x000400 else False
-            has_scto = True if self.flags & 0x000800 == 0x000800 else False
-            sample_list = []
-            for i in range(self.box_info['sample_count']):
-                sample = {}
-                if has_sample_duration:
-                    sample['sample_duration'] = read_u32(fp)
-                if has_sample_size:
-                    sample['sample_size'] = read_u32(fp)
-                if has_sample_flags:
-                    sample['sample_flags'] = f"{read_u32(fp):#08x}"
-                if has_scto:
-                    if self.version == 1:
-                        sample['sample_composition_time_offset'] = read_i32(fp)
-                    else:
-                        sample['sample_composition_time_offset'] = read_u32(fp)
-                sample_list.append(sample)
-            self.box_info['samples'] = sample_list
+            # the fields present for each sample, in order, with the typecode they are held in
+            fields = [(field_name, typecode) for flag, field_name, typecode in
+                      [(0x000100, 'sample_duration', U32), (0x000200, 'sample_size', U32),
+                       (0x000400, 'sample_flags', U32),
+                       (0x000800, 'sample_composition_time_offset', I32 if self.version == 1 else U32)]
+                      if self.flags & flag == flag]
+            entries = read_array(fp, U32, len(fields) * self.box_info['sample_count'], self.start_of_box + self.size)
+            columns = {}
+            for i, (field_name, typecode) in enumerate(fields):
+                columns[field_name] = entries[i::len(fields)]
+                if typecode != U32:
+                    columns[field_name] = array.array(typecode, columns[field_name].tobytes())
+            if 'sample_flags' in columns:
+                columns['sample_flags'] = FormattedColumn(columns['sample_flags'], '#08x')
+            # with no per-sample fields, every sample takes the defaults
+            self.box_info['samples'] = EntryList(**columns) if columns else \
+                [{} for i in range(self.box_info['sample_count'])]
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class TfdtBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -809,6 +1241,7 @@ class TfdtBox(Mp4FullBox):
 
 
 class MdhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -842,6 +1275,7 @@ class MdhdBox(Mp4FullBox):
 
 
 class ElngBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -852,6 +1286,8 @@ class ElngBox(Mp4FullBox):
 
 
 class DrefBox(Mp4FullBox):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -860,12 +1296,13 @@ class DrefBox(Mp4FullBox):
             for i in range(self.box_info['entry_count']):
                 current_header = Header(fp)
                 current_box = box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class Url_Box(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -878,6 +1315,7 @@ class Url_Box(Mp4FullBox):
 
 
 class Urn_Box(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -891,6 +1329,7 @@ class Urn_Box(Mp4FullBox):
 
 
 class HdlrBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -905,19 +1344,24 @@ class HdlrBox(Mp4FullBox):
 
 
 class StblBox(ContainerBox):
+    __slots__ = ()
     # Sub-class from container box so we can do some extra things with child boxes
     def __init__(self, fp, header, parent):
+        if parent.type != 'file' and parent.get_file()._defer_stbl:
+            # skipped over, to be parsed by a worker, see Mp4File._parse_stbls_in_workers()
+            Mp4Box.__init__(self, fp, header, parent)
+            self._box_info = False
+            fp.seek(self.start_of_box + self.size)
+            return
         super().__init__(fp, header, parent)
         try:
             # Some sample table boxes have dependencies on other sample table table boxes in order to read correctly
-            # Fill stdp, sdtp lists using sample count in stsz
-            sz = [box for box in self.children if box.type == 'stsz' or box.type == 'stz2'][0] if [
-                box for box in self.children if box.type == 'stsz' or box.type == 'stz2'] else False
-            sc = sz.box_info['sample_count'] if sz else False
+            # Fill stdp, sdtp lists using sample count in stsz, in a lazy parse they do this when they are decoded
             sdtp = [box for box in self.children if box.type == 'sdtp'][0] if [
                 box for box in self.children if box.type == 'sdtp'] else False
             stdp = [box for box in self.children if box.type == 'stdp'][0] if [
                 box for box in self.children if box.type == 'stdp'] else False
+            sc = self.get_sample_count() if (sdtp or stdp) and not self.lazy else False
             if sc and sdtp:
                 sdtp.update_table(fp, sc)
             if sc and stdp:
@@ -925,8 +1369,14 @@ class StblBox(ContainerBox):
         finally:
             fp.seek(self.start_of_box + self.size)
 
+    def get_sample_count(self):
+        sz = [box for box in self.children if box.type == 'stsz' or box.type == 'stz2'][0] if [
+            box for box in self.children if box.type == 'stsz' or box.type == 'stz2'] else False
+        return sz.box_info['sample_count'] if sz else False
+
 
 class TrafBox(ContainerBox):
+    __slots__ = ()
     # Sub-class from container box so we can do some extra things with child boxes
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -962,6 +1412,7 @@ class TrafBox(ContainerBox):
 
 
 class VmhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -973,6 +1424,7 @@ class VmhdBox(Mp4FullBox):
 
 
 class SmhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -983,6 +1435,7 @@ class SmhdBox(Mp4FullBox):
 
 
 class HmhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -996,6 +1449,7 @@ class HmhdBox(Mp4FullBox):
 
 
 class NmhdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1007,6 +1461,8 @@ class NmhdBox(Mp4FullBox):
 
 
 class StsdBox(Mp4FullBox):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1015,41 +1471,41 @@ class StsdBox(Mp4FullBox):
             for i in range(self.box_info['entry_count']):
                 current_header = Header(fp)
                 current_box = box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class SttsBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
             self.box_info['entry_count'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['entry_count']):
-                self.box_info['entry_list'].append({'sample_count': read_u32(fp), 'sample_delta': read_u32(fp)})
+            entries = read_array(fp, U32, 2 * self.box_info['entry_count'], self.start_of_box + self.size)
+            self.box_info['entry_list'] = EntryList(sample_count=entries[0::2], sample_delta=entries[1::2])
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class CttsBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
             self.box_info['entry_count'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['entry_count']):
-                if self.version == 1:
-                    self.box_info['entry_list'].append({'sample_count': read_u32(fp), 'sample_offset': read_i32(fp)})
-                else:
-                    self.box_info['entry_list'].append({'sample_count': read_u32(fp), 'sample_offset': read_i32(fp)})
+            entries = read_array(fp, U32, 2 * self.box_info['entry_count'], self.start_of_box + self.size)
+            # sample_offset is signed, so reinterpret its bytes
+            self.box_info['entry_list'] = EntryList(sample_count=entries[0::2],
+                                                    sample_offset=array.array(I32, entries[1::2].tobytes()))
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class CslgBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1071,19 +1527,20 @@ class CslgBox(Mp4FullBox):
 
 
 class StssBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
             self.box_info['entry_count'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['entry_count']):
-                self.box_info['entry_list'].append({'sample_number': read_u32(fp)})
+            self.box_info['entry_list'] = EntryList(sample_number=read_array(fp, U32, self.box_info['entry_count'],
+                                                                             self.start_of_box + self.size))
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class StshBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1100,49 +1557,47 @@ class StshBox(Mp4FullBox):
 
 
 class StscBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
             self.box_info['entry_count'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['entry_count']):
-                first_chunk = read_u32(fp)
-                samples_per_chunk = read_u32(fp)
-                samples_description_index = read_u32(fp)
-                self.box_info['entry_list'].append({'first_chunk': first_chunk, 'samples_per_chunk': samples_per_chunk,
-                                                    'samples_description_index': samples_description_index})
+            entries = read_array(fp, U32, 3 * self.box_info['entry_count'], self.start_of_box + self.size)
+            self.box_info['entry_list'] = EntryList(first_chunk=entries[0::3], samples_per_chunk=entries[1::3],
+                                                    samples_description_index=entries[2::3])
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class StcoBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
             self.box_info['entry_count'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['entry_count']):
-                self.box_info['entry_list'].append({'chunk_offset': read_u32(fp)})
+            self.box_info['entry_list'] = EntryList(chunk_offset=read_array(fp, U32, self.box_info['entry_count'],
+                                                                            self.start_of_box + self.size))
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class Co64Box(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
             self.box_info['entry_count'] = read_u32(fp)
-            self.box_info['entry_list'] = []
-            for i in range(self.box_info['entry_count']):
-                self.box_info['entry_list'].append({'chunk_offset': read_u64(fp)})
+            self.box_info['entry_list'] = EntryList(chunk_offset=read_array(fp, U64, self.box_info['entry_count'],
+                                                                            self.start_of_box + self.size))
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class PadbBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1157,6 +1612,7 @@ class PadbBox(Mp4FullBox):
 
 
 class SubsBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1192,6 +1648,7 @@ class SubsBox(Mp4FullBox):
 
 
 class SbgpBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1211,6 +1668,7 @@ class SbgpBox(Mp4FullBox):
 
 
 class SgpdBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1245,6 +1703,7 @@ class SgpdBox(Mp4FullBox):
 
 
 class SaizBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1263,6 +1722,7 @@ class SaizBox(Mp4FullBox):
 
 
 class SaioBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1282,6 +1742,7 @@ class SaioBox(Mp4FullBox):
 
 
 class StszBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1289,14 +1750,46 @@ class StszBox(Mp4FullBox):
             self.box_info['sample_size'] = read_u32(fp)
             self.box_info['sample_count'] = read_u32(fp)
             if self.box_info['sample_size'] == 0:
-                self.box_info['entry_list'] = []
-                for i in range(self.box_info['sample_count']):
-                    self.box_info['entry_list'].append({'entry_size': read_u32(fp)})
+                self.box_info['entry_list'] = EntryList(entry_size=read_array(fp, U32, self.box_info['sample_count'],
+                                                                              self.start_of_box + self.size))
         finally:
             fp.seek(self.start_of_box + self.size)
 
+    def get_sample_totals(self):
+        """
+        returns the sample count and the total size in bytes of the samples. Unless box_info has been decoded already,
+        they are read from the file, the sizes summed a block at a time without entry_list being built.
+        """
+        if self._box_info is not False:
+            if self.box_info['sample_size'] > 0:
+                return self.box_info['sample_count'], self.box_info['sample_size'] * self.box_info['sample_count']
+            return self.box_info['sample_count'], sum(self.box_info['entry_list'].column('entry_size'))
+        mp4file = self.get_file()
+        fp = mp4file._mapping if mp4file._mapping is not None else open(mp4file.filename, 'rb')
+        # the map is shared, as in Mp4Box._decode_box_info()
+        position = fp.tell()
+        # setting the cancel_event of the parse stops the sum at its next block
+        reader = fp if mp4file._cancel_event is None else mp4analyser.source.CancellableFile(fp, mp4file._cancel_event)
+        try:
+            reader.seek(self.start_of_box + self.header.header_size + 4)
+            sample_size = read_u32(reader)
+            sample_count = read_u32(reader)
+            if sample_size > 0:
+                return sample_count, sample_size * sample_count
+            total_size = 0
+            for first in range(0, sample_count, STSZ_SUM_ENTRIES):
+                total_size += sum(read_array(reader, U32, min(STSZ_SUM_ENTRIES, sample_count - first),
+                                             self.start_of_box + self.size))
+            return sample_count, total_size
+        finally:
+            if fp is mp4file._mapping:
+                fp.seek(position)
+            else:
+                fp.close()
+
 
 class Stz2Box(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1315,54 +1808,64 @@ class Stz2Box(Mp4FullBox):
         finally:
             fp.seek(self.start_of_box + self.size)
 
+    def get_sample_totals(self):
+        """ returns the sample count and the total size in bytes of the samples """
+        return self.box_info['sample_count'], sum(entry['entry_size'] for entry in self.box_info['entry_list'])
+
 
 class StdpBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
-            pass
+            # when lazily decoded, the rest of stbl has already been parsed
+            if self.lazy and self.parent.type == 'stbl':
+                sc = self.parent.get_sample_count()
+                if sc:
+                    self.update_table(fp, sc)
         finally:
             fp.seek(self.start_of_box + self.size)
 
     def update_table(self, fp, sc):
         fp_orig = fp.tell()
         fp.seek(self.start_of_box + self.header.header_size + 4)
-        self.box_info['sample_list'] = []
-        for i in range(sc):
-            self.box_info['sample_list'].append({'priority': read_u16(fp)})
+        self.box_info['sample_list'] = EntryList(priority=read_array(fp, 'H', sc, self.start_of_box + self.size))
         fp.seek(fp_orig)
 
 
 class SdtpBox(Mp4FullBox):
+    __slots__ = ()
+
+    # each field's value for every possible byte, for bytes.translate(), which splits a byte a sample into the
+    # fields without a loop in Python
+    _field_tables = {'is_leading': bytes(b >> 6 for b in range(256)),
+                     'sample_depends_on': bytes(b >> 4 & 3 for b in range(256)),
+                     'sample_is_depended_on': bytes(b >> 2 & 3 for b in range(256)),
+                     'sample_has_redundancy': bytes(b & 3 for b in range(256))}
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
-            pass
+            # when lazily decoded, the rest of stbl has already been parsed
+            if self.lazy and self.parent.type == 'stbl':
+                sc = self.parent.get_sample_count()
+                if sc:
+                    self.update_table(fp, sc)
         finally:
             fp.seek(self.start_of_box + self.size)
 
     def update_table(self, fp, sc):
         fp_orig = fp.tell()
         fp.seek(self.start_of_box + self.header.header_size + 4)
-        self.box_info['sample_list'] = []
-        for i in range(sc):
-            the_byte = read_u8(fp)
-            is_leading = the_byte >> 6
-            depends_on = the_byte >> 4 & 3
-            is_depended_on = the_byte >> 2 & 3
-            has_redundancy = the_byte & 3
-            self.box_info['sample_list'].append({
-                'is_leading': is_leading,
-                'sample_depends_on': depends_on,
-                'sample_is_depended_on': is_depended_on,
-                'sample_has_redundancy': has_redundancy
-            })
+        data = read_array(fp, 'B', sc, self.start_of_box + self.size).tobytes()
+        self.box_info['sample_list'] = EntryList(**{name: array.array('B', data.translate(table))
+                                                    for name, table in self._field_tables.items()})
         fp.seek(fp_orig)
 
 
 class SidxBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1378,10 +1881,8 @@ class SidxBox(Mp4FullBox):
             fp.seek(2, 1)
             self.box_info['reference_count'] = read_u16(fp)
             self.box_info['reference_list'] = []
-            for i in range(self.box_info['reference_count']):
-                rt_sz = read_u32(fp)
-                subsegment_dur = read_u32(fp)
-                st_sz = read_u32(fp)
+            for rt_sz, subsegment_dur, st_sz in read_structs(fp, '>III', self.box_info['reference_count'],
+                                                             self.start_of_box + self.size):
                 self.box_info['reference_list'].append({
                     'reference_type': rt_sz >> 31,
                     'reference_size': rt_sz % 2147483648,
@@ -1395,6 +1896,7 @@ class SidxBox(Mp4FullBox):
 
 
 class SsixBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1414,6 +1916,7 @@ class SsixBox(Mp4FullBox):
 
 
 class PrftBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -1428,3 +1931,4 @@ class PrftBox(Mp4FullBox):
             fp.seek(self.start_of_box + self.size)
 
 
+add_box_classes(globals())
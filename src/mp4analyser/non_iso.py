@@ -12,23 +12,16 @@ import mp4analyser.iso
 import mp4analyser.mpeglookups
 from mp4analyser.util import *
 from mp4analyser.core import *
+from mp4analyser.registry import add_box_classes
 
 
 def box_factory_non_iso(fp, header, parent):
-    the_box = None
-    # Normalise header type so it can be expressed in a Python Class name
-    box_type = header.type.replace(" ", "_").replace("-", "_").lower()
-    # globals() Return a dictionary representing the current global symbol table
-    _box_class = globals().get(box_type.capitalize()+'Box')
-    if _box_class:
-        the_box = _box_class(fp, header, parent)
-    else:
-        the_box = UndefinedBox(fp, header, parent)
-
-    return the_box
+    """ iso.box_factory() finds the classes of this module as well as its own, this remains for code that calls it """
+    return mp4analyser.iso.box_factory(fp, header, parent)
 
 
 class UndefinedBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -39,6 +32,8 @@ class UndefinedBox(Mp4Box):
 
 
 class Avc1Box(Mp4FullBox):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -60,7 +55,7 @@ class Avc1Box(Mp4FullBox):
             while bytes_left > 7:
                 current_header = Header(fp)
                 current_box = mp4analyser.iso.box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
@@ -73,6 +68,7 @@ EncvBox = Vvi1Box = Vvc1Box = Vc_1Box = Avc1Box
 
 
 class AvccBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -121,6 +117,7 @@ class AvccBox(Mp4Box):
 AvceBox = AvccBox
 
 class HvccBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -164,6 +161,7 @@ class HvccBox(Mp4Box):
 HvceBox = HvccBox
 
 class Av1cBox(Mp4Box):
+    __slots__ = ('version',)
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -193,6 +191,7 @@ class Av1cBox(Mp4Box):
 
 
 class VvccBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -283,6 +282,7 @@ class VvccBox(Mp4FullBox):
 
 
 class DvccBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -303,6 +303,7 @@ class DvccBox(Mp4Box):
 DvvcBox = DvccBox
 
 class BtrtBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -315,6 +316,7 @@ class BtrtBox(Mp4Box):
 
 
 class PaspBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -326,6 +328,8 @@ class PaspBox(Mp4Box):
 
 
 class Mp4aBox(Mp4Box):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -365,7 +369,7 @@ class Mp4aBox(Mp4Box):
             while bytes_left > 7:
                 current_header = Header(fp)
                 current_box = mp4analyser.iso.box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
@@ -375,6 +379,7 @@ Ac_3Box = Ec_3Box = Ac_4Box = EncaBox = LpcmBox = Mp4aBox
 
 
 class EsdsBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -486,6 +491,7 @@ class EsdsBox(Mp4FullBox):
 
 
 class Dac3Box(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -502,6 +508,7 @@ class Dac3Box(Mp4Box):
 
 
 class Dec3Box(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -531,6 +538,7 @@ class Dec3Box(Mp4Box):
 
 
 class DataBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -542,6 +550,7 @@ class DataBox(Mp4FullBox):
 
 
 class PsshBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -558,6 +567,7 @@ class PsshBox(Mp4FullBox):
 
 
 class TencBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -578,6 +588,7 @@ class TencBox(Mp4FullBox):
 
 
 class SencBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -616,6 +627,7 @@ class SencBox(Mp4FullBox):
 
 
 class GminBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -628,6 +640,7 @@ class GminBox(Mp4FullBox):
 
 
 class KeysBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -647,6 +660,8 @@ class KeysBox(Mp4FullBox):
 
 
 class IlstBox(Mp4Box):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -658,13 +673,16 @@ class IlstBox(Mp4Box):
                     current_header.type = "#{:#d}".format(struct.unpack('>I', current_header.type.encode('utf-8'))[0])
                 # create box directly, not through box factory
                 current_box = ItemBox(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class ItemBox(Mp4Box):
+    __slots__ = ()
+    deferrable = False
+
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
         try:
@@ -672,13 +690,14 @@ class ItemBox(Mp4Box):
             while bytes_left > 7:
                 current_header = Header(fp)
                 current_box = mp4analyser.iso.box_factory(fp, current_header, self)
-                self.children.append(current_box)
+                self.add_child(current_box)
                 bytes_left -= current_box.size
         finally:
             fp.seek(self.start_of_box + self.size)
 
 
 class IodsBox(Mp4FullBox):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -707,6 +726,8 @@ class IodsBox(Mp4FullBox):
             fp.seek(self.start_of_box + self.size)
 
 class Tx3gBox(Mp4FullBox):
+    __slots__ = ()
+    deferrable = False
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -727,11 +748,12 @@ class Tx3gBox(Mp4FullBox):
             self.box_info['text_color_rgba'] = {'red': read_u8(fp), 'green': read_u8(fp), 'blue': read_u8(fp), 'alpha': read_u8(fp)}
             current_header = Header(fp)
             current_box = mp4analyser.iso.box_factory(fp, current_header, self)
-            self.children.append(current_box)
+            self.add_child(current_box)
         finally:
             fp.seek(self.start_of_box + self.size)
 
 class FtabBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -750,6 +772,7 @@ class FtabBox(Mp4Box):
             fp.seek(self.start_of_box + self.size)
 
 class XyzBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -768,6 +791,7 @@ class XyzBox(Mp4Box):
             fp.seek(self.start_of_box + self.size)
 
 class AmveBox(Mp4Box):
+    __slots__ = ()
 
     def __init__(self, fp, header, parent):
         super().__init__(fp, header, parent)
@@ -777,3 +801,6 @@ class AmveBox(Mp4Box):
             self.box_info['ambient_light_y'] = read_u16(fp)
         finally:
             fp.seek(self.start_of_box + self.size)
+
+
+add_box_classes(globals(), undefined_class=UndefinedBox)
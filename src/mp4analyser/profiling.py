@@ -0,0 +1,116 @@
+"""
+profiling.py
+
+Opt-in profiling of a parse, by box or element type, for finding out which boxes make a file slow to open.
+Mp4File and MkvFile take profile=True, which makes them parse from a ProfiledFile, a wrapper of the file that counts
+the reads and seeks made of it. box_factory() and element_factory() only measure the boxes they make when they are
+given a ProfiledFile, so a parse that isn't profiled pays for one type check per box and no more.
+
+"""
+import time
+
+STAT_NAMES = ('count', 'seconds', 'total_seconds', 'bytes', 'reads', 'seeks')
+
+
+class ProfiledFile:
+    """ wraps a file or memory map being parsed, counting the reads and seeks made of it in profile """
+    __slots__ = ('_file', 'profile')
+
+    def __init__(self, f, profile):
+        self._file = f
+        self.profile = profile
+
+    def read(self, *args):
+        self.profile.reads += 1
+        return self._file.read(*args)
+
+    def seek(self, *args):
+        self.profile.seeks += 1
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class ParseProfile:
+    """
+    For each type of box or element parsed, how many there were, the time taken to parse them, with and without
+    their children, the bytes they span and the reads and seeks of the file made while parsing them, not counting
+    those of their children. The header of a box is read before its type is known, so those reads count towards its
+    parent. In a lazy parse only the making of the boxes is timed, not the decoding of box_info on first access.
+    """
+
+    def __init__(self):
+        # keyed by box type, or element name, each a dict of 'class' and STAT_NAMES
+        self.stats = {}
+        self.reads = 0
+        self.seeks = 0
+        # the time, reads and seeks of the children of each box being parsed, from the outermost
+        self._children = []
+
+    def measure(self, node_type, node_class, create, fp, *args):
+        """ returns create(fp, *args), the box or element of node_type, measuring it and adding it to stats """
+        children = [0.0, 0, 0]
+        self._children.append(children)
+        reads, seeks = self.reads, self.seeks
+        node = None
+        start = time.perf_counter()
+        try:
+            node = create(fp, *args)
+            return node
+        finally:
+            seconds = time.perf_counter() - start
+            reads, seeks = self.reads - reads, self.seeks - seeks
+            self._children.pop()
+            if self._children:
+                parent = self._children[-1]
+                parent[0] += seconds
+                parent[1] += reads
+                parent[2] += seeks
+            stats = self.stats.get(node_type)
+            if stats is None:
+                stats = self.stats[node_type] = dict({'class': node_class.__name__}, **dict.fromkeys(STAT_NAMES, 0))
+            stats['count'] += 1
+            stats['seconds'] += seconds - children[0]
+            stats['total_seconds'] += seconds
+            stats['bytes'] += node.size if node is not None else 0
+            stats['reads'] += reads - children[1]
+            stats['seeks'] += seeks - children[2]
+
+    def get_stats(self):
+        """ returns stats in order of the time taken by each type, not counting children, the slowest first """
+        return sort_stats(self.stats)
+
+    def format(self, limit=None):
+        """ returns stats as a table, of the limit slowest types if limit is given """
+        return format_stats(self.stats, limit)
+
+
+def sort_stats(stats):
+    return dict(sorted(stats.items(), key=lambda item: item[1]['seconds'], reverse=True))
+
+
+def merge_stats(stats, more_stats):
+    """ adds more_stats, as returned by ParseProfile.get_stats(), into stats e.g. to total them over many files """
+    for node_type, type_stats in more_stats.items():
+        if node_type in stats:
+            for name in STAT_NAMES:
+                stats[node_type][name] += type_stats[name]
+        else:
+            stats[node_type] = dict(type_stats)
+    return stats
+
+
+def format_stats(stats, limit=None):
+    """ returns stats, as returned by ParseProfile.get_stats(), as a table, of the limit slowest types if given """
+    rows = list(sort_stats(stats).items())[:limit]
+    lines = [f'{"type":20s} {"class":20s} {"count":>9s} {"self ms":>10s} {"total ms":>10s} {"bytes":>14s} '
+             f'{"reads":>9s} {"seeks":>9s}']
+    for node_type, type_stats in rows:
+        lines.append(f'{node_type:20s} {type_stats["class"]:20s} {type_stats["count"]:9d} '
+                     f'{type_stats["seconds"] * 1000:10.2f} {type_stats["total_seconds"] * 1000:10.2f} '
+                     f'{type_stats["bytes"]:14d} {type_stats["reads"]:9d} {type_stats["seeks"]:9d}')
+    return '\n'.join(lines)
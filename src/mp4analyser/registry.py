@@ -0,0 +1,63 @@
+"""
+registry.py
+
+The table of box classes in which box_factory() in iso.py looks up the class of each box.
+It is filled in with the classes defined in iso.py and non_iso.py as they are imported, and code outside this package
+can add classes of its own, or replace those of existing box types, with register_box_type().
+The class found for each box type is remembered, so that finding the class of a box is a single dict lookup.
+
+"""
+
+# box classes of iso.py and non_iso.py, keyed by the box type they are named for in lower case, with '_' standing
+# for ' ' or '-' e.g. 'ac_3' for Ac_3Box. The names are unique across the two modules.
+_named_classes = {}
+# classes given to register_box_type(), keyed by box type
+_registered_classes = {}
+# the class found for each box type looked up since a class was last added
+_resolved_classes = {}
+# limits how many types are remembered, as a damaged file can be full of box types that don't exist
+_MAX_RESOLVED = 4096
+# the class of box types that have no class of their own
+_undefined_class = None
+
+
+def add_box_classes(namespace, undefined_class=None):
+    """
+    adds the box classes in namespace, the globals() of a module, that are named for a box type e.g. StszBox for
+    'stsz' boxes. undefined_class, if given, is the class for box types that have no class.
+    """
+    global _undefined_class
+    for name, value in namespace.items():
+        box_type = name[:-3]
+        if name.endswith('Box') and isinstance(value, type) and box_type == box_type.lower().capitalize():
+            _named_classes.setdefault(box_type.lower(), value)
+    if undefined_class is not None:
+        _undefined_class = undefined_class
+    _resolved_classes.clear()
+
+
+def register_box_type(box_type, box_class):
+    """
+    Makes box_factory() return an instance of box_class, a subclass of Mp4Box, for boxes of box_type.
+    box_type is a str as in Header.type e.g. 'avcC', or the 4 bytes of the type as they are in the file.
+    """
+    if isinstance(box_type, (bytes, bytearray)):
+        # decoded as Header does
+        box_type = bytes(box_type[1:] if box_type[0] == 169 else box_type).decode('utf-8', errors='ignore')
+    _registered_classes[box_type] = box_class
+    _resolved_classes.clear()
+
+
+def get_box_class(box_type):
+    """ returns the class of boxes of box_type, a Header.type """
+    try:
+        return _resolved_classes[box_type]
+    except KeyError:
+        pass
+    box_class = _registered_classes.get(box_type)
+    if box_class is None:
+        box_class = _named_classes.get(box_type.replace(' ', '_').replace('-', '_').lower(), _undefined_class)
+    if len(_resolved_classes) >= _MAX_RESOLVED:
+        _resolved_classes.clear()
+    _resolved_classes[box_type] = box_class
+    return box_class
@@ -0,0 +1,499 @@
+"""
+samples.py
+
+Columnar indexes of the media samples in a file.
+Rather than a dict per sample, the offset, size and chunk of every sample of a track are held in typed arrays,
+computed from the track's stsc, stco/co64 and stsz boxes with cumulative sums. The samples of a fragmented file are
+indexed per track in the same way, from its moof boxes. NumPy is used to compute the index of a track with many
+samples when it is installed, otherwise they are computed in pure Python. Either way the index holds array.array
+columns.
+
+"""
+import array
+import bisect
+import itertools
+import operator
+from collections.abc import Sequence
+
+from mp4analyser.tables import U32, I32, U64
+
+# NumPy is only imported for a track with enough samples to repay the time importing it takes
+NUMPY_MIN_SAMPLES = 10000
+numpy = None
+_numpy_imported = False
+
+
+def _import_numpy():
+    """ returns the numpy module, or None if it isn't installed """
+    global numpy, _numpy_imported
+    if not _numpy_imported:
+        _numpy_imported = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+class TrackSampleIndex:
+    """
+    The samples of one track of a non-fragmented file, in decode order.
+    Per sample columns are offset, size and chunk (the 1-based chunk_ID of the chunk holding the sample),
+    per chunk columns are chunk_offset, samples_per_chunk (as given by stsc) and first_sample (the 0-based index
+    of the chunk's first sample). A chunk may hold fewer samples than samples_per_chunk if stsz runs out of samples.
+    """
+
+    def __init__(self, track_ID, chunk_offsets, sample_sizes, sample_to_chunks):
+        """
+        chunk_offsets and sample_sizes are the chunk_offset and entry_size columns of stco/co64 and stsz,
+        sample_to_chunks the entry_list of stsc
+        """
+        self.track_ID = track_ID
+        if len(sample_sizes) >= NUMPY_MIN_SAMPLES and _import_numpy() is not None:
+            self._build_with_numpy(chunk_offsets, sample_sizes, sample_to_chunks)
+        else:
+            self._build(chunk_offsets, sample_sizes, sample_to_chunks)
+
+    def _build_with_numpy(self, chunk_offsets, sample_sizes, sample_to_chunks):
+        chunk_offsets = numpy.asarray(chunk_offsets, dtype=numpy.int64)
+        sample_sizes = numpy.asarray(sample_sizes, dtype=numpy.int64)
+        first_chunks = numpy.asarray(sample_to_chunks.column('first_chunk'), dtype=numpy.int64)
+        chunk_count = len(chunk_offsets)
+        # vectorised run_start_chunks()
+        positions = numpy.arange(len(first_chunks))
+        first_chunks[:1] = 1
+        run_starts = numpy.minimum(numpy.maximum.accumulate(first_chunks - positions) + positions, chunk_count + 1)
+        run_lengths = numpy.diff(numpy.append(run_starts, chunk_count + 1))
+        samples_per_chunk = numpy.repeat(numpy.asarray(sample_to_chunks.column('samples_per_chunk'),
+                                                       dtype=numpy.int64), run_lengths)
+        first_sample = numpy.cumsum(samples_per_chunk) - samples_per_chunk
+        sample_count = min(len(sample_sizes), int(samples_per_chunk.sum()))
+        chunk_sample_counts = numpy.clip(sample_count - first_sample, 0, samples_per_chunk)
+        chunk_index = numpy.repeat(numpy.arange(chunk_count), chunk_sample_counts)
+        sizes = sample_sizes[:sample_count]
+        sum_before = numpy.cumsum(sizes) - sizes
+        offsets = chunk_offsets[chunk_index] + sum_before - sum_before[first_sample[chunk_index]]
+        self.chunk_offset = array.array(U64, chunk_offsets.astype(numpy.uint64).tobytes())
+        self.samples_per_chunk = array.array(U32, samples_per_chunk.astype(numpy.uint32).tobytes())
+        self.first_sample = array.array(U64, first_sample.astype(numpy.uint64).tobytes())
+        self.offset = array.array(U64, offsets.astype(numpy.uint64).tobytes())
+        self.size = array.array(U32, sizes.astype(numpy.uint32).tobytes())
+        self.chunk = array.array(U32, (chunk_index + 1).astype(numpy.uint32).tobytes())
+
+    def _build(self, chunk_offsets, sample_sizes, sample_to_chunks):
+        chunk_count = len(chunk_offsets)
+        run_starts = run_start_chunks(sample_to_chunks.column('first_chunk'), chunk_count)
+        self.chunk_offset = array.array(U64, chunk_offsets)
+        self.samples_per_chunk = array.array(U32)
+        for samples, start, end in zip(sample_to_chunks.column('samples_per_chunk'), run_starts,
+                                       run_starts[1:] + [chunk_count + 1]):
+            self.samples_per_chunk.extend(itertools.repeat(samples, end - start))
+        self.first_sample = array.array(U64, itertools.accumulate(itertools.chain((0,), self.samples_per_chunk)))
+        sample_count = min(len(sample_sizes), self.first_sample.pop())
+        self.size = array.array(U32, sample_sizes[:sample_count])
+        self.offset = array.array(U64)
+        self.chunk = array.array(U32)
+        for chunk_ID, (chunk_offset, first) in enumerate(zip(self.chunk_offset, self.first_sample), 1):
+            last = min(first + self.samples_per_chunk[chunk_ID - 1], sample_count)
+            if last > first:
+                self.offset.extend(itertools.accumulate(itertools.chain((chunk_offset,), self.size[first:last - 1])))
+                self.chunk.extend(itertools.repeat(chunk_ID, last - first))
+
+    def __len__(self):
+        return len(self.size)
+
+    def chunk_samples(self, chunk_index):
+        """ returns the range of indexes of the samples in chunk chunk_index (0-based) """
+        first = self.first_sample[chunk_index]
+        return range(min(first, len(self)), min(first + self.samples_per_chunk[chunk_index], len(self)))
+
+    def get_sample(self, sample_index):
+        """ returns sample sample_index (0-based) as a dict """
+        return {'sample_ID': sample_index + 1,
+                'size': self.size[sample_index],
+                'offset': self.offset[sample_index]
+                }
+
+    def get_chunk(self, chunk_index):
+        """ returns chunk chunk_index (0-based), with its samples, as a dict """
+        return {'track_ID': self.track_ID,
+                'chunk_ID': chunk_index + 1,
+                'chunk_offset': self.chunk_offset[chunk_index],
+                'samples_per_chunk': self.samples_per_chunk[chunk_index],
+                'chunk_samples': [self.get_sample(i) for i in self.chunk_samples(chunk_index)]
+                }
+
+
+class SampleTable:
+    """
+    Random access to the samples of one track of a non-fragmented file, straight from the boxes of its stbl.
+    Nothing is expanded per sample, a sample is found by bisecting the cumulative sample counts of the entries of
+    stsc, stts and ctts and the sample numbers of stss, so get_sample() takes O(log n) time, plus a sum over the sizes
+    of the samples that precede the sample in its chunk.
+    """
+
+    def __init__(self, track_ID, stbl, timescale):
+        self.track_ID = track_ID
+        self.timescale = timescale
+        boxes = {box.type: box for box in stbl.children}
+        if 'stsz' in boxes:
+            self.sample_count = boxes['stsz'].box_info['sample_count']
+            self.sample_size = boxes['stsz'].box_info['sample_size']
+            self.sample_sizes = boxes['stsz'].box_info['entry_list'].column('entry_size') \
+                if self.sample_size == 0 else None
+        else:
+            self.sample_count = boxes['stz2'].box_info['sample_count']
+            self.sample_size = 0
+            self.sample_sizes = array.array(U32, (entry['entry_size'] for entry in
+                                                  boxes['stz2'].box_info['entry_list']))
+        chunk_box = boxes['stco'] if 'stco' in boxes else boxes['co64']
+        self.chunk_offsets = chunk_box.box_info['entry_list'].column('chunk_offset')
+        # one run of chunks per stsc entry, with the 0-based index of the first sample of each run
+        sample_to_chunks = boxes['stsc'].box_info['entry_list']
+        self.run_first_chunk = array.array(U32, run_start_chunks(sample_to_chunks.column('first_chunk'),
+                                                                 len(self.chunk_offsets)))
+        self.run_samples_per_chunk = sample_to_chunks.column('samples_per_chunk')
+        self.run_description_index = sample_to_chunks.column('samples_description_index')
+        self.run_first_sample = array.array(U64, itertools.accumulate(itertools.chain((0,), (
+            (end - start) * samples for start, end, samples in
+            zip(self.run_first_chunk, self.run_first_chunk[1:] + array.array(U32, [len(self.chunk_offsets) + 1]),
+                self.run_samples_per_chunk)))))
+        # decode time deltas and composition offsets, with the index of the first sample of each entry
+        sample_counts, self.stts_deltas, self.stts_first_sample = self._entries(boxes.get('stts'), 'sample_delta')
+        self.stts_first_time = array.array(U64, itertools.accumulate(itertools.chain(
+            (0,), map(operator.mul, sample_counts, self.stts_deltas))))
+        sample_counts, self.ctts_offsets, self.ctts_first_sample = self._entries(boxes.get('ctts'), 'sample_offset')
+        min_offset, max_offset = min(self.ctts_offsets, default=0), max(self.ctts_offsets, default=0)
+        if self.ctts_first_sample[-1] < self.sample_count:
+            # samples that ctts does not cover have no offset
+            min_offset, max_offset = min(min_offset, 0), max(max_offset, 0)
+        self.ctts_offset_range = (min_offset, max_offset)
+        # no stss means every sample is a sync sample
+        self.sync_samples = boxes['stss'].box_info['entry_list'].column('sample_number') if 'stss' in boxes else None
+
+    @staticmethod
+    def _entries(box, field_name):
+        """ returns the sample_count and field_name columns of box, and the index of the first sample of each entry """
+        if box is None:
+            sample_counts, values = array.array(U32), array.array(U32)
+        else:
+            sample_counts = box.box_info['entry_list'].column('sample_count')
+            values = box.box_info['entry_list'].column(field_name)
+        return sample_counts, values, array.array(U64, itertools.accumulate(itertools.chain((0,), sample_counts)))
+
+    def __len__(self):
+        return self.sample_count
+
+    def _decode_time(self, sample_index):
+        """ returns the decode time of the sample at sample_index (0-based), or None if stts does not cover it """
+        entry = bisect.bisect_right(self.stts_first_sample, sample_index) - 1
+        if entry < len(self.stts_deltas):
+            return self.stts_first_time[entry] + \
+                   (sample_index - self.stts_first_sample[entry]) * self.stts_deltas[entry]
+        return None
+
+    def _composition_offset(self, sample_index):
+        """ returns the composition offset of the sample at sample_index (0-based), 0 if ctts does not cover it """
+        entry = bisect.bisect_right(self.ctts_first_sample, sample_index) - 1
+        return self.ctts_offsets[entry] if entry < len(self.ctts_offsets) else 0
+
+    def _last_sample_decoded_by(self, decode_time, sample_total):
+        """ returns the index of the last of the first sample_total samples decoded by decode_time, or -1 """
+        entry = bisect.bisect_right(self.stts_first_time, decode_time) - 1
+        if entry < 0:
+            return -1
+        if entry >= len(self.stts_deltas):
+            return sample_total - 1
+        if self.stts_deltas[entry]:
+            sample_index = self.stts_first_sample[entry] + (decode_time - self.stts_first_time[entry]) \
+                           // self.stts_deltas[entry]
+        else:
+            sample_index = self.stts_first_sample[entry + 1] - 1
+        return min(sample_index, self.stts_first_sample[entry + 1] - 1, sample_total - 1)
+
+    def find_sample_at_time(self, media_time):
+        """
+        returns the number of the sample being presented at media_time (in the media timescale), the sample with the
+        latest composition time at or before media_time, or None if no sample is presented that early.
+        Where ctts reorders samples (B-frames), the stts entries are bisected for the samples that may be presented
+        around media_time, given the range of the ctts offsets, and their composition times compared.
+        """
+        sample_total = min(self.sample_count, self.stts_first_sample[-1], self.run_first_sample[-1])
+        if sample_total == 0:
+            raise IndexError(f'track {self.track_ID} has no samples')
+        min_offset, max_offset = self.ctts_offset_range
+        # no sample decoded after last is presented by media_time
+        last = self._last_sample_decoded_by(media_time - min_offset, sample_total)
+        if last < 0 or min_offset == max_offset:
+            # samples are presented in decode order
+            return last + 1 if last >= 0 else None
+        # every sample up to first_presented is presented by media_time, and those decoded over max_offset - min_offset
+        # before it are presented before it
+        first = 0
+        first_presented = self._last_sample_decoded_by(media_time - max_offset, sample_total)
+        if first_presented >= 0:
+            first = self._last_sample_decoded_by(self._decode_time(first_presented) - (max_offset - min_offset),
+                                                 sample_total) + 1
+        best_number, best_time = None, None
+        for sample_index in range(first, last + 1):
+            composition_time = self._decode_time(sample_index) + self._composition_offset(sample_index)
+            if composition_time <= media_time and (best_time is None or composition_time >= best_time):
+                best_number, best_time = sample_index + 1, composition_time
+        return best_number
+
+    def find_sync_sample(self, sample_number, media_time=None):
+        """
+        returns the number of the last sync sample at or before sample_number, or None if there isn't one.
+        If media_time is given, sync samples presented after media_time are passed over.
+        """
+        if self.sync_samples is None:
+            # every sample is a sync sample
+            sync_samples, position = range(1, sample_number + 1), sample_number
+        else:
+            sync_samples, position = self.sync_samples, bisect.bisect_right(self.sync_samples, sample_number)
+        while position and media_time is not None:
+            sample_index = sync_samples[position - 1] - 1
+            decode_time = self._decode_time(sample_index)
+            if decode_time is None or decode_time + self._composition_offset(sample_index) <= media_time:
+                break
+            position -= 1
+        return sync_samples[position - 1] if position else None
+
+    def get_sample(self, sample_number):
+        """
+        returns a dict describing sample sample_number (1-based), times are in the media timescale and None
+        where stts does not cover the sample
+        """
+        sample_index = sample_number - 1
+        if not 0 <= sample_index < self.sample_count or sample_index >= self.run_first_sample[-1]:
+            raise IndexError(f'track {self.track_ID} has no sample {sample_number}')
+        run = bisect.bisect_right(self.run_first_sample, sample_index) - 1
+        samples_per_chunk = self.run_samples_per_chunk[run]
+        chunk_index, index_in_chunk = divmod(sample_index - self.run_first_sample[run], samples_per_chunk)
+        chunk_index += self.run_first_chunk[run] - 1
+        if self.sample_sizes is None:
+            size = self.sample_size
+            offset = self.chunk_offsets[chunk_index] + index_in_chunk * self.sample_size
+        else:
+            size = self.sample_sizes[sample_index]
+            offset = self.chunk_offsets[chunk_index] + sum(self.sample_sizes[sample_index - index_in_chunk:
+                                                                             sample_index])
+        decode_time = self._decode_time(sample_index)
+        composition_time = None if decode_time is None else decode_time + self._composition_offset(sample_index)
+        if self.sync_samples is None:
+            is_sync = True
+        else:
+            position = bisect.bisect_left(self.sync_samples, sample_number)
+            is_sync = position < len(self.sync_samples) and self.sync_samples[position] == sample_number
+        return {'track_ID': self.track_ID,
+                'sample_number': sample_number,
+                'offset': offset,
+                'size': size,
+                'decode_time': decode_time,
+                'composition_time': composition_time,
+                'is_sync': is_sync,
+                'sample_description_index': self.run_description_index[run]
+                }
+
+
+class TrackFragmentIndex:
+    """
+    The samples of one track of a fragmented file, in decode order, with tfhd and trex defaults resolved.
+    Per run (trun) columns are sequence_number, run_ID (the 1-based position of the trun in its traf), run_offset,
+    decode_time (of the run's first sample), sample_description_index and first_sample (the 0-based index of the
+    run's first sample), per sample columns are duration, size, flags and composition_offset.
+    """
+
+    def __init__(self, track_ID):
+        self.track_ID = track_ID
+        self.sequence_number = array.array(U32)
+        self.run_ID = array.array(U32)
+        self.run_offset = array.array(U64)
+        self.decode_time = array.array(U64)
+        self.sample_description_index = array.array(U32)
+        self.first_sample = array.array(U64)
+        self.duration = array.array(U32)
+        self.size = array.array(U32)
+        self.flags = array.array(U32)
+        self.composition_offset = array.array(I32)
+        # decode time of the sample following the last one added, for track fragments without a tfdt
+        self.next_decode_time = 0
+
+    def add_run(self, sequence_number, run_ID, run_offset, decode_time, sample_description_index,
+                durations, sizes, flags, composition_offsets):
+        """
+        appends the samples of a run, durations, sizes and flags are U32 arrays and composition_offsets an I32 array,
+        decode_time is None to continue from the end of the previous run
+        """
+        if decode_time is None:
+            decode_time = self.next_decode_time
+        self.sequence_number.append(sequence_number)
+        self.run_ID.append(run_ID)
+        self.run_offset.append(run_offset)
+        self.decode_time.append(decode_time)
+        self.sample_description_index.append(sample_description_index)
+        self.first_sample.append(len(self.size))
+        self.duration.extend(durations)
+        self.size.extend(sizes)
+        self.flags.extend(flags)
+        self.composition_offset.extend(composition_offsets)
+        self.next_decode_time = decode_time + sum(durations)
+
+    def truncate(self, run_count, next_decode_time):
+        """ removes the runs after the first run_count, and sets the decode time that follows the runs left """
+        if run_count < self.run_count():
+            first = self.first_sample[run_count]
+            for column in (self.sequence_number, self.run_ID, self.run_offset, self.decode_time,
+                           self.sample_description_index, self.first_sample):
+                del column[run_count:]
+            for column in (self.duration, self.size, self.flags, self.composition_offset):
+                del column[first:]
+        self.next_decode_time = next_decode_time
+
+    def __len__(self):
+        return len(self.size)
+
+    def run_count(self):
+        return len(self.run_offset)
+
+    def run_samples(self, run_index):
+        """ returns the range of indexes of the samples in run run_index (0-based) """
+        last = self.first_sample[run_index + 1] if run_index + 1 < len(self.first_sample) else len(self)
+        return range(self.first_sample[run_index], last)
+
+    def get_sample(self, sample_index):
+        """ returns sample sample_index (0-based) as a dict, with its sample_ID numbered from 1 in its run """
+        run_index = bisect.bisect_right(self.first_sample, sample_index) - 1
+        first = self.first_sample[run_index]
+        return {'sample_ID': sample_index - first + 1,
+                'size': self.size[sample_index],
+                'offset': self.run_offset[run_index] + sum(self.size[first:sample_index])
+                }
+
+    def get_run(self, run_index):
+        """ returns run run_index (0-based), with its samples, as a dict """
+        samples = self.run_samples(run_index)
+        sizes = self.size[samples.start:samples.stop]
+        offsets = itertools.accumulate(itertools.chain((self.run_offset[run_index],), sizes))
+        return {'sequence_number': self.sequence_number[run_index],
+                'track_ID': self.track_ID,
+                'run_ID': self.run_ID[run_index],
+                'run_offset': self.run_offset[run_index],
+                'sample_count': len(samples),
+                'run_samples': [{'sample_ID': i, 'size': size, 'offset': offset}
+                                for i, size, offset in zip(itertools.count(1), sizes, offsets)]
+                }
+
+
+def run_start_chunks(first_chunks, chunk_count):
+    """
+    Returns the 1-based number of the first chunk of the run of chunks described by each stsc entry.
+    The first entry always applies from chunk 1 and every entry to at least one chunk, so
+    run_start[k] = max(first_chunk[k], run_start[k - 1] + 1), but no run starts beyond chunk_count + 1.
+    """
+    first_chunks = list(first_chunks)
+    first_chunks[:1] = [1]
+    return [min(start + k, chunk_count + 1) for k, start in
+            enumerate(itertools.accumulate((first_chunk - k for k, first_chunk in enumerate(first_chunks)), max))]
+
+
+class ChunkList(Sequence):
+    """
+    Read-only view of chunks of one or more tracks, as the list of chunk dicts that mdat.sample_list has always been.
+    A dict is only built when its chunk is accessed, use chunks() to walk the index itself.
+    """
+
+    def __init__(self, tracks, track_positions, chunk_indexes):
+        """ chunk n of the list is chunk chunk_indexes[n] of the TrackSampleIndex tracks[track_positions[n]] """
+        self.tracks = tracks
+        self.track_positions = track_positions
+        self.chunk_indexes = chunk_indexes
+
+    def __len__(self):
+        return len(self.chunk_indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        track, chunk_index = self.get_track_chunk(index)
+        return track.get_chunk(chunk_index)
+
+    def __repr__(self):
+        return f"ChunkList({len(self)} chunks)"
+
+    def get_track_chunk(self, index):
+        """ returns the TrackSampleIndex and chunk index of chunk index of the list """
+        return self.tracks[self.track_positions[index]], self.chunk_indexes[index]
+
+    def get_sample(self, index, position):
+        """ returns the dict of the sample at position in chunk index of the list """
+        track, chunk_index = self.get_track_chunk(index)
+        return track.get_sample(track.chunk_samples(chunk_index)[position])
+
+    def get_byte_range(self, index):
+        """ returns the offset and number of bytes of chunk index of the list """
+        track, chunk_index = self.get_track_chunk(index)
+        last = track.chunk_samples(chunk_index)[-1]
+        return track.chunk_offset[chunk_index], track.offset[last] + track.size[last] - track.chunk_offset[chunk_index]
+
+    def chunks(self):
+        """ yields (TrackSampleIndex, chunk index) for each chunk of the list """
+        for track_position, chunk_index in zip(self.track_positions, self.chunk_indexes):
+            yield self.tracks[track_position], chunk_index
+
+
+def interleave(tracks):
+    """
+    Returns the chunks of tracks (a list of TrackSampleIndex) as a ChunkList sorted by chunk offset, and a list of
+    the sorted offsets. Chunks with the same offset keep track order.
+    """
+    track_positions = array.array('H')
+    chunk_indexes = array.array(U32)
+    for track_position, track in enumerate(tracks):
+        track_positions.extend(itertools.repeat(track_position, len(track.chunk_offset)))
+        chunk_indexes.extend(range(len(track.chunk_offset)))
+    offsets = array.array(U64)
+    for track in tracks:
+        offsets.extend(track.chunk_offset)
+    if numpy is not None:
+        order = numpy.argsort(numpy.frombuffer(offsets, dtype=numpy.uint64), kind='stable')
+        track_positions = array.array('H', numpy.frombuffer(track_positions, dtype=numpy.uint16)[order].tobytes())
+        chunk_indexes = array.array(U32, numpy.frombuffer(chunk_indexes, dtype=numpy.uint32)[order].tobytes())
+        offsets = array.array(U64, numpy.frombuffer(offsets, dtype=numpy.uint64)[order].tobytes())
+    else:
+        order = sorted(range(len(offsets)), key=offsets.__getitem__)
+        track_positions = array.array('H', (track_positions[i] for i in order))
+        chunk_indexes = array.array(U32, (chunk_indexes[i] for i in order))
+        offsets = array.array(U64, (offsets[i] for i in order))
+    return ChunkList(tracks, track_positions, chunk_indexes), offsets
+
+
+class RunList(ChunkList):
+    """
+    Read-only view of runs of one or more tracks of a fragmented file, as the list of run dicts that mdat.sample_list
+    has always been. A dict is only built when its run is accessed, use chunks() to walk the index itself.
+    """
+
+    def __init__(self, tracks, track_positions, run_indexes):
+        """ run n of the list is run run_indexes[n] of the TrackFragmentIndex tracks[track_positions[n]] """
+        super().__init__(tracks, track_positions, run_indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        track, run_index = self.get_track_chunk(index)
+        return track.get_run(run_index)
+
+    def __repr__(self):
+        return f"RunList({len(self)} runs)"
+
+    def get_sample(self, index, position):
+        """ returns the dict of the sample at position in run index of the list """
+        track, run_index = self.get_track_chunk(index)
+        return track.get_sample(track.run_samples(run_index)[position])
+
+    def get_byte_range(self, index):
+        """ returns the offset and number of bytes of run index of the list """
+        track, run_index = self.get_track_chunk(index)
+        samples = track.run_samples(run_index)
+        return track.run_offset[run_index], sum(track.size[samples.start:samples.stop])
@@ -0,0 +1,168 @@
+"""
+source.py
+
+Alternatives to a plain file object as the source of bytes for the box classes.
+A MappedFile behaves like a file opened with open(filename, 'rb'), so boxes can be read from it unchanged, but the
+bytes come from a memory map of the file rather than from read/seek system calls.
+A BlockCache serves byte ranges of a file that is not memory-mapped from a bounded cache of blocks of the file.
+A CancellableFile wraps the file being parsed so that the parse can be stopped from another thread, and a ProgressFile
+so that the progress of the parse can be reported.
+
+"""
+import collections
+import mmap
+import os
+
+_mmap_seek = mmap.mmap.seek
+# how far through the file a parse moves on between reports of its progress
+PROGRESS_BYTES = 1024 * 1024
+
+
+class MappedFile(mmap.mmap):
+    """
+    Read-only memory map of a file, with a file object's seek() semantics and zero-copy access to ranges of bytes.
+    """
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        """ unlike mmap.seek(), seeking beyond the end of the map is allowed, as it is for files """
+        try:
+            return _mmap_seek(self, pos, whence)
+        except ValueError:
+            if whence == os.SEEK_CUR:
+                pos += self.tell()
+            elif whence == os.SEEK_END:
+                pos += len(self)
+            return _mmap_seek(self, min(max(pos, 0), len(self)))
+
+    def view(self, offset, num_bytes):
+        """ returns a memoryview of num_bytes from offset, without copying """
+        return memoryview(self)[offset:offset + num_bytes]
+
+
+def map_file(filename):
+    """ Returns a MappedFile for filename, or None if the file is empty (an empty file cannot be mapped) """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BlockCache:
+    """
+    Least recently used cache of fixed size blocks of a file, holding at most budget bytes.
+    The file is only opened to read blocks that are not in the cache.
+    """
+    block_size = 64 * 1024
+
+    def __init__(self, filename, budget):
+        self.filename = filename
+        self.budget = budget
+        self._blocks = collections.OrderedDict()
+        self._cached_bytes = 0
+
+    def read(self, offset, num_bytes):
+        """ returns num_bytes from offset, or fewer if the file ends first """
+        if num_bytes <= 0:
+            return b''
+        first_block = offset // self.block_size
+        last_block = (offset + num_bytes - 1) // self.block_size
+        if (last_block - first_block + 1) * self.block_size > self.budget:
+            # caching the range would evict everything else
+            with open(self.filename, 'rb') as f:
+                f.seek(offset)
+                return f.read(num_bytes)
+        blocks = {}
+        missing = []
+        for block_number in range(first_block, last_block + 1):
+            if block_number in self._blocks:
+                self._blocks.move_to_end(block_number)
+                blocks[block_number] = self._blocks[block_number]
+            else:
+                missing.append(block_number)
+        if missing:
+            with open(self.filename, 'rb') as f:
+                # one read for each run of consecutive missing blocks
+                run_start = 0
+                for i in range(1, len(missing) + 1):
+                    if i == len(missing) or missing[i] != missing[i - 1] + 1:
+                        f.seek(missing[run_start] * self.block_size)
+                        run_bytes = f.read((i - run_start) * self.block_size)
+                        for k, block_number in enumerate(missing[run_start:i]):
+                            blocks[block_number] = run_bytes[k * self.block_size:(k + 1) * self.block_size]
+                            self._store(block_number, blocks[block_number])
+                        run_start = i
+        start = offset - first_block * self.block_size
+        return b''.join(blocks[block_number] for block_number in range(first_block, last_block + 1))[
+            start:start + num_bytes]
+
+    def _store(self, block_number, block):
+        # a short block at the end of the file is not kept, as the file may yet grow
+        if len(block) != self.block_size:
+            return
+        self._blocks[block_number] = block
+        self._cached_bytes += len(block)
+        while self._cached_bytes > self.budget:
+            self._cached_bytes -= len(self._blocks.popitem(last=False)[1])
+
+    def clear(self):
+        self._blocks.clear()
+        self._cached_bytes = 0
+
+
+class ParseCancelled(BaseException):
+    """
+    Raised when the parse of a file is cancelled. Not an Exception, so the catch-alls of the parsers don't swallow it.
+    """
+    pass
+
+
+class CancellableFile:
+    """
+    Wraps a file or memory map being parsed, raising ParseCancelled at the first read of it after cancel_event, a
+    threading.Event, has been set.
+    """
+    __slots__ = ('_file', '_cancel_event')
+
+    def __init__(self, f, cancel_event):
+        self._file = f
+        self._cancel_event = cancel_event
+
+    def read(self, *args):
+        if self._cancel_event.is_set():
+            raise ParseCancelled()
+        return self._file.read(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class ProgressFile:
+    """
+    Wraps a file or memory map being parsed, calling progress(position, None) each time the parse has moved on
+    PROGRESS_BYTES further through it. Only seeks to a position are watched, as the parse of each box or element
+    ends by seeking to its end, so reading costs nothing extra.
+    """
+    __slots__ = ('_file', 'read', 'tell', '_progress', '_next_position')
+
+    def __init__(self, f, progress):
+        self._file = f
+        self.read = f.read
+        self.tell = f.tell
+        self._progress = progress
+        self._next_position = PROGRESS_BYTES
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        result = self._file.seek(offset, whence)
+        if whence == os.SEEK_SET and offset >= self._next_position:
+            self._next_position = offset + PROGRESS_BYTES
+            self._progress(offset, None)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
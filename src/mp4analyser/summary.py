@@ -39,12 +39,8 @@ class Summary:
                 v = mdhd.version
 
                 sz = [box for box in stbl.children if box.type == 'stsz' or box.type == 'stz2'][0]
-                sc = sz.box_info['sample_count']
-                if sz.box_info['sample_size'] > 0:
-                    # uniform sample size
-                    trak_size = sz.box_info['sample_size'] * sc
-                else:
-                    trak_size = sum([entry['entry_size'] for entry in sz.box_info['entry_list']])
+                # in a lazy parse, read without the sample sizes being decoded
+                sc, trak_size = sz.get_sample_totals()
 
                 sample_rate = None
                 if (d < 0xffffffff and v == 0) or (d < 0xffffffffffffffff and v == 1):
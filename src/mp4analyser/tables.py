@@ -0,0 +1,129 @@
+"""
+tables.py
+
+Compact storage for the entry lists of sample table boxes, which can run to millions of entries.
+Each field of a table is held in a typed array, rather than as a dict per entry, and an EntryList presents
+the arrays as the read-only list of dicts that box_info['entry_list'] has always been. It is a list subclass that
+holds no items itself, building the dict of an entry when it is accessed, so isinstance() checks and json.dumps()
+treat it as the list it replaced, and it compares equal to a list of the same dicts.
+
+"""
+import array
+from collections.abc import Sequence
+
+# array typecodes for fixed size integers, 'I' and 'i' are 4 bytes on all common platforms but C only guarantees 2
+U32 = 'I' if array.array('I').itemsize == 4 else 'L'
+I32 = 'i' if array.array('i').itemsize == 4 else 'l'
+U64 = 'Q'
+
+
+def _entry_list(fields):
+    """ unpickles an EntryList """
+    return EntryList(**fields)
+
+
+class EntryList(list):
+    """
+    Read-only view of equal length arrays, one per field, as a list of dicts keyed by field name.
+    Every list method that would read the list's own items is overridden to read the arrays, and those that would
+    change it raise TypeError.
+    """
+
+    def __init__(self, **fields):
+        super().__init__()
+        self.fields = fields
+
+    def __len__(self):
+        for values in self.fields.values():
+            return len(values)
+        return 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return {name: values[index] for name, values in self.fields.items()}
+
+    def __iter__(self):
+        names = list(self.fields)
+        return (dict(zip(names, values)) for values in zip(*self.fields.values()))
+
+    def __reversed__(self):
+        return (self[i] for i in range(len(self) - 1, -1, -1))
+
+    def __contains__(self, value):
+        return any(entry == value for entry in self)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, (str, bytes, bytearray)):
+            return NotImplemented
+        return len(self) == len(other) and all(entry == other_entry for entry, other_entry in zip(self, other))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __lt__(self, other):
+        return self.to_list() < other
+
+    def __le__(self, other):
+        return self.to_list() <= other
+
+    def __gt__(self, other):
+        return self.to_list() > other
+
+    def __ge__(self, other):
+        return self.to_list() >= other
+
+    def __add__(self, other):
+        return self.to_list() + other
+
+    def __radd__(self, other):
+        return other + self.to_list()
+
+    def __mul__(self, count):
+        return self.to_list() * count
+
+    __rmul__ = __mul__
+
+    def __reduce__(self):
+        # pickled as its arrays, as the default for a list subclass would pickle a dict per entry
+        return _entry_list, (self.fields,)
+
+    def __repr__(self):
+        return f"EntryList({', '.join(self.fields)}, {len(self)} entries)"
+
+    index = Sequence.index
+    count = Sequence.count
+
+    def copy(self):
+        return self.to_list()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('an EntryList is read-only, copy it with to_list() to change it')
+
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def column(self, name):
+        """ returns the array holding field name for every entry """
+        return self.fields[name]
+
+    def to_list(self):
+        """ returns the entries as a list of dicts """
+        return [*self]
+
+
+class FormattedColumn(Sequence):
+    """ Read-only view of an array that formats each value on access, e.g. flags as hex strings """
+
+    def __init__(self, values, format_spec):
+        self.values = values
+        self.format_spec = format_spec
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return format(self.values[index], self.format_spec)
@@ -4,7 +4,9 @@ util.py
 Utility functions to save me typing struct.unpack all the time.
 
 """
+import array
 import struct
+import sys
 
 
 def read_u8(fp):
@@ -39,6 +41,35 @@ def read_i64(fp):
     return struct.unpack('>q', fp.read(8))[0]
 
 
+def read_array(fp, typecode, count, end):
+    """
+    Reads count big-endian integers into an array of typecode with a single read, rather than one read per value.
+    end is the offset the values must not extend beyond, normally the end of the box.
+    """
+    values = array.array(typecode)
+    num_bytes = count * values.itemsize
+    if fp.tell() + num_bytes > end:
+        raise struct.error(f'{count} values of {values.itemsize} bytes extend beyond offset {end}')
+    data = fp.read(num_bytes)
+    if len(data) != num_bytes:
+        raise struct.error(f'unpack requires a buffer of {num_bytes} bytes')
+    values.frombytes(data)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def read_structs(fp, entry_format, count, end):
+    """
+    Reads count entries, each packed as struct format entry_format, with a single read and returns an iterator of
+    tuples. end is the offset the entries must not extend beyond, normally the end of the box.
+    """
+    num_bytes = count * struct.calcsize(entry_format)
+    if fp.tell() + num_bytes > end:
+        raise struct.error(f'{count} entries of format {entry_format} extend beyond offset {end}')
+    return struct.iter_unpack(entry_format, fp.read(num_bytes))
+
+
 def read_u8_8(fp):
     ipart, fpart = struct.unpack('>2B', fp.read(2))
     return ipart + (fpart / 256)
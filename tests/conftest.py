@@ -0,0 +1,14 @@
+"""
+conftest.py
+
+The tests import the packages from src and write the files they parse with benchmarks/synthetic.py, so they run from
+a checkout without the package being installed:
+python -m pytest tests
+
+"""
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,51 @@
+"""
+Tests of the asyncio API of aio.py.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+import synthetic
+from mp4analyser import aio
+from mp4analyser.iso import Mp4File
+from mp4analyser.source import ParseCancelled
+
+
+def test_get_summary_matches_sync_api(tmp_path):
+    filename = str(tmp_path / 'progressive.mp4')
+    synthetic.write_progressive_mp4(filename, samples=25, samples_per_chunk=10)
+
+    async def summarise():
+        async with aio.AsyncAnalyser(2) as analyser:
+            return await asyncio.gather(analyser.get_summary(filename), analyser.get_summary(filename))
+
+    assert asyncio.run(summarise()) == [Mp4File(filename).get_summary()] * 2
+
+
+def test_cancelled_parse_keeps_its_slot_until_it_stops():
+    started = threading.Event()
+    running = []
+
+    def parse(cancel_event):
+        running.append(parse)
+        started.set()
+        cancel_event.wait()
+        # a parse only sees the cancel at its next read of the file
+        time.sleep(0.1)
+        running.remove(parse)
+        raise ParseCancelled()
+
+    async def cancel():
+        async with aio.AsyncAnalyser(1) as analyser:
+            task = asyncio.ensure_future(analyser._run(parse))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert not running
+            # the slot is free, so the next analysis runs
+            return await analyser._run(lambda cancel_event: 'next')
+
+    assert asyncio.run(cancel()) == 'next'
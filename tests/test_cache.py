@@ -0,0 +1,81 @@
+"""
+Tests of the parse cache of cache.py, as used by Mp4File and MkvFile.
+"""
+import json
+import logging
+import threading
+
+import synthetic
+import mkvanalyser.mkv
+from mkvanalyser.mkv import MkvFile
+from mp4analyser.cache import get_parse_cache
+from mp4analyser.iso import Mp4File
+
+
+def box_tree(box):
+    return [box.type, box.start_of_box, box.size, box.get_box_info(), [box_tree(child) for child in box.children]]
+
+
+def test_cached_parse_matches_fresh_parse(tmp_path):
+    filename = str(tmp_path / 'progressive.mp4')
+    synthetic.write_progressive_mp4(filename, samples=200, samples_per_chunk=10)
+    cache_dir = str(tmp_path / 'cache')
+    fresh = Mp4File(filename, cache_dir=cache_dir)
+    cached = Mp4File(filename, cache_dir=cache_dir)
+    assert json.dumps([box_tree(box) for box in cached.children]) == \
+           json.dumps([box_tree(box) for box in fresh.children])
+    assert all(box.parent is cached for box in cached.children)
+    assert list(cached.get_sample_index()[1].offset) == list(fresh.get_sample_index()[1].offset)
+    assert cached.get_summary() == fresh.get_summary()
+
+
+def test_cached_parse_keeps_settings_of_its_opening(tmp_path):
+    filename = str(tmp_path / 'fragmented.mp4')
+    synthetic.write_fragmented_mp4(filename, fragments=5)
+    cache_dir = str(tmp_path / 'cache')
+    Mp4File(filename, lazy=True, cache_dir=cache_dir)
+    cancel_event = threading.Event()
+    progress = []
+    mp4file = Mp4File(filename, lazy=True, use_mmap=True, cache_dir=cache_dir, cancel_event=cancel_event,
+                      progress=lambda *args: progress.append(args))
+    assert mp4file.filename == filename
+    assert mp4file.lazy
+    assert mp4file._mapping is not None
+    assert mp4file._cancel_event is cancel_event
+    assert mp4file._progress is not None
+    # a deferred box is decoded from the memory map of this opening
+    assert mp4file.children[-2].children[0].box_info['sequence_number'] == 5
+    mp4file.close()
+
+
+def test_changed_file_is_parsed_again(tmp_path):
+    filename = str(tmp_path / 'fragmented.mp4')
+    cache_dir = str(tmp_path / 'cache')
+    synthetic.write_fragmented_mp4(filename, fragments=5)
+    assert len(Mp4File(filename, cache_dir=cache_dir).children) == 12
+    synthetic.write_fragmented_mp4(filename, fragments=6)
+    assert len(Mp4File(filename, cache_dir=cache_dir).children) == 14
+
+
+def test_failed_matroska_parse_is_not_cached(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'file.mkv')
+    synthetic.write_mkv(filename, clusters=2, blocks_per_cluster=10)
+    cache_dir = str(tmp_path / 'cache')
+    parse_cache = get_parse_cache(cache_dir)
+    element_factory = mkvanalyser.mkv.element_factory
+
+    def failing_element_factory(fp, elementid_tuple, parent):
+        if isinstance(parent, MkvFile) and parent.children:
+            raise mkvanalyser.mkv.DataLengthError('data length error')
+        return element_factory(fp, elementid_tuple, parent)
+
+    monkeypatch.setattr(mkvanalyser.mkv, 'element_factory', failing_element_factory)
+    logging.disable(logging.CRITICAL)
+    try:
+        assert len(MkvFile(filename, cache_dir=cache_dir).children) == 1
+    finally:
+        logging.disable(logging.NOTSET)
+    assert parse_cache.load(parse_cache.key(filename)) is None
+    monkeypatch.setattr(mkvanalyser.mkv, 'element_factory', element_factory)
+    assert len(MkvFile(filename, cache_dir=cache_dir).children) == 2
+    assert parse_cache.load(parse_cache.key(filename)) is not None
@@ -0,0 +1,43 @@
+"""
+Tests of box headers: sizes of 0 and largesizes, and the header-only scan of Mp4File.scan().
+"""
+import logging
+import struct
+
+import synthetic
+from mp4analyser.iso import Mp4File
+
+
+def test_size_0_top_level_box_runs_to_end_of_file(tmp_path):
+    filename = str(tmp_path / 'size0.mp4')
+    with open(filename, 'wb') as f:
+        f.write(synthetic.ftyp() + struct.pack('>I', 0) + b'mdat' + bytes(100))
+    mp4file = Mp4File(filename)
+    assert [(box.type, box.size, box.header.to_end_of_file) for box in mp4file.children] == \
+           [('ftyp', 32, False), ('mdat', 108, True)]
+    assert [(box['type'], box['size']) for box in Mp4File.scan(filename)] == [('ftyp', 32), ('mdat', 108)]
+
+
+def test_size_0_nested_box_is_an_error(tmp_path):
+    filename = str(tmp_path / 'nested_size0.mp4')
+    # a size of 0 inside the moov must not swallow the free box that follows it
+    with open(filename, 'wb') as f:
+        f.write(synthetic.ftyp() + synthetic.box('moov', struct.pack('>I', 0) + b'udta' + bytes(8)) +
+                synthetic.box('free', bytes(4)))
+    logging.disable(logging.CRITICAL)
+    try:
+        mp4file = Mp4File(filename)
+    finally:
+        logging.disable(logging.NOTSET)
+    assert all(not box.header.to_end_of_file for box in mp4file.children)
+    assert all(box.size != 0 and box.start_of_box + box.size <= 68 for box in mp4file.children)
+
+
+def test_scan_reads_largesize(tmp_path):
+    filename = str(tmp_path / 'largesize.mp4')
+    synthetic.write_progressive_mp4(filename, samples=1000, sample_size=5000000, samples_per_chunk=10)
+    inventory = Mp4File.scan(filename)
+    assert [box['type'] for box in inventory] == ['ftyp', 'moov', 'mdat']
+    mdat = inventory[-1]
+    assert mdat['header']['size'] == 1 and mdat['size'] == mdat['header']['largesize'] > 0xFFFFFFFF
+    assert Mp4File(filename).children[-1].size == mdat['size']
@@ -0,0 +1,72 @@
+"""
+Tests of lazy parsing, in which box_info is decoded on first access, against an eager parse.
+"""
+import json
+import struct
+import threading
+
+import pytest
+
+import synthetic
+from mp4analyser.iso import Mp4File
+from mp4analyser.source import ParseCancelled
+
+PARSE_MODES = [{}, {'lazy': True}, {'use_mmap': True}, {'lazy': True, 'use_mmap': True}]
+IVS = [bytes(range(1, 9)), bytes(range(11, 19))]
+
+
+@pytest.fixture
+def cenc_file(tmp_path):
+    """ a fragment of two samples encrypted with subsamples, whose IV size is found from the saiz """
+    filename = str(tmp_path / 'cenc.mp4')
+    senc = struct.pack('>I', len(IVS)) + b''.join(iv + struct.pack('>HHI', 1, 5, 95) for iv in IVS)
+    traf = synthetic.box('traf', synthetic.full_box('tfhd', struct.pack('>I', 1), flags=0x020000) +
+                         synthetic.full_box('trun', struct.pack('>I', len(IVS))) +
+                         synthetic.full_box('saiz', struct.pack('>BI', 16, len(IVS))) +
+                         synthetic.full_box('senc', senc, flags=2))
+    with open(filename, 'wb') as f:
+        f.write(synthetic.ftyp() + synthetic.box('moof', synthetic.full_box('mfhd', struct.pack('>I', 1)) + traf) +
+                synthetic.box('mdat', bytes(200)))
+    return filename
+
+
+@pytest.mark.parametrize('kwargs', PARSE_MODES)
+def test_senc_sample_list(cenc_file, kwargs):
+    mp4file = Mp4File(cenc_file, **kwargs)
+    senc = mp4file.search_boxes_for_type('senc')[0]
+    assert senc.box_info['sample_list'] == [{'iv': iv.hex(), 'subsample_count': 1,
+                                             'subsample_list': [{'BytesOfClearData': 5, 'BytesOfEncryptedData': 95}]}
+                                            for iv in IVS]
+    mp4file.close()
+
+
+@pytest.mark.parametrize('kwargs', PARSE_MODES[1:])
+def test_box_info_matches_eager_parse(tmp_path, kwargs):
+    filename = str(tmp_path / 'multitrack.mp4')
+    synthetic.write_multitrack_mp4(filename, tracks=2, samples=45)
+
+    def box_tree(box):
+        return [box.type, box.start_of_box, box.size, box.get_box_info(), [box_tree(child) for child in box.children]]
+
+    expected = json.dumps([box_tree(box) for box in Mp4File(filename).children])
+    mp4file = Mp4File(filename, **kwargs)
+    assert json.dumps([box_tree(box) for box in mp4file.children]) == expected
+    mp4file.close()
+
+
+@pytest.mark.parametrize('kwargs', PARSE_MODES[1:2] + PARSE_MODES[3:])
+def test_cancel_event_stops_decoding(tmp_path, kwargs):
+    filename = str(tmp_path / 'progressive.mp4')
+    synthetic.write_progressive_mp4(filename, samples=25, samples_per_chunk=10)
+    cancel_event = threading.Event()
+    mp4file = Mp4File(filename, cancel_event=cancel_event, **kwargs)
+    stsz = mp4file.search_boxes_for_type('stsz')[0]
+    cancel_event.set()
+    with pytest.raises(ParseCancelled):
+        stsz.get_sample_totals()
+    with pytest.raises(ParseCancelled):
+        stsz.box_info
+    # left to be decoded, rather than with what was read before the cancel
+    cancel_event.clear()
+    assert stsz.box_info['entry_list'] == [{'entry_size': size} for size in synthetic.random_sizes(25, 1000, 0)]
+    mp4file.close()
@@ -0,0 +1,65 @@
+"""
+Tests of Mp4File.refresh() on a fragmented file that grows, as a live packager writes it, against a fresh parse of
+the whole file.
+"""
+import os
+import random
+
+import pytest
+
+import synthetic
+from mp4analyser.iso import Mp4File
+
+FRAGMENT_INDEX_COLUMNS = ('sequence_number', 'run_ID', 'run_offset', 'decode_time', 'sample_description_index',
+                          'first_sample', 'duration', 'size', 'flags', 'composition_offset')
+
+
+def parse_state(mp4file):
+    """ the top-level boxes and the fragment index of mp4file """
+    boxes = [(box.type, box.start_of_box, box.size) for box in mp4file.children]
+    fragment_index = {track_ID: {column: list(getattr(track, column)) for column in FRAGMENT_INDEX_COLUMNS}
+                      for track_ID, track in mp4file.get_fragment_index().items()}
+    return boxes, fragment_index
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'lazy': True}, {'use_mmap': True}, {'lazy': True, 'use_mmap': True}])
+def test_refresh_matches_fresh_parse(tmp_path, kwargs):
+    source = str(tmp_path / 'fragmented.mp4')
+    synthetic.write_fragmented_mp4(source, fragments=20, samples_per_fragment=5, seed=4)
+    with open(source, 'rb') as f:
+        data = f.read()
+    expected = parse_state(Mp4File(source))
+    rnd = random.Random(0)
+    growing = str(tmp_path / 'growing.mp4')
+    for trial in range(5):
+        # the file is written in pieces that end anywhere, mid-header included
+        cuts = sorted(rnd.sample(range(1, len(data)), 8)) + [len(data)]
+        with open(growing, 'wb') as f:
+            f.write(data[:cuts[0]])
+        mp4file = Mp4File(growing, **kwargs)
+        for cut in cuts[1:]:
+            if rnd.random() < 0.5:
+                # indexed part way through, so refresh() has to extend the index
+                mp4file.get_fragment_index()
+            with open(growing, 'ab') as f:
+                f.write(data[os.path.getsize(growing):cut])
+            mp4file.refresh()
+        assert parse_state(mp4file) == expected
+        mp4file.close()
+
+
+def test_refresh_returns_only_new_boxes(tmp_path):
+    source = str(tmp_path / 'fragmented.mp4')
+    synthetic.write_fragmented_mp4(source, fragments=4, seed=4)
+    with open(source, 'rb') as f:
+        data = f.read()
+    first_moof = Mp4File(source).children[2].start_of_box
+    growing = str(tmp_path / 'growing.mp4')
+    with open(growing, 'wb') as f:
+        f.write(data[:first_moof])
+    mp4file = Mp4File(growing)
+    assert [box.type for box in mp4file.children] == ['ftyp', 'moov']
+    with open(growing, 'ab') as f:
+        f.write(data[first_moof:])
+    assert [box.type for box in mp4file.refresh()] == ['moof', 'mdat'] * 4
+    assert mp4file.refresh() == []
@@ -0,0 +1,39 @@
+"""
+Tests of the registry of box classes of registry.py, against the globals() lookup that box_factory() used to do.
+"""
+import mp4analyser.iso
+import mp4analyser.non_iso
+from mp4analyser.core import Mp4Box
+from mp4analyser.registry import get_box_class, register_box_type
+
+
+def globals_lookup(box_type):
+    """ the lookup box_factory() and box_factory_non_iso() used to do """
+    class_name = box_type.replace(" ", "_").replace("-", "_").lower().capitalize() + 'Box'
+    box_class = vars(mp4analyser.iso).get(class_name)
+    if box_class is None:
+        box_class = vars(mp4analyser.non_iso).get(class_name, mp4analyser.non_iso.UndefinedBox)
+    return box_class
+
+
+def test_registry_matches_globals_lookup():
+    class_names = [name for module in (mp4analyser.iso, mp4analyser.non_iso) for name in vars(module)
+                   if name.endswith('Box') and name[:-3] == name[:-3].lower().capitalize()]
+    box_types = [name[:-3].lower() for name in class_names]
+    # as they are in files: other cases, and ' ' or '-' where class names have '_'
+    box_types += [box_type.upper() for box_type in box_types] + ['ac-3', 'ec-3', 'url ', 'xtra', '\xa9too', '']
+    for box_type in box_types:
+        assert get_box_class(box_type) is globals_lookup(box_type), box_type
+
+
+def test_registered_class_replaces_named_class():
+    class StszBox(Mp4Box):
+        __slots__ = ()
+
+    original = get_box_class('stsz')
+    register_box_type(b'stsz', StszBox)
+    try:
+        assert get_box_class('stsz') is StszBox
+    finally:
+        register_box_type('stsz', original)
+    assert get_box_class('stsz') is original
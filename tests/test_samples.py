@@ -0,0 +1,74 @@
+"""
+Tests of the columnar sample indexes of samples.py against the sample tables, and against the samples the synthetic
+files were written with.
+"""
+import pytest
+
+import synthetic
+from mp4analyser import samples
+from mp4analyser.iso import Mp4File
+
+
+@pytest.fixture
+def multitrack_file(tmp_path):
+    filename = str(tmp_path / 'multitrack.mp4')
+    # 95 samples in chunks of 10 leaves a short last chunk, covered by a second stsc entry
+    synthetic.write_multitrack_mp4(filename, tracks=3, samples=95, samples_per_chunk=10, seed=1)
+    return filename
+
+
+def test_track_index_matches_sample_tables(multitrack_file):
+    mp4file = Mp4File(multitrack_file)
+    sample_index = mp4file.get_sample_index()
+    assert sorted(sample_index) == [1, 2, 3]
+    for track_ID, track in sample_index.items():
+        assert len(track) == 95
+        # the sizes of track n are seeded with seed + n - 1
+        assert list(track.size) == synthetic.random_sizes(95, 1000, track_ID)
+        for i in range(len(track)):
+            sample = mp4file.get_sample(track_ID, i + 1)
+            assert (track.offset[i], track.size[i]) == (sample['offset'], sample['size'])
+
+
+def test_numpy_index_matches_pure_python(multitrack_file, monkeypatch):
+    if samples._import_numpy() is None:
+        pytest.skip('NumPy is not installed')
+    pure_python = Mp4File(multitrack_file).get_sample_index()
+    monkeypatch.setattr(samples, 'NUMPY_MIN_SAMPLES', 0)
+    with_numpy = Mp4File(multitrack_file).get_sample_index()
+    for track_ID, track in pure_python.items():
+        for column in ('offset', 'size', 'chunk', 'chunk_offset', 'samples_per_chunk', 'first_sample'):
+            assert list(getattr(with_numpy[track_ID], column)) == list(getattr(track, column))
+
+
+def test_chunks_are_assigned_to_their_mdat_in_offset_order(multitrack_file):
+    mp4file = Mp4File(multitrack_file)
+    mdat = [box for box in mp4file.children if box.type == 'mdat'][0]
+    chunks = list(mdat.sample_list)
+    # 10 chunks per track, interleaved track by track
+    assert len(chunks) == 30
+    offsets = [chunk['chunk_offset'] for chunk in chunks]
+    assert offsets == sorted(offsets)
+    assert [chunk['track_ID'] for chunk in chunks[:6]] == [1, 2, 3, 1, 2, 3]
+    for index, chunk in enumerate(chunks):
+        offset, num_bytes = mdat.sample_list.get_byte_range(index)
+        assert mdat.start_of_box + mdat.header.header_size <= offset
+        assert offset + num_bytes <= mdat.start_of_box + mdat.size
+
+
+def test_fragment_index_matches_written_samples(tmp_path):
+    filename = str(tmp_path / 'fragmented.mp4')
+    synthetic.write_fragmented_mp4(filename, fragments=12, samples_per_fragment=10, seed=3)
+    mp4file = Mp4File(filename)
+    track = mp4file.get_fragment_index()[1]
+    assert list(track.size) == synthetic.random_sizes(120, 100, 3)
+    assert list(track.sequence_number) == list(range(1, 13))
+    assert list(track.decode_time) == [run * 10 * synthetic.SAMPLE_DURATION for run in range(12)]
+    assert list(track.duration) == [synthetic.SAMPLE_DURATION] * 120
+    mdats = [box for box in mp4file.children if box.type == 'mdat']
+    for run_index, mdat in enumerate(mdats):
+        # each run's samples fill the mdat that follows its moof
+        assert track.run_offset[run_index] == mdat.start_of_box + mdat.header.header_size
+        run = track.get_run(run_index)
+        last = run['run_samples'][-1]
+        assert last['offset'] + last['size'] == mdat.start_of_box + mdat.size
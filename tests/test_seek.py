@@ -0,0 +1,51 @@
+"""
+Tests of Mp4File.get_sample() and find_sample_at_time() against a scan of every sample, on tracks whose ctts presents
+samples out of decode order.
+"""
+import pytest
+
+import synthetic
+from mp4analyser.iso import Mp4File
+
+SAMPLES = 300
+# decode order I P B B, presented as I B B P
+GOP_OFFSETS = [(1, 1000), (1, 3000), (2, 0)]
+COMPOSITION_OFFSETS = {'first sample presented late': [(1, 2000), (1, 0), (SAMPLES - 2, 1000)],
+                       'I P B B': GOP_OFFSETS * (SAMPLES // 4),
+                       'ctts shorter than stts': GOP_OFFSETS * (SAMPLES // 8),
+                       'in order': None}
+
+
+@pytest.fixture(params=list(COMPOSITION_OFFSETS))
+def reordered_file(request, tmp_path):
+    filename = str(tmp_path / 'reordered.mp4')
+    synthetic.write_progressive_mp4(filename, samples=SAMPLES, samples_per_chunk=7,
+                                    composition_offsets=COMPOSITION_OFFSETS[request.param])
+    return Mp4File(filename)
+
+
+def expected_samples(samples, media_time):
+    """ the numbers of the sample presented at media_time, and of its sync sample, by a scan of all the samples """
+    presented = [sample for sample in samples if sample['composition_time'] <= media_time]
+    if not presented:
+        return None, None
+    sample = max(presented, key=lambda sample: (sample['composition_time'], sample['sample_number']))
+    sync_samples = [s for s in presented if s['is_sync'] and s['sample_number'] <= sample['sample_number']]
+    return sample['sample_number'], sync_samples[-1]['sample_number'] if sync_samples else None
+
+
+def test_find_sample_at_time_matches_scan(reordered_file):
+    samples = [reordered_file.get_sample(1, sample_number) for sample_number in range(1, SAMPLES + 1)]
+    assert [sample['decode_time'] for sample in samples] == [i * synthetic.SAMPLE_DURATION for i in range(SAMPLES)]
+    # every sample boundary, a time between each, and times before and after the track
+    for media_time in range(-500, (SAMPLES + 5) * synthetic.SAMPLE_DURATION, 500):
+        found = reordered_file.find_sample_at_time(1, media_time / synthetic.TIMESCALE)
+        found = tuple(found[key]['sample_number'] if found[key] else None for key in ('sample', 'sync_sample'))
+        assert found == expected_samples(samples, media_time), media_time
+
+
+def test_get_sample_is_out_of_range_outside_the_track(reordered_file):
+    with pytest.raises(IndexError):
+        reordered_file.get_sample(1, 0)
+    with pytest.raises(IndexError):
+        reordered_file.get_sample(1, SAMPLES + 1)
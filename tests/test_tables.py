@@ -0,0 +1,78 @@
+"""
+Tests of the entry lists of tables.py, as they are in the box_info of sample table boxes.
+"""
+import array
+import json
+import pickle
+import struct
+
+import pytest
+
+import synthetic
+from mp4analyser.iso import Mp4File
+from mp4analyser.tables import EntryList, U32
+
+
+def test_entry_list_is_a_list_of_dicts():
+    entries = EntryList(sample_count=array.array(U32, [3, 1]), sample_delta=array.array(U32, [1000, 500]))
+    expected = [{'sample_count': 3, 'sample_delta': 1000}, {'sample_count': 1, 'sample_delta': 500}]
+    assert len(entries) == 2
+    assert entries[1] == expected[1] and entries[-1] == expected[-1]
+    assert entries[:1] == expected[:1]
+    assert entries == expected and expected == entries
+    assert entries != expected[:1]
+    assert entries.to_list() == expected and type(entries.to_list()) is list
+    assert list(entries.column('sample_delta')) == [1000, 500]
+    assert isinstance(entries, list)
+    assert json.dumps(entries) == json.dumps(expected)
+    assert json.dumps(entries, indent=2) == json.dumps(expected, indent=2)
+    assert list(reversed(entries)) == expected[::-1]
+    assert expected[1] in entries and entries.index(expected[1]) == 1
+    assert [{}] + entries == [{}] + expected
+    with pytest.raises(TypeError):
+        entries.append({})
+
+
+def test_entry_list_pickles_its_arrays():
+    entries = EntryList(entry_size=array.array(U32, range(1000)))
+    unpickled = pickle.loads(pickle.dumps(entries))
+    assert type(unpickled) is EntryList and unpickled == entries
+    assert list(unpickled.column('entry_size')) == list(range(1000))
+    # as the arrays, not a dict per entry
+    assert len(pickle.dumps(entries)) < 8000
+
+
+def test_box_info_of_sample_tables(tmp_path):
+    filename = str(tmp_path / 'progressive.mp4')
+    synthetic.write_progressive_mp4(filename, samples=25, samples_per_chunk=10)
+    mp4file = Mp4File(filename)
+    stsz = mp4file.search_boxes_for_type('stsz')[0]
+    assert stsz.box_info['entry_list'] == [{'entry_size': size} for size in synthetic.random_sizes(25, 1000, 0)]
+    stsc = mp4file.search_boxes_for_type('stsc')[0]
+    assert json.loads(json.dumps(stsc.box_info))['entry_list'] == [
+        {'first_chunk': 1, 'samples_per_chunk': 10, 'samples_description_index': 1},
+        {'first_chunk': 3, 'samples_per_chunk': 5, 'samples_description_index': 1}]
+
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_sdtp_splits_each_byte_into_fields(tmp_path, lazy):
+    filename = str(tmp_path / 'tracks.mp4')
+    synthetic.write_multitrack_mp4(filename, tracks=2, samples=60)
+    sdtp = Mp4File(filename, lazy=lazy).search_boxes_for_type('sdtp')[0]
+    assert type(sdtp.box_info['sample_list']) is EntryList
+    # synthetic.py writes 0x10, depends on no other sample, for each sync sample and 0x20 for the rest
+    assert sdtp.box_info['sample_list'] == [
+        {'is_leading': 0, 'sample_depends_on': 2 if i % 30 else 1, 'sample_is_depended_on': 0,
+         'sample_has_redundancy': 0} for i in range(60)]
+
+def test_trun_samples_without_fields_are_distinct(tmp_path):
+    filename = str(tmp_path / 'trun.mp4')
+    # a trun of 3 samples that all take the defaults of the tfhd
+    traf = synthetic.box('traf', synthetic.full_box('tfhd', struct.pack('>I', 1), flags=0x020000) +
+                         synthetic.full_box('trun', struct.pack('>I', 3)))
+    with open(filename, 'wb') as f:
+        f.write(synthetic.ftyp() + synthetic.box('moof', synthetic.full_box('mfhd', struct.pack('>I', 1)) + traf))
+    samples = Mp4File(filename).search_boxes_for_type('trun')[0].box_info['samples']
+    samples[0]['sample_size'] = 100
+    assert samples == [{'sample_size': 100}, {}, {}]